@@ -1,8 +1,17 @@
 # api_gateway/src/__init__.py
 
-from flask import Flask
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, jsonify
 from flask_cors import CORS
 from .config import Config
+from .auth.jwt_verifier import LocalTokenVerifier
+from .auth.token_cache import TokenValidationCache
+from .upstream.pool import UpstreamRegistry
+from .upstream.response_cache import ResponseCache
+from .upstream.coalescing import SingleFlight
+from .upstream.bulkhead import BulkheadRegistry
+from .upstream.compression import ResponseCompressor
+from .upstream.hedging import Hedger
 
 # [LESSON 10] Thêm thư viện Monitoring & Security
 from flask import request
@@ -10,6 +19,8 @@ from flask import request
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from prometheus_flask_exporter import PrometheusMetrics
+import library_common.rate_limit_storage  # noqa: F401  (đăng ký scheme mmap:// cho limits)
+from . import timing
 
 def create_app():
     app = Flask(__name__)
@@ -17,14 +28,14 @@ def create_app():
 
     # Lấy Origin của Frontend từ Config
     frontend_origin = app.config.get('FRONTEND_ORIGIN')
-    swagger_ui_origin = "https://app.swaggerhub.com" # Đã sửa lỗi chính tả
+    swagger_ui_origin = app.config.get('SWAGGER_UI_ORIGIN')
     
     # --- Cấu hình CORS ---
     CORS(
         app,
         resources={r"/api/*": {"origins": [frontend_origin, swagger_ui_origin]}},
         supports_credentials=True, 
-        allow_headers=['Content-Type', 'Authorization', 'If-None-Match', 'X-User-ID', 'X-User-Role'], 
+        allow_headers=app.config['CORS_ALLOW_HEADERS'], 
     )
 
     # ====================================================================
@@ -32,34 +43,89 @@ def create_app():
     # ====================================================================
     def should_exempt():
         return request.path == "/metrics"
+
+    # 0. Đo thời gian từng pha (phải đăng ký trước Limiter để đo được pha limiter)
+    timing.init_app(app)
     
     # 1. Rate Limiter (Gateway chặn tổng thể: 1000 req/giờ mỗi IP)
+    #    Bộ đếm dùng chung giữa các worker gunicorn (mmap://), không reset khi restart worker
     limiter = Limiter(
         key_func=get_remote_address,
         app=app,
-        default_limits=["2000 per day", "500 per hour"],
-        storage_uri="memory://",
+        default_limits=app.config['GATEWAY_RATE_LIMITS'],
+        storage_uri=app.config['RATELIMIT_STORAGE_URI'],
+        strategy=app.config['RATELIMIT_STRATEGY'],
     )
     limiter.request_filter(should_exempt)
+    timing.after_limiter(app)
     
     # 2. Prometheus Metrics (Đo traffic tổng của cả hệ thống)
     # Gateway là nơi tốt nhất để đo xem hệ thống có bao nhiêu request
     metrics = PrometheusMetrics(app)
     metrics.info('gateway_info', 'API Gateway', version='1.0.0')
 
+    # 3. Key material để xác thực token ngay tại Gateway (nạp 1 lần lúc khởi động)
+    app.extensions['token_verifier'] = LocalTokenVerifier.from_config(app.config)
+    # Cache kết quả của những token vẫn phải hỏi Auth Service
+    app.extensions['token_cache'] = TokenValidationCache.from_config(app.config)
+
+    # 4. Connection pool keep-alive riêng cho từng upstream (auth/book/transaction)
+    app.extensions['upstreams'] = UpstreamRegistry.from_config(app.config)
+
+    # 5. HTTP response cache cho các GET 'public, max-age' (book_service)
+    if app.config.get('RESPONSE_CACHE_ENABLED', True):
+        app.extensions['response_cache'] = ResponseCache.from_config(app.config)
+
+    # 6. Single-flight cho các GET "nóng" (vd: /api/books?page=1)
+    if app.config.get('COALESCE_ENABLED', True):
+        app.extensions['single_flight'] = SingleFlight.from_config(app.config)
+
+    # 7. Bulkhead theo nhóm route: upstream chậm không chiếm hết worker của route khác
+    if app.config.get('BULKHEAD_ENABLED', True):
+        app.extensions['bulkheads'] = BulkheadRegistry.from_config(app.config)
+
+    # 8. Hedged request cho các GET sách (cắt tail latency)
+    if app.config.get('HEDGING_ENABLED', True):
+        app.extensions['hedger'] = Hedger.from_config(app.config)
+
+    # 9. Thread pool chạy song song các sub-request của POST /api/batch
+    app.extensions['batch_executor'] = ThreadPoolExecutor(
+        max_workers=app.config.get('BATCH_MAX_WORKERS', 16), thread_name_prefix="gateway-batch",
+    )
+    # Thread pool riêng cho GET /api/me/dashboard (tránh tranh slot với batch khi dashboard nằm trong batch)
+    app.extensions['dashboard_executor'] = ThreadPoolExecutor(
+        max_workers=app.config.get('DASHBOARD_MAX_WORKERS', 32), thread_name_prefix="gateway-dashboard",
+    )
+
+    # 10. Nén response (gzip/br) theo Accept-Encoding của client
+    if app.config.get('COMPRESSION_ENABLED', True):
+        compressor = app.extensions['compressor'] = ResponseCompressor.from_config(app.config)
+        app.after_request(compressor.after_request)
+
     # ====================================================================
 
     # Đăng ký các blueprint
     from .routes.auth_routes import auth_bp
     from .routes.book_routes import book_bp
     from .routes.transaction_routes import transaction_bp
+    from .routes.admin_routes import admin_bp
+    from .routes.batch_routes import batch_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(book_bp, url_prefix='/api')
     app.register_blueprint(transaction_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api')
+    app.register_blueprint(batch_bp, url_prefix='/api')
 
     @app.route('/health')
     def health_check():
-        return "API Gateway OK"
+        # Kèm trạng thái circuit breaker của từng upstream và tải của các bulkhead
+        bulkheads = app.extensions.get('bulkheads')
+        return jsonify({
+            "status": "API Gateway OK",
+            "circuit_breakers": app.extensions['upstreams'].breaker_states(),
+            "replicas": app.extensions['upstreams'].replica_states(),
+            "bulkheads": bulkheads.states() if bulkheads is not None else {},
+        })
 
     return app
\ No newline at end of file
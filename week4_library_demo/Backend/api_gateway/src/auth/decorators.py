@@ -1,30 +1,62 @@
 from functools import wraps
 from flask import request, jsonify, current_app, g
 import requests
+from urllib3.exceptions import EmptyPoolError
+from ..metrics import TOKEN_VALIDATIONS
+from ..timing import phase
 
-def _validate_token(token_header):
-    """Hàm nội bộ gọi đến Auth Service để xác thực token."""
-    if not token_header or not token_header.startswith('Bearer '):
-        return None, "Missing or invalid Authorization header"
-
-    auth_service_url = current_app.config['AUTH_SERVICE_URL']
-    validate_url = f"{auth_service_url}/auth/validate"
-    
+def _validate_token_remote(token_header):
+    """
+    Gọi đến Auth Service để xác thực token (fallback khi Gateway không tự quyết được).
+    Trả về (user_data, error, definitive) - definitive=False khi lỗi tạm thời.
+    """
     try:
-        response = requests.post(
-            validate_url,
+        response = current_app.extensions['upstreams'].get('auth').request(
+            'POST',
+            'auth/validate',
             headers={'Authorization': token_header},
         )
         
         if response.status_code == 200:
             user_data = response.json().get('user')
-            return user_data, None # {"user_id": "...", "role": "admin"}
+            return user_data, None, True # {"user_id": "...", "role": "admin"}
         else:
-            return None, response.json().get('error', 'Invalid token')
+            # Chỉ 401 mới là kết luận chắc chắn (có thể cache âm)
+            return None, response.json().get('error', 'Invalid token'), response.status_code == 401
+
+    except (requests.exceptions.RequestException, EmptyPoolError) as e:
+        # EmptyPoolError: pool tới Auth Service đã hết connection rảnh (requests không bọc lỗi này)
+        current_app.logger.warning(f"Error validating token: {e}")
+        return None, "Authentication service is unavailable", False
+
+def _validate_token(token_header):
+    """
+    Xác thực token: ưu tiên verify chữ ký/exp/role ngay tại Gateway,
+    chỉ gọi Auth Service với những token không tự quyết được.
+    """
+    if not token_header or not token_header.startswith('Bearer '):
+        return None, "Missing or invalid Authorization header"
+    token = token_header.split(" ", 1)[1]
+
+    verifier = current_app.extensions.get('token_verifier')
+    if verifier is not None and verifier.enabled:
+        decided, user_data, error = verifier.verify(token)
+        if decided:
+            TOKEN_VALIDATIONS.labels(decision='local', result='invalid' if error else 'valid').inc()
+            return user_data, error
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error validating token: {e}")
-        return None, "Authentication service is unavailable"
+    cache = current_app.extensions.get('token_cache')
+    if cache is not None:
+        hit, user_data, error = cache.get(token)
+        if hit:
+            TOKEN_VALIDATIONS.labels(decision='cache', result='invalid' if error else 'valid').inc()
+            return user_data, error
+
+    user_data, error, definitive = _validate_token_remote(token_header)
+    TOKEN_VALIDATIONS.labels(decision='remote', result='invalid' if error else 'valid').inc()
+    if cache is not None and definitive:
+        cache.put(token, user_data, error)
+    return user_data, error
 
 def token_required(f):
     """
@@ -33,7 +65,12 @@ def token_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         token_header = request.headers.get('Authorization')
-        user_data, error = _validate_token(token_header)
+        if 'batch_token' in g and g.batch_token == token_header:
+            # Sub-request của POST /api/batch: token đã được xác thực 1 lần cho cả batch
+            user_data, error = g.batch_user, None
+        else:
+            with phase('validate_token'):
+                user_data, error = _validate_token(token_header)
         
         if error:
             return jsonify({"error": error}), 401
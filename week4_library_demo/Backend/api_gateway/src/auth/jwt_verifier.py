@@ -0,0 +1,193 @@
+import logging
+import re
+import threading
+import time
+
+import jwt
+import requests
+from jwt.algorithms import get_default_algorithms
+
+logger = logging.getLogger("GatewayJwks")
+
+# Thông điệp lỗi giữ giống hệt Auth Service để client không thấy khác biệt
+EXPIRED_TOKEN_MESSAGE = "Token đã hết hạn"
+INVALID_TOKEN_MESSAGE = "Token không hợp lệ"
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'RS384', 'RS512', 'ES256', 'ES384', 'PS256', 'EdDSA')
+
+
+class JwksKeySource:
+    """
+    Public key của Auth Service lấy từ JWKS (/auth/.well-known/jwks.json), cache theo
+    Cache-Control max-age và revalidate bằng ETag (thường chỉ nhận 304).
+
+    - Tải lười ở lần đầu gặp token bất đối xứng (Auth Service có thể chưa chạy lúc Gateway khởi động).
+    - Gặp kid lạ (Auth Service vừa xoay key) -> tải lại ngay, nhưng tối đa 1 lần / min_refresh_interval.
+    - Lỗi mạng: giữ nguyên bộ key cũ.
+    """
+
+    def __init__(self, url, timeout=2, min_refresh_interval=30, default_max_age=300):
+        self.url = url
+        self.timeout = timeout
+        self.min_refresh_interval = min_refresh_interval
+        self.default_max_age = default_max_age
+        self._keys = {}
+        self._etag = None
+        self._fetched_at = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _max_age(self, cache_control):
+        match = re.search(r'max-age=(\d+)', cache_control or '')
+        return int(match.group(1)) if match else self.default_max_age
+
+    def _parse(self, jwks):
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            try:
+                key = jwt.PyJWK(jwk)
+            except (jwt.PyJWKError, jwt.InvalidKeyError):
+                continue
+            if jwk.get('kid') and key.algorithm_name in ASYMMETRIC_ALGORITHMS:
+                keys[jwk['kid']] = (key.algorithm_name, key.key)
+        return keys
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if self._fetched_at is not None and (
+            now < self._expires_at if not force else now - self._fetched_at < self.min_refresh_interval
+        ):
+            return
+        # Chỉ 1 thread tải; thread khác dùng tạm bộ key hiện có
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            headers = {'If-None-Match': self._etag} if self._etag else {}
+            resp = requests.get(self.url, headers=headers, timeout=self.timeout)
+            if resp.status_code == 200:
+                self._keys = self._parse(resp.json())
+                self._etag = resp.headers.get('ETag')
+            elif resp.status_code != 304:
+                logger.warning(f"JWKS fetch from {self.url} returned {resp.status_code}")
+            self._expires_at = now + self._max_age(resp.headers.get('Cache-Control'))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"JWKS fetch from {self.url} failed: {e}")
+            self._expires_at = now + self.min_refresh_interval
+        finally:
+            self._fetched_at = now
+            self._lock.release()
+
+    def get(self, kid):
+        self.refresh()
+        if kid not in self._keys:
+            self.refresh(force=True)
+        return self._keys.get(kid)
+
+
+class LocalTokenVerifier:
+    """
+    Xác thực access token ngay tại Gateway (không cần gọi /auth/validate).
+
+    Key material được nạp 1 lần lúc khởi động:
+    - HS256: dùng chung JWT_SECRET_KEY với Auth Service.
+    - Bất đối xứng (RS256/EdDSA...): public key PEM, có thể gắn với 'kid',
+      và/hoặc JWKS của Auth Service (theo 'kid', tự cập nhật khi xoay key).
+
+    verify() trả về tuple (decided, user_data, error):
+    - decided=False nghĩa là Gateway không đủ thông tin để kết luận
+      (không có key cho alg/kid, role lạ...) -> caller phải gọi Auth Service.
+    """
+
+    def __init__(self, hs_secret=None, public_keys=None, allowed_roles=None, leeway=0, jwks=None):
+        self.hs_secret = hs_secret
+        # {kid (hoặc None): (algorithm, prepared_key)}
+        self.public_keys = public_keys or {}
+        self.jwks = jwks
+        self.allowed_roles = {r.lower() for r in (allowed_roles or [])}
+        self.leeway = leeway
+
+    @classmethod
+    def from_config(cls, config):
+        public_keys = {}
+        key_path = config.get('JWT_PUBLIC_KEY_PATH')
+        if key_path:
+            algorithm = config.get('JWT_PUBLIC_KEY_ALGORITHM', 'RS256')
+            with open(key_path, 'rb') as f:
+                pem = f.read()
+            public_keys[config.get('JWT_PUBLIC_KEY_KID')] = (algorithm, cls.prepare_key(algorithm, pem))
+
+        jwks = None
+        jwks_url = config.get('JWT_JWKS_URL')
+        if jwks_url is None and config.get('AUTH_SERVICE_URL'):
+            # Mặc định: JWKS của replica Auth Service đầu tiên
+            auth_url = config['AUTH_SERVICE_URL'].split(',')[0].strip().rstrip('/')
+            jwks_url = f"{auth_url}/auth/.well-known/jwks.json"
+        if jwks_url and config.get('JWT_JWKS_ENABLED', True):
+            jwks = JwksKeySource(
+                jwks_url,
+                timeout=config.get('JWT_JWKS_TIMEOUT', 2),
+                min_refresh_interval=config.get('JWT_JWKS_MIN_REFRESH_SECONDS', 30),
+            )
+
+        return cls(
+            hs_secret=config.get('JWT_SECRET_KEY'),
+            public_keys=public_keys,
+            allowed_roles=config.get('JWT_ALLOWED_ROLES'),
+            leeway=config.get('JWT_LEEWAY_SECONDS', 0),
+            jwks=jwks,
+        )
+
+    @staticmethod
+    def prepare_key(algorithm, key_data):
+        """Parse key 1 lần, tránh việc PyJWT phải load lại PEM ở mỗi request."""
+        return get_default_algorithms()[algorithm].prepare_key(key_data)
+
+    @property
+    def enabled(self):
+        return bool(self.hs_secret or self.public_keys or self.jwks)
+
+    def _resolve_key(self, algorithm, kid):
+        if algorithm == 'HS256':
+            return self.hs_secret or None
+
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            return None
+
+        entry = self.public_keys.get(kid)
+        if entry is None and self.jwks is not None and kid:
+            entry = self.jwks.get(kid)
+        if entry is None or entry[0] != algorithm:
+            return None
+        return entry[1]
+
+    def verify(self, token):
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError:
+            return True, None, INVALID_TOKEN_MESSAGE
+
+        key = self._resolve_key(header.get('alg'), header.get('kid'))
+        if key is None:
+            return False, None, None
+
+        try:
+            payload = jwt.decode(
+                token,
+                key,
+                algorithms=[header['alg']],
+                options={'require': ['exp', 'sub']},
+                leeway=self.leeway,
+            )
+        except jwt.ExpiredSignatureError:
+            return True, None, EXPIRED_TOKEN_MESSAGE
+        except jwt.InvalidTokenError:
+            return True, None, INVALID_TOKEN_MESSAGE
+
+        role = payload.get('role')
+        if not role or not isinstance(role, str):
+            return True, None, INVALID_TOKEN_MESSAGE
+        if self.allowed_roles and role.lower() not in self.allowed_roles:
+            # Role chưa biết -> để Auth Service quyết định
+            return False, None, None
+
+        return True, {'user_id': payload['sub'], 'role': role}, None
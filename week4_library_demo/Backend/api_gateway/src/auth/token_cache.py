@@ -0,0 +1,87 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+from ..metrics import TOKEN_CACHE_EVENTS, TOKEN_CACHE_SIZE
+
+
+class TokenValidationCache:
+    """
+    LRU cache kết quả xác thực token (thread-safe, giới hạn số entry).
+
+    - Key là SHA-256 của token -> không giữ token gốc trong RAM.
+    - Entry hợp lệ sống tối đa `ttl` giây và KHÔNG BAO GIỜ quá 'exp' của token.
+    - Token bị từ chối được cache ngắn (`negative_ttl`) để chặn replay token xấu.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60, negative_ttl=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, user_data, error)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_entries=config.get('TOKEN_CACHE_MAX_ENTRIES', 10000),
+            ttl=config.get('TOKEN_CACHE_TTL_SECONDS', 60),
+            negative_ttl=config.get('TOKEN_CACHE_NEGATIVE_TTL_SECONDS', 5),
+        )
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _token_exp(token):
+        """Đọc 'exp' (không verify chữ ký) - chỉ dùng để chặn trên TTL."""
+        try:
+            exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+        except jwt.InvalidTokenError:
+            return None
+        return exp if isinstance(exp, (int, float)) else None
+
+    def get(self, token):
+        """Trả về (hit, user_data, error)."""
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                TOKEN_CACHE_EVENTS.labels(event='miss').inc()
+                return False, None, None
+            expires_at, user_data, error = entry
+            if expires_at <= now:
+                del self._entries[key]
+                TOKEN_CACHE_SIZE.set(len(self._entries))
+                TOKEN_CACHE_EVENTS.labels(event='expired').inc()
+                return False, None, None
+            self._entries.move_to_end(key)
+
+        TOKEN_CACHE_EVENTS.labels(event='negative_hit' if error else 'hit').inc()
+        return True, user_data, error
+
+    def put(self, token, user_data, error):
+        now = time.time()
+        if error:
+            expires_at = now + self.negative_ttl
+        else:
+            exp = self._token_exp(token)
+            if exp is None:
+                return  # Không biết khi nào token hết hạn -> không cache
+            expires_at = min(now + self.ttl, exp)
+        if expires_at <= now:
+            return
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, user_data, error)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                TOKEN_CACHE_EVENTS.labels(event='eviction').inc()
+            TOKEN_CACHE_SIZE.set(len(self._entries))
@@ -3,8 +3,141 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _csv_env(name, default=""):
+    """Đọc biến môi trường dạng 'a,b,c' thành list (bỏ phần tử rỗng)."""
+    return [item.strip() for item in os.environ.get(name, default).split(",") if item.strip()]
+
+def _int_env(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+def _float_env(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
 class Config:
     AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL")
     BOOK_SERVICE_URL = os.environ.get("BOOK_SERVICE_URL")
     TRANSACTION_SERVICE_URL = os.environ.get("TRANSACTION_SERVICE_URL")
-    FRONTEND_ORIGIN = os.environ.get("FRONTEND_ORIGIN")
\ No newline at end of file
+    FRONTEND_ORIGIN = os.environ.get("FRONTEND_ORIGIN")
+    SWAGGER_UI_ORIGIN = "https://app.swaggerhub.com"
+    CORS_ALLOW_HEADERS = ['Content-Type', 'Authorization', 'If-None-Match', 'X-User-ID', 'X-User-Role']
+
+    # [LESSON 10] Rate limit tổng thể theo IP
+    GATEWAY_RATE_LIMITS = _csv_env("GATEWAY_RATE_LIMITS", "2000 per day,500 per hour")
+    # Storage dùng chung giữa các worker trên cùng máy ("memory://" = riêng từng worker)
+    RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI", "mmap:///tmp/api_gateway_ratelimit.mmap")
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "sliding-window-counter")
+
+    # --- Xác thực token ngay tại Gateway (không gọi /auth/validate mỗi request) ---
+    # HS256: phải trùng với JWT_SECRET_KEY của Auth Service; chỉ đặt qua biến môi trường deploy (không commit vào .env)
+    JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY") or None
+    # Bất đối xứng: đường dẫn file PEM chứa public key của Auth Service
+    JWT_PUBLIC_KEY_PATH = os.environ.get("JWT_PUBLIC_KEY_PATH")
+    JWT_PUBLIC_KEY_ALGORITHM = os.environ.get("JWT_PUBLIC_KEY_ALGORITHM", "RS256")
+    JWT_PUBLIC_KEY_KID = os.environ.get("JWT_PUBLIC_KEY_KID")
+    # JWKS của Auth Service (key theo 'kid', tự cập nhật khi xoay key).
+    # Mặc định: <AUTH_SERVICE_URL>/auth/.well-known/jwks.json
+    JWT_JWKS_ENABLED = os.environ.get("JWT_JWKS_ENABLED", "true").lower() == "true"
+    JWT_JWKS_URL = os.environ.get("JWT_JWKS_URL")
+    JWT_JWKS_TIMEOUT = float(os.environ.get("JWT_JWKS_TIMEOUT", 2))
+    JWT_JWKS_MIN_REFRESH_SECONDS = int(os.environ.get("JWT_JWKS_MIN_REFRESH_SECONDS", 30))   # tải lại khi gặp kid lạ
+    # Role lạ (ngoài danh sách) sẽ được chuyển cho Auth Service quyết định
+    JWT_ALLOWED_ROLES = _csv_env("JWT_ALLOWED_ROLES", "user,admin")
+    JWT_LEEWAY_SECONDS = int(os.environ.get("JWT_LEEWAY_SECONDS", 0))
+
+    # --- Cache kết quả xác thực token từ Auth Service (LRU, có TTL) ---
+    TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", 10000))
+    TOKEN_CACHE_TTL_SECONDS = int(os.environ.get("TOKEN_CACHE_TTL_SECONDS", 60))
+    TOKEN_CACHE_NEGATIVE_TTL_SECONDS = int(os.environ.get("TOKEN_CACHE_NEGATIVE_TTL_SECONDS", 5))
+
+    # --- Connection pool keep-alive tới các upstream ---
+    # Có thể ghi đè riêng từng service: AUTH_SERVICE_POOL_SIZE, BOOK_SERVICE_TIMEOUT, ...
+    UPSTREAM_POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", 20))
+    UPSTREAM_POOL_TIMEOUT = float(os.environ.get("UPSTREAM_POOL_TIMEOUT", 5))   # chờ connection rảnh
+    UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 3))
+    UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", 10))
+    UPSTREAM_KEEPALIVE = os.environ.get("UPSTREAM_KEEPALIVE", "true").lower() == "true"
+    UPSTREAM_KEEPALIVE_IDLE = int(os.environ.get("UPSTREAM_KEEPALIVE_IDLE", 60))
+
+    AUTH_SERVICE_POOL_SIZE = _int_env("AUTH_SERVICE_POOL_SIZE")
+    BOOK_SERVICE_POOL_SIZE = _int_env("BOOK_SERVICE_POOL_SIZE")
+    TRANSACTION_SERVICE_POOL_SIZE = _int_env("TRANSACTION_SERVICE_POOL_SIZE")
+    AUTH_SERVICE_TIMEOUT = _float_env("AUTH_SERVICE_TIMEOUT")
+    BOOK_SERVICE_TIMEOUT = _float_env("BOOK_SERVICE_TIMEOUT")
+    TRANSACTION_SERVICE_TIMEOUT = _float_env("TRANSACTION_SERVICE_TIMEOUT")
+
+    # --- Streaming pass-through cho body lớn (request và response) ---
+    PROXY_STREAMING = os.environ.get("PROXY_STREAMING", "true").lower() == "true"
+    PROXY_STREAM_THRESHOLD = int(os.environ.get("PROXY_STREAM_THRESHOLD", 1024 * 1024))  # > 1MB thì stream
+    PROXY_STREAM_CHUNK_SIZE = int(os.environ.get("PROXY_STREAM_CHUNK_SIZE", 64 * 1024))
+
+    # --- HTTP response cache (tôn trọng ETag/Cache-Control của book_service) ---
+    RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRY_BYTES", 1024 * 1024))
+
+    # --- Single-flight: gộp các GET giống hệt nhau đang chạy đồng thời ---
+    COALESCE_ENABLED = os.environ.get("COALESCE_ENABLED", "true").lower() == "true"
+    COALESCE_WAIT_TIMEOUT = float(os.environ.get("COALESCE_WAIT_TIMEOUT", 30))
+
+    # --- Circuit breaker cho từng upstream ---
+    CIRCUIT_BREAKER_ENABLED = os.environ.get("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+    CIRCUIT_WINDOW_SIZE = int(os.environ.get("CIRCUIT_WINDOW_SIZE", 20))        # số lời gọi gần nhất
+    CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", 10))
+    CIRCUIT_ERROR_RATE = float(os.environ.get("CIRCUIT_ERROR_RATE", 0.5))
+    CIRCUIT_SLOW_CALL_SECONDS = float(os.environ.get("CIRCUIT_SLOW_CALL_SECONDS", 3))
+    CIRCUIT_SLOW_CALL_RATE = float(os.environ.get("CIRCUIT_SLOW_CALL_RATE", 0.8))
+    CIRCUIT_OPEN_SECONDS = int(os.environ.get("CIRCUIT_OPEN_SECONDS", 15))
+    CIRCUIT_HALF_OPEN_CALLS = int(os.environ.get("CIRCUIT_HALF_OPEN_CALLS", 3))
+
+    # --- Bulkhead + load shedding theo nhóm route (auth/books/transactions) ---
+    # Ghi đè riêng từng nhóm: BULKHEAD_BOOKS_MAX_CONCURRENT, BULKHEAD_TRANSACTIONS_QUEUE_TARGET, ...
+    BULKHEAD_ENABLED = os.environ.get("BULKHEAD_ENABLED", "true").lower() == "true"
+    BULKHEAD_MAX_CONCURRENT = int(os.environ.get("BULKHEAD_MAX_CONCURRENT", 20))
+    BULKHEAD_MAX_QUEUE = int(os.environ.get("BULKHEAD_MAX_QUEUE", 20))
+    BULKHEAD_QUEUE_TARGET = float(os.environ.get("BULKHEAD_QUEUE_TARGET", 0.25))  # chờ quá -> shed
+
+    BULKHEAD_AUTH_MAX_CONCURRENT = _int_env("BULKHEAD_AUTH_MAX_CONCURRENT")
+    BULKHEAD_BOOKS_MAX_CONCURRENT = _int_env("BULKHEAD_BOOKS_MAX_CONCURRENT")
+    BULKHEAD_TRANSACTIONS_MAX_CONCURRENT = _int_env("BULKHEAD_TRANSACTIONS_MAX_CONCURRENT")
+    BULKHEAD_AUTH_MAX_QUEUE = _int_env("BULKHEAD_AUTH_MAX_QUEUE")
+    BULKHEAD_BOOKS_MAX_QUEUE = _int_env("BULKHEAD_BOOKS_MAX_QUEUE")
+    BULKHEAD_TRANSACTIONS_MAX_QUEUE = _int_env("BULKHEAD_TRANSACTIONS_MAX_QUEUE")
+    BULKHEAD_AUTH_QUEUE_TARGET = _float_env("BULKHEAD_AUTH_QUEUE_TARGET")
+    BULKHEAD_BOOKS_QUEUE_TARGET = _float_env("BULKHEAD_BOOKS_QUEUE_TARGET")
+    BULKHEAD_TRANSACTIONS_QUEUE_TARGET = _float_env("BULKHEAD_TRANSACTIONS_QUEUE_TARGET")
+
+    # --- Nén response theo Accept-Encoding (br nếu có cài Brotli, gzip) ---
+    COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+    COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", 1024))    # nhỏ hơn thì không nén
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+
+    # --- Breakdown độ trễ theo pha: trả header Server-Timing cho client (chỉ bật khi debug) ---
+    SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+    # --- Cân bằng tải phía client: *_SERVICE_URL nhận danh sách replica "http://a:5000,http://b:5000" ---
+    UPSTREAM_LB_STRATEGY = os.environ.get("UPSTREAM_LB_STRATEGY", "p2c")     # p2c | least_outstanding
+    UPSTREAM_EJECT_AFTER = int(os.environ.get("UPSTREAM_EJECT_AFTER", 3))    # số lỗi liên tiếp thì loại replica
+    UPSTREAM_EJECT_SECONDS = float(os.environ.get("UPSTREAM_EJECT_SECONDS", 30))
+    UPSTREAM_HEALTH_INTERVAL = float(os.environ.get("UPSTREAM_HEALTH_INTERVAL", 5))  # 0 = tắt probe /health
+    UPSTREAM_HEALTH_TIMEOUT = float(os.environ.get("UPSTREAM_HEALTH_TIMEOUT", 1))
+
+    # --- Hedged request cho GET /api/books, /api/books/<id> ---
+    HEDGING_ENABLED = os.environ.get("HEDGING_ENABLED", "true").lower() == "true"
+    HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 0.95))      # chờ quá p95 thì hedge
+    HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", 0.01))
+    HEDGE_INITIAL_DELAY = float(os.environ.get("HEDGE_INITIAL_DELAY", 0.1))  # khi chưa đủ mẫu
+    HEDGE_BUDGET_RATIO = float(os.environ.get("HEDGE_BUDGET_RATIO", 0.05))  # tối đa ~5% tải phát sinh
+    HEDGE_MAX_WORKERS = int(os.environ.get("HEDGE_MAX_WORKERS", 32))
+
+    # --- POST /api/batch: gộp nhiều sub-request, chạy song song ---
+    BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", 20))
+    BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", 16))
+
+    # --- GET /api/me/dashboard: gọi song song transaction_service + book_service ---
+    DASHBOARD_TIMEOUT = float(os.environ.get("DASHBOARD_TIMEOUT", 2))   # giây, hạn chót cho CẢ response (mọi phần)
+    DASHBOARD_RECENT_TRANSACTIONS = int(os.environ.get("DASHBOARD_RECENT_TRANSACTIONS", 10))
+    DASHBOARD_MAX_BOOKS = int(os.environ.get("DASHBOARD_MAX_BOOKS", 20))
+    DASHBOARD_MAX_WORKERS = int(os.environ.get("DASHBOARD_MAX_WORKERS", 32))
@@ -0,0 +1,178 @@
+# api_gateway/src/metrics.py
+
+"""
+[LESSON 10] Các metric tuỳ chỉnh của Gateway.
+Khai báo ở mức module để PrometheusMetrics (dùng registry mặc định)
+tự động xuất chúng ra endpoint /metrics.
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Tỉ lệ token được quyết định tại Gateway (local) so với gọi sang Auth Service (remote)
+TOKEN_VALIDATIONS = Counter(
+    'gateway_token_validations_total',
+    'Số lần xác thực access token, theo nơi quyết định và kết quả',
+    ['decision', 'result'],
+)
+
+# Cache kết quả xác thực token (fallback remote): hit/negative_hit/miss/expired/eviction
+TOKEN_CACHE_EVENTS = Counter(
+    'gateway_token_cache_events_total',
+    'Sự kiện của cache xác thực token',
+    ['event'],
+)
+TOKEN_CACHE_SIZE = Gauge(
+    'gateway_token_cache_entries',
+    'Số entry hiện có trong cache xác thực token',
+)
+
+# Connection pool tới từng upstream: tỉ lệ reuse = 1 - opened / checkouts
+UPSTREAM_POOL_REQUESTS = Counter(
+    'gateway_upstream_pool_checkouts_total',
+    'Số lần lấy connection từ pool của upstream',
+    ['upstream'],
+)
+UPSTREAM_CONNECTIONS_OPENED = Counter(
+    'gateway_upstream_connections_opened_total',
+    'Số connection TCP mới được mở tới upstream',
+    ['upstream'],
+)
+UPSTREAM_POOL_WAIT = Histogram(
+    'gateway_upstream_pool_wait_seconds',
+    'Thời gian chờ lấy connection rảnh từ pool',
+    ['upstream'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+# HTTP response cache của Gateway (book_service ETag/Cache-Control)
+RESPONSE_CACHE_EVENTS = Counter(
+    'gateway_response_cache_events_total',
+    'Sự kiện của response cache: hit/miss/revalidated/store/eviction/purge',
+    ['event'],
+)
+RESPONSE_CACHE_BYTES = Gauge(
+    'gateway_response_cache_bytes',
+    'Tổng số byte body đang nằm trong response cache',
+)
+
+# Single-flight: số request dùng chung kết quả (follower) so với số lời gọi thật (leader)
+COALESCED_REQUESTS = Counter(
+    'gateway_coalesced_requests_total',
+    'Số GET được gộp: leader gọi upstream, follower dùng lại kết quả',
+    ['role'],
+)
+COALESCE_INFLIGHT = Gauge(
+    'gateway_coalesce_inflight',
+    'Số lời gọi upstream đang được chia sẻ (leader đang chạy)',
+)
+
+# Circuit breaker theo upstream: 0 = closed, 1 = half_open, 2 = open
+CIRCUIT_STATE = Gauge(
+    'gateway_circuit_breaker_state',
+    'Trạng thái circuit breaker (0=closed, 1=half_open, 2=open)',
+    ['upstream'],
+)
+CIRCUIT_TRANSITIONS = Counter(
+    'gateway_circuit_breaker_transitions_total',
+    'Số lần breaker chuyển sang một trạng thái',
+    ['upstream', 'state'],
+)
+CIRCUIT_REJECTED = Counter(
+    'gateway_circuit_breaker_rejected_total',
+    'Số request bị từ chối ngay (503) vì breaker đang mở',
+    ['upstream'],
+)
+
+# Bulkhead theo nhóm route (auth/books/transactions): số đang chạy, hàng đợi, số bị shed
+BULKHEAD_IN_FLIGHT = Gauge(
+    'gateway_bulkhead_in_flight',
+    'Số request đang chạy trong bulkhead',
+    ['route_class'],
+)
+BULKHEAD_QUEUE_DEPTH = Gauge(
+    'gateway_bulkhead_queue_depth',
+    'Số request đang chờ slot của bulkhead',
+    ['route_class'],
+)
+BULKHEAD_QUEUE_WAIT = Histogram(
+    'gateway_bulkhead_queue_wait_seconds',
+    'Thời gian chờ trong hàng đợi bulkhead',
+    ['route_class'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+BULKHEAD_SHED = Counter(
+    'gateway_bulkhead_shed_total',
+    'Số request bị shed (503) vì bulkhead quá tải',
+    ['route_class', 'reason'],
+)
+
+# Nén response tại Gateway (gzip/br) và pass-through body upstream đã nén sẵn
+COMPRESSION_EVENTS = Counter(
+    'gateway_compression_events_total',
+    'Quyết định nén response: compressed/passthrough/too_small/not_accepted',
+    ['event', 'encoding'],
+)
+COMPRESSION_RATIO = Histogram(
+    'gateway_compression_ratio',
+    'Tỉ lệ kích thước sau nén / trước nén',
+    ['encoding'],
+    buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.7, 0.9, 1.0),
+)
+COMPRESSION_CPU_SECONDS = Histogram(
+    'gateway_compression_cpu_seconds',
+    'CPU time (thread) dùng để nén 1 response',
+    ['encoding'],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+COMPRESSION_BYTES = Counter(
+    'gateway_compression_bytes_total',
+    'Tổng số byte trước (original) và sau (compressed) khi nén',
+    ['encoding', 'stage'],
+)
+
+# Thời gian từng pha của request (limiter, validate_token, upstream_connect/ttfb/body) theo route template
+PHASE_DURATION = Histogram(
+    'gateway_phase_duration_seconds',
+    'Thời gian từng pha xử lý request tại Gateway',
+    ['route', 'phase'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+# Cân bằng tải giữa các replica của 1 upstream (BOOK_SERVICE_URL="http://b1,http://b2")
+REPLICA_REQUESTS = Counter(
+    'gateway_replica_requests_total',
+    'Số request gửi tới từng replica, theo kết quả',
+    ['upstream', 'replica', 'outcome'],
+)
+REPLICA_LATENCY = Histogram(
+    'gateway_replica_latency_seconds',
+    'Thời gian tới khi nhận header từ từng replica',
+    ['upstream', 'replica'],
+)
+REPLICA_OUTSTANDING = Gauge(
+    'gateway_replica_outstanding_requests',
+    'Số request đang chờ replica trả lời',
+    ['upstream', 'replica'],
+)
+REPLICA_HEALTHY = Gauge(
+    'gateway_replica_healthy',
+    'Kết quả health probe gần nhất của replica (1 = healthy)',
+    ['upstream', 'replica'],
+)
+REPLICA_EJECTIONS = Counter(
+    'gateway_replica_ejections_total',
+    'Số lần replica bị loại khỏi vòng cân bằng tải',
+    ['upstream', 'replica', 'reason'],
+)
+
+# Hedged request (GET sách): hedge rate = hedged / tổng, win rate = wins{winner="hedge"} / hedged
+HEDGE_REQUESTS = Counter(
+    'gateway_hedge_requests_total',
+    'Request có thể hedge, theo kết quả: not_needed/hedged/budget_exhausted/bulkhead_full',
+    ['route', 'outcome'],
+)
+HEDGE_WINS = Counter(
+    'gateway_hedge_wins_total',
+    'Request nào trả về trước khi đã hedge (primary/hedge)',
+    ['route', 'winner'],
+)
@@ -0,0 +1,34 @@
+from flask import Blueprint, request, jsonify, current_app
+from ..auth.decorators import token_required, admin_required
+
+admin_bp = Blueprint('admin_bp', __name__)
+
+# ==================================
+# Admin Routes của chính Gateway (không proxy)
+# ==================================
+
+@admin_bp.route('/admin/cache', methods=['GET'])
+@token_required
+@admin_required
+def get_cache_stats():
+    """Thống kê response cache. Endpoint: GET /api/admin/cache"""
+    cache = current_app.extensions.get('response_cache')
+    if cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **cache.stats()}), 200
+
+@admin_bp.route('/admin/cache', methods=['DELETE'])
+@token_required
+@admin_required
+def purge_cache():
+    """
+    Xoá response cache. Endpoint: DELETE /api/admin/cache
+    ?path=books -> chỉ xoá các entry của book_service có path bắt đầu bằng 'books'.
+    """
+    cache = current_app.extensions.get('response_cache')
+    if cache is None:
+        return jsonify({"purged": 0}), 200
+
+    path = request.args.get('path')
+    prefix = f"book/{path.lstrip('/')}" if path else None
+    return jsonify({"purged": cache.purge(prefix=prefix)}), 200
@@ -1,51 +1,217 @@
+from contextlib import nullcontext
+from functools import partial
 from flask import Blueprint, request, jsonify, current_app, Response, g
+from werkzeug.wsgi import ClosingIterator
 from ..auth.decorators import admin_required, token_required
 import requests
+from urllib3.exceptions import EmptyPoolError
+from ..upstream.bulkhead import BulkheadFullError
+from ..upstream.circuit_breaker import CircuitOpenError
+from ..upstream.coalescing import BufferedUpstreamResponse
+from ..upstream.compression import accepts_encoding, strip_etag_encoding
+from ..upstream.response_cache import CachedResponse
+from ..upstream.streaming import RequestBodyStream, chunked_request_body, iter_upstream_body
+from ..timing import body_timer, phase, route_template
 
 auth_bp = Blueprint('auth_bp', __name__)
 
-def _proxy_request(service_url, path, new_data=None):
-    """Hàm chung để proxy request - Đã tối ưu hóa."""
+# Header Hop-by-hop không được chuyển tiếp nguyên trạng qua Gateway
+EXCLUDED_RESPONSE_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
+# Body upstream đã nén sẵn được chuyển thẳng (không giải nén) -> giữ Content-Encoding
+PASSTHROUGH_RESPONSE_HEADERS = [name for name in EXCLUDED_RESPONSE_HEADERS if name != 'content-encoding']
+
+def _build_request_body(headers, new_data):
+    """
+    Chọn cách gửi body lên upstream:
+    - Body nhỏ: đọc hết (request.get_data()) như cũ.
+    - Body lớn / chunked: stream từng chunk, bộ đệm giới hạn PROXY_STREAM_CHUNK_SIZE.
+    """
+    if new_data is not None:
+        return None
+
+    config = current_app.config
+    content_length = request.content_length
+    is_chunked = 'chunked' in request.headers.get('Transfer-Encoding', '').lower()
+    if not config.get('PROXY_STREAMING', True) or not (
+        is_chunked or (content_length or 0) > config.get('PROXY_STREAM_THRESHOLD', 1024 * 1024)
+    ):
+        return request.get_data()
+
+    # requests sẽ tự đặt Content-Length / Transfer-Encoding cho body dạng stream
+    for name in list(headers):
+        if name.lower() in ('content-length', 'transfer-encoding'):
+            del headers[name]
+
+    chunk_size = config.get('PROXY_STREAM_CHUNK_SIZE', 64 * 1024)
+    if content_length:
+        return RequestBodyStream(request.stream, content_length, chunk_size)
+    return chunked_request_body(request.stream, chunk_size)
+
+def _send_upstream(upstream, path, headers, data=None, json=None, hedge=False, bulkhead=None):
+    """
+    Gửi Request qua connection pool keep-alive của upstream
+    (timeout lấy theo cấu hình riêng của từng upstream).
+    stream=True: chỉ đọc header trước, body được đọc dần sau đó.
+    hedge=True (chỉ GET): quá ngưỡng độ trễ thì gửi thêm 1 request dự phòng
+    (request dự phòng lấy slot riêng của `bulkhead`).
+    """
+    send = partial(
+        current_app.extensions['upstreams'].get(upstream).request,
+        request.method,
+        path,
+        headers=headers,
+        data=data,
+        json=json,
+        params=request.args,
+        allow_redirects=False, # Gateway không tự redirect
+        stream=True
+    )
+    hedger = current_app.extensions.get('hedger')
+    if hedge and hedger is not None and request.method == 'GET' and data is None and json is None:
+        return hedger.run(route_template(), send, bulkhead=bulkhead)
+    return send()
+
+def _bulkhead_for(upstream):
+    """Bulkhead của nhóm route ứng với upstream (None nếu tắt)."""
+    bulkheads = current_app.extensions.get('bulkheads')
+    return bulkheads.get(upstream) if bulkheads is not None else None
+
+def _proxy_request(upstream, path, new_data=None, coalesce=False, hedge=False):
+    """
+    Hàm chung để proxy request - Đã tối ưu hóa (hỗ trợ streaming 2 chiều).
+    upstream: tên service trong UpstreamRegistry ('auth' / 'book' / 'transaction');
+    pool của upstream đó chọn replica, route chỉ truyền path.
+    coalesce=True: các GET giống hệt nhau chạy đồng thời dùng chung 1 lời gọi upstream
+    (chỉ dùng cho route mà response không phụ thuộc user, vd: danh sách sách).
+    hedge=True: GET idempotent, được phép gửi request dự phòng khi upstream chậm.
+    """
+    bulkhead = None
+    slot_held = False
     try:
-        downstream_url = f"{service_url}/{path}"
+        # Định danh logic (không phụ thuộc replica) cho cache key / single-flight key
+        resource = f"{upstream}/{path}"
         
         # 1. Chuẩn bị Headers để chuyển tiếp
         # Loại bỏ Host header để tránh lỗi routing ở downstream
         headers = {key: value for (key, value) in request.headers if key != 'Host'}
+        # requests tự thêm 'Accept-Encoding: gzip, deflate' nếu thiếu -> chỉ xin bản nén
+        # theo đúng những gì client chấp nhận (không có thì xin bản gốc)
+        client_encoding = request.headers.get('Accept-Encoding')
+        headers['Accept-Encoding'] = client_encoding or 'identity'
+        # ETag bản nén ("abc-gzip") do Gateway đặt -> đổi về ETag gốc trước khi so/chuyển tiếp
+        if_none_match = strip_etag_encoding(request.headers.get('If-None-Match'))
+        if if_none_match:
+            headers['If-None-Match'] = if_none_match
         
         # 2. Inject thông tin User (Quan trọng cho Audit Log ở Service con)
         if hasattr(g, 'user') and g.user:
             headers['X-User-ID'] = str(g.user.get('user_id'))
             headers['X-User-Role'] = str(g.user.get('role'))
 
-        # 3. Gửi Request
-        resp = requests.request(
-            method=request.method,
-            url=downstream_url,
-            headers=headers,
-            data=request.get_data() if new_data is None else None,
-            json=new_data,
-            params=request.args,
-            timeout=10, # Tăng timeout lên chút cho an toàn
-            allow_redirects=False # Gateway không tự redirect
-        )
+        # 2b. HTTP cache của Gateway (chỉ GET): còn max-age -> trả local,
+        #     hết max-age -> revalidate upstream bằng If-None-Match
+        cache = current_app.extensions.get('response_cache')
+        cache_key = cached = None
+        if cache is not None and request.method == 'GET' and new_data is None:
+            cache_key = cache.key(resource, request.args, request.headers.get('Accept'))
+            cached = cache.get(cache_key)
+            if cached is not None:
+                if cached.is_fresh():
+                    return cache.serve(cached, if_none_match)
+                headers['If-None-Match'] = cached.etag
+
+        # 3. Gửi Request lên upstream (giữ 1 slot bulkhead tới khi đọc xong body)
+        bulkhead = _bulkhead_for(upstream)
+        flights = current_app.extensions.get('single_flight')
+        if coalesce and flights is not None and request.method == 'GET' and new_data is None:
+            # Key gồm mọi thứ ảnh hưởng tới response: URL, query, Accept, If-None-Match
+            flight_key = (
+                resource,
+                tuple(sorted(request.args.items(multi=True))),
+                headers.get('Accept'),
+                headers.get('If-None-Match'),
+            )
+            def fetch():
+                # Chỉ leader chiếm slot; follower chỉ chờ kết quả
+                with bulkhead.slot() if bulkhead is not None else nullcontext():
+                    upstream_resp = _send_upstream(upstream, path, headers, hedge=hedge, bulkhead=bulkhead)
+                    with phase('upstream_body'):
+                        return BufferedUpstreamResponse(upstream_resp)
+            resp = flights.do(flight_key, fetch)
+        else:
+            if bulkhead is not None:
+                bulkhead.acquire()
+                slot_held = True
+            resp = _send_upstream(
+                upstream, path, headers,
+                data=_build_request_body(headers, new_data), json=new_data, hedge=hedge, bulkhead=bulkhead
+            )
+
+        if cached is not None and resp.status_code == 304:
+            resp.close()
+            cache.refresh(cached, resp)
+            return cache.serve(cached, if_none_match)
         
         # 4. Xử lý Response headers (Loại bỏ các header Hop-by-hop)
-        excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
+        #    Body đã nén ở upstream (và chưa bị buffer/giải nén) đi thẳng tới client,
+        #    chỉ khi client chấp nhận encoding đó; ngược lại giải nén tại Gateway
+        buffered = isinstance(resp, BufferedUpstreamResponse)
+        upstream_encoding = resp.headers.get('Content-Encoding')
+        passthrough = (
+            not buffered and bool(upstream_encoding)
+            and accepts_encoding(client_encoding, upstream_encoding)
+        )
+        header_items = resp.header_items if buffered else resp.raw.headers.items()
+        excluded = PASSTHROUGH_RESPONSE_HEADERS if passthrough else EXCLUDED_RESPONSE_HEADERS
         headers = [
-            (name, value) for (name, value) in resp.raw.headers.items() 
-            if name.lower() not in excluded_headers
+            (name, value) for (name, value) in header_items
+            if name.lower() not in excluded
         ]
         
-        # 5. Trả về Response nguyên vẹn
-        return Response(resp.content, resp.status_code, headers)
+        # 5. Body lớn (hoặc không rõ độ dài): stream thẳng về client theo từng chunk
+        config = current_app.config
+        upstream_length = resp.headers.get('Content-Length')
+        if not buffered and config.get('PROXY_STREAMING', True) and (
+            upstream_length is None or int(upstream_length) > config.get('PROXY_STREAM_THRESHOLD', 1024 * 1024)
+        ):
+            chunk_size = config.get('PROXY_STREAM_CHUNK_SIZE', 64 * 1024)
+            # Khi server đóng response (stream xong hoặc client ngắt): ghi pha body, trả slot bulkhead
+            on_close = [body_timer(route_template())]
+            if slot_held:
+                on_close.append(bulkhead.release)
+                slot_held = False
+            body = ClosingIterator(iter_upstream_body(resp, chunk_size, decode=not passthrough), on_close)
+            return Response(body, resp.status_code, headers, direct_passthrough=True)
 
-    except requests.exceptions.ConnectionError:
+        # 6. Body nhỏ: trả về Response nguyên vẹn (và lưu cache nếu upstream cho phép)
+        #    Cache chỉ giữ bản chưa nén; Gateway tự nén lại theo Accept-Encoding của từng client
+        with phase('upstream_body'):
+            body = resp.raw.read(decode_content=False) if passthrough else resp.content
+        if cache is not None:
+            if cache_key is not None and not passthrough:
+                max_age = cache.cacheable_max_age(resp)
+                if max_age:
+                    cache.put(cache_key, CachedResponse(resp.status_code, headers, body, resp.headers['ETag'], max_age))
+            elif request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and resp.status_code < 400:
+                # Ghi thành công -> bỏ các bản cache của cùng collection (vd: books, books/5)
+                cache.purge(prefix=f"{upstream}/{path.split('/')[0]}")
+        return Response(body, resp.status_code, headers)
+
+    except BulkheadFullError:
+        # Load shedding: hàng đợi của nhóm route đã đầy / chờ quá lâu
+        return jsonify({"error": "Service Unavailable (Overloaded)"}), 503, {'Retry-After': '1'}
+    except CircuitOpenError as e:
+        # Fail-fast: upstream đang lỗi/chậm, không giữ worker chờ timeout
+        return jsonify({"error": "Service Unavailable (Circuit Open)"}), 503, {'Retry-After': str(e.retry_after)}
+    except (requests.exceptions.ConnectionError, EmptyPoolError):
         return jsonify({"error": "Service Unavailable (Downstream)"}), 503
     except requests.exceptions.Timeout:
         return jsonify({"error": "Gateway Timeout"}), 504
     except Exception as e:
         return jsonify({"error": f"Gateway Error: {str(e)}"}), 500
+    finally:
+        if slot_held:
+            bulkhead.release()
 
 # ==================================
 # RESTful Authentication Endpoints (Email/Password)
@@ -54,14 +220,12 @@ def _proxy_request(service_url, path, new_data=None):
 @auth_bp.route('/users', methods=['POST'])
 def register_user():
     """Tạo một tài nguyên 'user' mới. Endpoint: POST /api/users"""
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/users')
+    return _proxy_request('auth', 'auth/users')
 
 @auth_bp.route('/auth/login', methods=['POST'])
 def create_token():
     """Tạo một tài nguyên 'token' mới (Đăng nhập). Endpoint: POST /api/auth/tokens"""
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/login')
+    return _proxy_request('auth', 'auth/login')
 
 # --- [V2] ĐĂNG NHẬP (BỔ SUNG) ---
 @auth_bp.route('/v2/auth/login', methods=['POST'])
@@ -71,43 +235,37 @@ def create_token_v2():
     Endpoint: POST /api/v2/auth/tokens
     Proxy to: auth_service/auth/v2/login
     """
-    url = current_app.config['AUTH_SERVICE_URL']
     # Hàm proxy sẽ chuyển tiếp request đến endpoint v2 của auth_service
     # (Endpoint này bạn đã tạo ở auth_service trong bước trước)
-    return _proxy_request(url, 'auth/v2/login')
+    return _proxy_request('auth', 'auth/v2/login')
 # --- [V3] BỔ SUNG ---
 @auth_bp.route('/v3/auth/login', methods=['POST'])
 def create_token_v3():
     """[V3] Endpoint: POST /api/v3/auth/tokens"""
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/v3/login') # -> auth_service/auth/v3/login
+    return _proxy_request('auth', 'auth/v3/login') # -> auth_service/auth/v3/login
 
 # --- [V4] BỔ SUNG ---
 @auth_bp.route('/v4/auth/login', methods=['POST'])
 def create_token_v4():
     """[V4] Endpoint: POST /api/v4/auth/tokens"""
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/v4/login') # -> auth_service/auth/v4/login
+    return _proxy_request('auth', 'auth/v4/login') # -> auth_service/auth/v4/login
 
 # --- [V5] BỔ SUNG ---
 @auth_bp.route('/v5/auth/login', methods=['POST'])
 def create_token_v5():
     """[V5] Endpoint: POST /api/v5/auth/tokens"""
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/v5/login') # -> auth_service/auth/v5/login
+    return _proxy_request('auth', 'auth/v5/login') # -> auth_service/auth/v5/login
 
 @auth_bp.route('/auth/refresh-token', methods=['PUT'])
 def refresh_token():
     """Cập nhật/Làm mới một 'access token'. Endpoint: PUT /api/auth/tokens"""
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/refresh-token')
+    return _proxy_request('auth', 'auth/refresh-token')
 
 @auth_bp.route('/auth/logout', methods=['DELETE'])
 @token_required
 def delete_token():
     """Xóa một tài nguyên 'token' (Đăng xuất). Endpoint: DELETE /api/auth/tokens"""
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/logout')
+    return _proxy_request('auth', 'auth/logout')
 
 # ==================================
 # Google OAuth 2.0 Endpoints
@@ -120,9 +278,8 @@ def google_login():
     Endpoint: GET /api/auth/google/login
     (Proxy to auth_service/auth/google/login)
     """
-    url = current_app.config['AUTH_SERVICE_URL']
     # Hàm proxy sẽ tự động xử lý và trả về redirect response cho trình duyệt
-    return _proxy_request(url, 'auth/google/login')
+    return _proxy_request('auth', 'auth/google/login')
 
 @auth_bp.route('/auth/google/callback', methods=['GET'])
 def google_callback():
@@ -131,10 +288,9 @@ def google_callback():
     Endpoint: GET /api/auth/google/callback
     (Proxy to auth_service/auth/google/callback)
     """
-    url = current_app.config['AUTH_SERVICE_URL']
     # Hàm proxy sẽ chuyển tiếp 'code' và 'state' từ Google đến auth_service
     # và trả về kết quả (tokens hoặc redirect) cho client
-    return _proxy_request(url, 'auth/google/callback')
+    return _proxy_request('auth', 'auth/google/callback')
 
 @auth_bp.route('/users/nplus1', methods=['GET'])
 @token_required
@@ -145,8 +301,7 @@ def debug_users_nplus1():
     Endpoint FE gọi: GET /api/users/nplus1
     Proxy to: auth_service/auth/users/nplus1
     """
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/users/nplus1')
+    return _proxy_request('auth', 'auth/users/nplus1')
 
 
 @auth_bp.route('/users/eager', methods=['GET'])
@@ -158,8 +313,7 @@ def debug_users_eager():
     Endpoint FE gọi: GET /api/users/eager
     Proxy to: auth_service/auth/users/eager
     """
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/users/eager')
+    return _proxy_request('auth', 'auth/users/eager')
 
 
 @auth_bp.route('/users/batch', methods=['GET'])
@@ -171,7 +325,32 @@ def debug_users_batch():
     Endpoint FE gọi: GET /api/users/batch
     Proxy to: auth_service/auth/users/batch
     """
-    url = current_app.config['AUTH_SERVICE_URL']
-    return _proxy_request(url, 'auth/users/batch')
+    return _proxy_request('auth', 'auth/users/batch')
+
+
+@auth_bp.route('/users', methods=['GET'])
+@token_required
+@admin_required
+def list_users():
+    """
+    Danh sách user cho admin, phân trang keyset (?limit=&cursor=)
+    hoặc stream toàn bộ dạng NDJSON (?format=ndjson).
+    Endpoint FE gọi: GET /api/users
+    Proxy to: auth_service/auth/users
+    """
+    return _proxy_request('auth', 'auth/users')
+
+
+@auth_bp.route('/users/import', methods=['POST'])
+@token_required
+@admin_required
+def import_users():
+    """
+    Import hàng loạt user từ file CSV / NDJSON (body stream thẳng lên auth_service).
+    Endpoint FE gọi: POST /api/users/import?format=csv|ndjson
+    Proxy to: auth_service/auth/users/import
+    File lớn: tăng AUTH_SERVICE_TIMEOUT hoặc dùng CLI import_users.py.
+    """
+    return _proxy_request('auth', 'auth/users/import')
 
 # ==================================
\ No newline at end of file
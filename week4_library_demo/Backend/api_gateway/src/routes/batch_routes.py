@@ -0,0 +1,115 @@
+import json
+
+from flask import Blueprint, request, jsonify, current_app, g
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from ..auth.decorators import token_required
+
+batch_bp = Blueprint('batch_bp', __name__)
+
+# Header của request cha được chuyển xuống từng sub-request
+FORWARDED_HEADERS = ('Authorization', 'Accept', 'Accept-Language', 'X-Forwarded-For', 'X-Request-ID')
+# Header của sub-response được trả lại cho client
+RETURNED_HEADERS = ('Content-Type', 'ETag', 'Cache-Control', 'Location', 'Retry-After', 'X-Cache')
+
+def _parse_batch(payload, max_requests):
+    """Kiểm tra body: {"requests": [{"id", "method", "path", "body"?, "headers"?}, ...]}"""
+    if not isinstance(payload, dict) or not isinstance(payload.get('requests'), list):
+        return None, "Body must be a JSON object with a 'requests' list"
+    subrequests = payload['requests']
+    if not subrequests:
+        return None, "'requests' must not be empty"
+    if len(subrequests) > max_requests:
+        return None, f"Too many sub-requests (max {max_requests})"
+
+    parsed = []
+    for index, sub in enumerate(subrequests):
+        if not isinstance(sub, dict) or not isinstance(sub.get('path'), str):
+            return None, f"Sub-request #{index} must have a 'path'"
+        path = sub['path']
+        if not path.startswith('/api/') or path.split('?')[0].rstrip('/') == '/api/batch':
+            return None, f"Sub-request #{index}: path must start with /api/ and must not be /api/batch"
+        parsed.append({
+            "id": str(sub.get('id', index)),
+            "method": str(sub.get('method', 'GET')).upper(),
+            "path": path,
+            "body": sub.get('body'),
+            "headers": sub.get('headers') if isinstance(sub.get('headers'), dict) else {},
+        })
+    return parsed, None
+
+def _run_subrequest(app, sub, parent_headers, remote_addr, user, token_header):
+    """
+    Chạy 1 sub-request qua đúng view function (cùng decorator token_required/admin_required)
+    trong request context riêng. Token đã xác thực ở request cha -> không xác thực lại.
+    full_dispatch_request chạy đủ before/after_request hook -> mỗi sub-request vẫn bị
+    Limiter đếm (theo IP của request cha) và được đo thời gian như 1 request thường.
+    """
+    path, _, query = sub['path'].partition('?')
+    headers = {**parent_headers, **sub['headers']}
+    # Body sub-response được nhúng vào JSON -> không nhận body nén từ upstream
+    headers['Accept-Encoding'] = 'identity'
+    builder = EnvironBuilder(
+        path=path, query_string=query, method=sub['method'], headers=headers,
+        json=sub['body'] if sub['body'] is not None else None,
+        environ_base={'REMOTE_ADDR': remote_addr},
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    with app.app_context():
+        g.batch_user = user
+        g.batch_token = token_header
+        with app.request_context(environ):
+            try:
+                response = app.full_dispatch_request()
+            except HTTPException as e:
+                # 404/405 khi path/method không khớp route nào, 429 khi vượt rate limit
+                response = jsonify({"error": e.name})
+                response.status_code = e.code
+            except Exception as e:
+                response = jsonify({"error": f"Gateway Error: {str(e)}"})
+                response.status_code = 500
+
+            try:
+                data = b''.join(response.response) if response.direct_passthrough else response.get_data()
+            finally:
+                response.close()
+
+    body = data.decode('utf-8', errors='replace')
+    if response.is_json:
+        try:
+            body = json.loads(data) if data else None
+        except ValueError:
+            pass
+
+    return {
+        "id": sub['id'],
+        "status": response.status_code,
+        "headers": {name: response.headers[name] for name in RETURNED_HEADERS if name in response.headers},
+        "body": body,
+    }
+
+@batch_bp.route('/batch', methods=['POST'])
+@token_required
+def run_batch():
+    """
+    Gộp nhiều request nhỏ của Frontend thành 1 round trip. Endpoint: POST /api/batch
+    Body: {"requests": [{"id": "books", "method": "GET", "path": "/api/books?page=1"}, ...]}
+    Token được xác thực 1 lần; các sub-request chạy song song, mỗi cái vẫn qua
+    token_required/admin_required của route tương ứng.
+    """
+    config = current_app.config
+    subrequests, error = _parse_batch(request.get_json(silent=True), config.get('BATCH_MAX_REQUESTS', 20))
+    if error:
+        return jsonify({"error": error}), 400
+
+    app = current_app._get_current_object()
+    parent_headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    args = (parent_headers, request.remote_addr, g.user, request.headers.get('Authorization'))
+
+    executor = current_app.extensions['batch_executor']
+    futures = [executor.submit(_run_subrequest, app, sub, *args) for sub in subrequests]
+    return jsonify({"responses": [future.result() for future in futures]}), 200
@@ -4,22 +4,20 @@ from .auth_routes import _proxy_request # Dùng lại hàm proxy
 
 book_bp = Blueprint('book_bp', __name__)
 
-# Helper để lấy URL của Book Service
-def get_book_service_url():
-    return current_app.config['BOOK_SERVICE_URL']
-
 # ==================================
 # Public Routes (Chỉ cần đăng nhập)
 # ==================================
 @book_bp.route('/books', methods=['GET'])
 @token_required # Bất kỳ 'user' nào cũng có thể xem
 def list_books():
-    return _proxy_request(get_book_service_url(), 'books')
+    # Trang sách "nóng" (page 1-5) -> gộp các GET giống nhau đang chạy đồng thời
+    # GET idempotent -> được phép hedge khi upstream chậm bất thường
+    return _proxy_request('book', 'books', coalesce=True, hedge=True)
 
 @book_bp.route('/books/<int:book_id>', methods=['GET'])
 @token_required
 def get_book(book_id):
-    return _proxy_request(get_book_service_url(), f'books/{book_id}')
+    return _proxy_request('book', f'books/{book_id}', coalesce=True, hedge=True)
 
 # ==================================
 # Admin Routes (Phải là 'admin')
@@ -28,19 +26,19 @@ def get_book(book_id):
 @token_required
 @admin_required # CHỈ ADMIN
 def create_book():
-    return _proxy_request(get_book_service_url(), 'books')
+    return _proxy_request('book', 'books')
 
 @book_bp.route('/books/<int:book_id>', methods=['PUT'])
 @token_required
 @admin_required # CHỈ ADMIN
 def update_book(book_id):
-    return _proxy_request(get_book_service_url(), f'books/{book_id}')
+    return _proxy_request('book', f'books/{book_id}')
 
 @book_bp.route('/books/<int:book_id>', methods=['DELETE'])
 @token_required
 @admin_required # CHỈ ADMIN
 def delete_book(book_id):
-    return _proxy_request(get_book_service_url(), f'books/{book_id}')
+    return _proxy_request('book', f'books/{book_id}')
 
 # =Example: Endpoint nội bộ của book_service
 # Gateway KHÔNG NÊN expose endpoint /internal/* ra ngoài
@@ -1,6 +1,17 @@
+import json
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import nullcontext
+from functools import partial
+
+import requests
 from flask import Blueprint, request, jsonify, current_app, g
+from urllib3.exceptions import EmptyPoolError
+from werkzeug.datastructures import MultiDict
 from ..auth.decorators import token_required
-from .auth_routes import _proxy_request
+from ..upstream.bulkhead import BulkheadFullError
+from ..upstream.response_cache import CachedResponse
+from .auth_routes import EXCLUDED_RESPONSE_HEADERS, _bulkhead_for, _proxy_request
 
 transaction_bp = Blueprint('transaction_bp', __name__)
 
@@ -10,8 +21,7 @@ def create_transaction():
     """Tạo giao dịch cho user đang đăng nhập."""
     data = request.json
     data['user_id'] = g.user.get('user_id') 
-    url = current_app.config['TRANSACTION_SERVICE_URL']
-    return _proxy_request(url, 'transactions', new_data=data)
+    return _proxy_request('transaction', 'transactions', new_data=data)
 
 @transaction_bp.route('/me/borrowed-books', methods=['GET'])
 @token_required
@@ -20,14 +30,132 @@ def get_my_borrowed_books():
     ROUTE MỚI: Lấy danh sách sách đang mượn của user hiện tại.
     """
     user_id = g.user.get('user_id')
-    url = current_app.config['TRANSACTION_SERVICE_URL']
     # Gọi đến endpoint mới của service: /users/{user_id}/borrowed-books
-    return _proxy_request(url, f'users/{user_id}/borrowed-books')
+    return _proxy_request('transaction', f'users/{user_id}/borrowed-books')
 
 @transaction_bp.route('/me/transactions', methods=['GET'])
 @token_required
 def get_my_transactions():
     """Lấy toàn bộ lịch sử giao dịch của user hiện tại."""
     user_id = g.user.get('user_id')
-    url = current_app.config['TRANSACTION_SERVICE_URL']
-    return _proxy_request(url, f'users/{user_id}/transactions')
+    return _proxy_request('transaction', f'users/{user_id}/transactions')
+
+# ==================================
+# Dashboard tổng hợp (gọi song song nhiều upstream tại Gateway)
+# ==================================
+
+def _fetch_json(send, path, headers, timeout, bulkhead=None, cache=None, cache_key=None):
+    """
+    Chạy trong thread pool (không có request context): GET upstream, trả về JSON.
+    Cùng đường đi với _proxy_request: HTTP cache của Gateway (hit / revalidate 304)
+    rồi mới chiếm 1 slot bulkhead của upstream trong lúc gọi.
+    """
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is not None:
+        if cached.is_fresh():
+            return json.loads(cached.body)
+        headers = dict(headers, **{'If-None-Match': cached.etag})
+
+    with bulkhead.slot() if bulkhead is not None else nullcontext():
+        resp = send('GET', path, headers=headers, timeout=timeout)
+        try:
+            if cached is not None and resp.status_code == 304:
+                cache.refresh(cached, resp)
+                return json.loads(cached.body)
+            resp.raise_for_status()
+            body = resp.content
+            max_age = cache.cacheable_max_age(resp) if cache is not None else None
+            if max_age:
+                response_headers = [(name, value) for (name, value) in resp.raw.headers.items()
+                                    if name.lower() not in EXCLUDED_RESPONSE_HEADERS]
+                cache.put(cache_key, CachedResponse(resp.status_code, response_headers, body, resp.headers['ETag'], max_age))
+            return json.loads(body)
+        finally:
+            resp.close()
+
+def _section(future, timeout):
+    """Kết quả 1 phần của dashboard; phần chậm/lỗi không làm hỏng cả response."""
+    try:
+        return {"status": "ok", "data": future.result(timeout=max(timeout, 0))}
+    except FutureTimeoutError:
+        future.cancel()
+        return {"status": "timeout", "data": None}
+    except (requests.exceptions.RequestException, EmptyPoolError, BulkheadFullError, ValueError) as e:
+        return {"status": "error", "error": str(e), "data": None}
+
+@transaction_bp.route('/me/dashboard', methods=['GET'])
+@token_required
+def get_my_dashboard():
+    """
+    Gộp sách đang mượn + giao dịch gần đây + chi tiết sách vào 1 response.
+    Endpoint: GET /api/me/dashboard
+
+    - borrowed-books và transactions gọi song song sang transaction_service.
+    - Có book_id là gọi song song /books/<id> sang book_service.
+    - Một hạn chót chung cho cả response (DASHBOARD_TIMEOUT): bước chi tiết sách chỉ được
+      phần thời gian còn lại sau bước 1 -> tệ nhất ~1x timeout. Phần chậm trả status 'timeout'.
+    """
+    config = current_app.config
+    user_id = g.user.get('user_id')
+    deadline = time.monotonic() + config.get('DASHBOARD_TIMEOUT', 2.0)
+    connect_timeout = config.get('UPSTREAM_CONNECT_TIMEOUT', 3)
+    executor = current_app.extensions['dashboard_executor']
+    upstreams = current_app.extensions['upstreams']
+    cache = current_app.extensions.get('response_cache')
+
+    headers = {
+        'Accept': 'application/json',
+        'X-User-ID': str(user_id),
+        'X-User-Role': str(g.user.get('role')),
+    }
+    if request.headers.get('Authorization'):
+        headers['Authorization'] = request.headers['Authorization']
+
+    def remaining():
+        return deadline - time.monotonic()
+
+    def fetch(upstream, path):
+        send = upstreams.get(upstream).request
+        # Timeout của chính request upstream cũng không vượt quá hạn chót
+        budget = max(remaining(), 0.001)
+        cache_key = cache.key(f"{upstream}/{path}", MultiDict(), headers['Accept']) if cache is not None else None
+        return executor.submit(partial(
+            _fetch_json, send, path, headers, (min(connect_timeout, budget), budget),
+            bulkhead=_bulkhead_for(upstream), cache=cache, cache_key=cache_key,
+        ))
+
+    # 1. Hai phần độc lập của transaction_service chạy song song
+    borrowed_future = fetch('transaction', f'users/{user_id}/borrowed-books')
+    transactions_future = fetch('transaction', f'users/{user_id}/transactions')
+
+    borrowed = _section(borrowed_future, remaining())
+    transactions = _section(transactions_future, remaining())
+    if isinstance(transactions['data'], list):
+        transactions['data'] = transactions['data'][:config.get('DASHBOARD_RECENT_TRANSACTIONS', 10)]
+
+    # 2. Chi tiết sách (song song từng cuốn) cho các sách xuất hiện ở 2 phần trên
+    book_ids = []
+    items = [item for section in (borrowed, transactions) if isinstance(section['data'], list) for item in section['data']]
+    for item in items:
+        if isinstance(item, dict) and item.get('book_id') is not None and item['book_id'] not in book_ids:
+            book_ids.append(item['book_id'])
+    book_ids = book_ids[:config.get('DASHBOARD_MAX_BOOKS', 20)]
+
+    # Hết hạn chót ngay sau bước 1 -> không gửi request sách nào nữa
+    if remaining() > 0:
+        book_futures = {book_id: fetch('book', f'books/{book_id}') for book_id in book_ids}
+        book_sections = {book_id: _section(future, remaining()) for book_id, future in book_futures.items()}
+    else:
+        book_sections = {book_id: {"status": "timeout", "data": None} for book_id in book_ids}
+    books = {
+        "status": "ok" if all(s['status'] == 'ok' for s in book_sections.values()) else "partial",
+        "data": {str(book_id): s['data'] for book_id, s in book_sections.items() if s['data'] is not None},
+    }
+
+    return jsonify({
+        "user": {"user_id": user_id, "role": g.user.get('role')},
+        "borrowed_books": borrowed,
+        "recent_transactions": transactions,
+        "books": books,
+        "degraded": any(s['status'] != 'ok' for s in (borrowed, transactions, books)),
+    }), 200
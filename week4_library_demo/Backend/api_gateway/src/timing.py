@@ -0,0 +1,123 @@
+# api_gateway/src/timing.py
+
+"""
+Đo thời gian từng pha của 1 request qua Gateway:
+limiter -> validate_token -> upstream_connect -> upstream_ttfb -> upstream_body.
+
+Mỗi pha được ghi vào histogram gateway_phase_duration_seconds (label theo route template,
+vd: /api/me/borrowed-books, không theo path thật) và, khi bật SERVER_TIMING_ENABLED,
+trả về cho client trong header Server-Timing (đơn vị ms).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request
+
+from .metrics import PHASE_DURATION
+
+PHASES = ('limiter', 'validate_token', 'upstream_connect', 'upstream_ttfb', 'upstream_body')
+
+_local = threading.local()
+
+
+def route_template():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _current_phases():
+    phases = getattr(_local, 'phases', None)
+    if phases is not None:
+        return phases
+    if not has_app_context() or '_phases' not in g:
+        return None
+    return g._phases
+
+
+def record_phase(name, seconds):
+    """Cộng dồn thời gian của pha (1 request có thể gọi upstream nhiều lần)."""
+    phases = _current_phases()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+def phase_total(name):
+    phases = _current_phases()
+    return phases.get(name, 0.0) if phases is not None else 0.0
+
+
+@contextmanager
+def collect_phases(phases):
+    """
+    Thread không có request context (vd: lần gửi của Hedger) ghi pha vào `phases`;
+    request thread chọn kết quả nào được cộng vào Server-Timing.
+    """
+    _local.phases = phases
+    try:
+        yield phases
+    finally:
+        _local.phases = None
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def body_timer(route):
+    """
+    Callback đo thời gian truyền body stream (chạy khi response đóng, ngoài request context)
+    -> chỉ ghi histogram, không thể thêm vào Server-Timing vì header đã gửi.
+    """
+    start = time.perf_counter()
+
+    def done():
+        PHASE_DURATION.labels(route=route, phase='upstream_body').observe(time.perf_counter() - start)
+    return done
+
+
+def _start_request():
+    g._phases = {}
+    g._request_start = time.perf_counter()
+
+
+def _limiter_checked():
+    g._phases['limiter'] = time.perf_counter() - g._request_start
+
+
+def init_app(app):
+    """
+    Gọi TRƯỚC khi tạo Limiter để _start_request chạy trước hook của Flask-Limiter,
+    sau đó gọi `after_limiter(app)` để đánh dấu kết thúc pha limiter.
+    """
+    app.before_request(_start_request)
+
+    @app.after_request
+    def _observe_phases(response):
+        if '_phases' not in g:
+            return response
+        phases = g._phases
+        # Request bị limiter chặn (429) thì hook sau limiter không chạy
+        phases.setdefault('limiter', time.perf_counter() - g._request_start)
+        route = route_template()
+        for name, seconds in phases.items():
+            PHASE_DURATION.labels(route=route, phase=name).observe(seconds)
+
+        if app.config.get('SERVER_TIMING_ENABLED', False):
+            total = time.perf_counter() - g._request_start
+            metrics = [f"{name};dur={phases[name] * 1000:.2f}" for name in PHASES if name in phases]
+            metrics.append(f"total;dur={total * 1000:.2f}")
+            response.headers['Server-Timing'] = ', '.join(metrics)
+            # Cho phép JS của Frontend đọc qua PerformanceServerTiming
+            if app.config.get('FRONTEND_ORIGIN'):
+                response.headers['Timing-Allow-Origin'] = app.config['FRONTEND_ORIGIN']
+        return response
+
+
+def after_limiter(app):
+    app.before_request(_limiter_checked)
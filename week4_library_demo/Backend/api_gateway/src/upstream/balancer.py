@@ -0,0 +1,148 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from ..metrics import (
+    REPLICA_EJECTIONS, REPLICA_HEALTHY, REPLICA_LATENCY, REPLICA_OUTSTANDING, REPLICA_REQUESTS,
+)
+
+logger = logging.getLogger("GatewayBalancer")
+
+
+def parse_replicas(value):
+    """'http://book-1:5000, http://book-2:5000/' -> ['http://book-1:5000', 'http://book-2:5000']"""
+    return [url.strip().rstrip('/') for url in (value or '').split(',') if url.strip()]
+
+
+class Replica:
+    def __init__(self, upstream, url):
+        self.upstream = upstream
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True           # theo health probe chủ động
+        self.ejected_until = 0.0      # theo lỗi thụ động (connection error / 5xx liên tiếp)
+        self.consecutive_failures = 0
+        self.ewma_latency = 0.0
+        REPLICA_HEALTHY.labels(upstream=upstream, replica=url).set(1)
+
+    def available(self, now):
+        return self.healthy and self.ejected_until <= now
+
+    def snapshot(self, now):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ejected": self.ejected_until > now,
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 2),
+        }
+
+
+class ReplicaSet:
+    """
+    Cân bằng tải phía client giữa các replica của 1 upstream.
+
+    - strategy='p2c' (mặc định): chọn ngẫu nhiên 2 replica, lấy replica có ít request
+      đang chạy hơn.
+    - strategy='least_outstanding': luôn chọn replica có ít request đang chạy nhất.
+    - Replica lỗi `eject_after` lần liên tiếp bị loại `eject_seconds` giây;
+      replica fail health probe bị loại tới khi probe thành công lại.
+    - Không còn replica nào khả dụng -> vẫn thử tất cả (fail-open) thay vì trả 503 ngay.
+    """
+
+    def __init__(self, upstream, urls, strategy='p2c', eject_after=3, eject_seconds=30):
+        self.upstream = upstream
+        self.replicas = [Replica(upstream, url) for url in urls]
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    def pick(self):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [r for r in self.replicas if r.available(now)] or self.replicas
+            if len(candidates) == 1:
+                replica = candidates[0]
+            elif self.strategy == 'least_outstanding':
+                fewest = min(r.outstanding for r in candidates)
+                replica = random.choice([r for r in candidates if r.outstanding == fewest])
+            else:
+                # Hoà -> giữ lựa chọn ngẫu nhiên đầu tiên để tải vẫn chia đều khi ít request
+                a, b = random.sample(candidates, 2)
+                replica = b if b.outstanding < a.outstanding else a
+            replica.outstanding += 1
+        REPLICA_OUTSTANDING.labels(upstream=self.upstream, replica=replica.url).inc()
+        return replica
+
+    def release(self, replica, failed, duration):
+        with self._lock:
+            replica.outstanding -= 1
+            replica.ewma_latency = duration if not replica.ewma_latency else 0.8 * replica.ewma_latency + 0.2 * duration
+            if failed:
+                replica.consecutive_failures += 1
+                ejected = replica.consecutive_failures >= self.eject_after and len(self.replicas) > 1
+                if ejected:
+                    replica.ejected_until = time.monotonic() + self.eject_seconds
+                    replica.consecutive_failures = 0
+            else:
+                replica.consecutive_failures = 0
+                ejected = False
+        labels = dict(upstream=self.upstream, replica=replica.url)
+        REPLICA_OUTSTANDING.labels(**labels).dec()
+        REPLICA_LATENCY.labels(**labels).observe(duration)
+        REPLICA_REQUESTS.labels(outcome='error' if failed else 'ok', **labels).inc()
+        if ejected:
+            REPLICA_EJECTIONS.labels(reason='errors', **labels).inc()
+            logger.warning(f"Ejected replica {replica.url} of '{self.upstream}' for {self.eject_seconds}s")
+
+    def mark_health(self, replica, healthy):
+        with self._lock:
+            changed = replica.healthy != healthy
+            replica.healthy = healthy
+        REPLICA_HEALTHY.labels(upstream=self.upstream, replica=replica.url).set(1 if healthy else 0)
+        if changed and not healthy:
+            REPLICA_EJECTIONS.labels(upstream=self.upstream, replica=replica.url, reason='health_check').inc()
+            logger.warning(f"Replica {replica.url} of '{self.upstream}' failed health check")
+
+    def states(self):
+        now = time.monotonic()
+        with self._lock:
+            return [replica.snapshot(now) for replica in self.replicas]
+
+
+class HealthProber:
+    """Thread nền gọi GET <replica>/health định kỳ cho mọi replica có thể bị loại."""
+
+    def __init__(self, replica_sets, interval=5, timeout=1):
+        self.replica_sets = replica_sets
+        self.interval = interval
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def probe_once(self):
+        for replica_set in self.replica_sets:
+            for replica in replica_set.replicas:
+                try:
+                    healthy = self._session.get(f"{replica.url}/health", timeout=self.timeout).status_code < 500
+                except requests.exceptions.RequestException:
+                    healthy = False
+                replica_set.mark_health(replica, healthy)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.probe_once()
+
+    def start(self):
+        # Gọi trong từng worker (sau fork) -> mỗi worker có thread probe riêng
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="upstream-health-prober", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
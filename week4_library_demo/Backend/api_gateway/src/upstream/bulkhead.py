@@ -0,0 +1,140 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from ..metrics import BULKHEAD_IN_FLIGHT, BULKHEAD_QUEUE_DEPTH, BULKHEAD_QUEUE_WAIT, BULKHEAD_SHED
+
+
+class BulkheadFullError(Exception):
+    """Ném ra khi request bị shed (hàng đợi đầy hoặc chờ quá queue_target)."""
+
+    def __init__(self, route_class, reason):
+        super().__init__(f"Bulkhead '{route_class}' shed request ({reason})")
+        self.route_class = route_class
+        self.reason = reason
+
+
+class Bulkhead:
+    """
+    Giới hạn số request đang chạy tới 1 upstream / nhóm route.
+
+    - Còn slot: chạy ngay.
+    - Hết slot: vào hàng đợi nhỏ (tối đa `max_queue`), chờ tối đa `queue_target` giây.
+    - Hàng đợi đầy hoặc chờ quá `queue_target`: shed (503) thay vì xếp hàng vô hạn,
+      để upstream chậm không chiếm hết worker của các route khác.
+    """
+
+    def __init__(self, route_class, max_concurrent=20, max_queue=20, queue_target=0.25):
+        self.route_class = route_class
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_target = queue_target
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+
+    def _shed(self, reason):
+        BULKHEAD_SHED.labels(route_class=self.route_class, reason=reason).inc()
+        raise BulkheadFullError(self.route_class, reason)
+
+    def acquire(self):
+        with self._cond:
+            if self._in_flight < self.max_concurrent and not self._waiting:
+                self._in_flight += 1
+                BULKHEAD_IN_FLIGHT.labels(route_class=self.route_class).set(self._in_flight)
+                return
+
+            if self._waiting >= self.max_queue:
+                self._shed('queue_full')
+
+            self._waiting += 1
+            BULKHEAD_QUEUE_DEPTH.labels(route_class=self.route_class).set(self._waiting)
+            start = time.monotonic()
+            deadline = start + self.queue_target
+            try:
+                while self._in_flight >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._shed('queue_timeout')
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+                BULKHEAD_QUEUE_DEPTH.labels(route_class=self.route_class).set(self._waiting)
+                BULKHEAD_QUEUE_WAIT.labels(route_class=self.route_class).observe(time.monotonic() - start)
+
+            self._in_flight += 1
+            BULKHEAD_IN_FLIGHT.labels(route_class=self.route_class).set(self._in_flight)
+
+    def try_acquire(self):
+        """Lấy slot chỉ khi còn trống ngay (không xếp hàng, không shed) - dùng cho hedge."""
+        with self._cond:
+            if self._in_flight >= self.max_concurrent or self._waiting:
+                return False
+            self._in_flight += 1
+            BULKHEAD_IN_FLIGHT.labels(route_class=self.route_class).set(self._in_flight)
+            return True
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            BULKHEAD_IN_FLIGHT.labels(route_class=self.route_class).set(self._in_flight)
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._waiting,
+                "max_concurrent": self.max_concurrent,
+            }
+
+
+class BulkheadRegistry:
+    """Một Bulkhead cho mỗi nhóm route, gắn với upstream phục vụ nhóm đó."""
+
+    # upstream (UpstreamRegistry.SERVICES) -> nhóm route
+    ROUTE_CLASSES = {
+        'auth': 'auth',
+        'book': 'books',
+        'transaction': 'transactions',
+    }
+
+    def __init__(self, bulkheads):
+        self._bulkheads = bulkheads
+
+    @staticmethod
+    def _setting(config, prefix, name, default):
+        # Giá trị riêng của nhóm (kể cả 0: MAX_QUEUE=0 = không xếp hàng, shed ngay) > giá trị chung
+        value = config.get(f'{prefix}_{name}')
+        if value is not None:
+            return value
+        value = config.get(f'BULKHEAD_{name}')
+        return default if value is None else value
+
+    @classmethod
+    def from_config(cls, config):
+        bulkheads = {}
+        for upstream, route_class in cls.ROUTE_CLASSES.items():
+            prefix = f'BULKHEAD_{route_class.upper()}'
+            bulkheads[upstream] = Bulkhead(
+                route_class,
+                max_concurrent=cls._setting(config, prefix, 'MAX_CONCURRENT', 20),
+                max_queue=cls._setting(config, prefix, 'MAX_QUEUE', 20),
+                queue_target=cls._setting(config, prefix, 'QUEUE_TARGET', 0.25),
+            )
+        return cls(bulkheads)
+
+    def get(self, upstream):
+        return self._bulkheads.get(upstream)
+
+    def states(self):
+        return {bulkhead.route_class: bulkhead.snapshot() for bulkhead in self._bulkheads.values()}
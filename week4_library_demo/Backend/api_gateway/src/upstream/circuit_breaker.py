@@ -0,0 +1,141 @@
+import math
+import threading
+import time
+from collections import deque
+
+import requests
+
+from ..metrics import CIRCUIT_REJECTED, CIRCUIT_STATE, CIRCUIT_TRANSITIONS
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Ném ra khi breaker của upstream đang mở -> fail-fast, không gọi upstream."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"Circuit breaker for '{upstream}' is open")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker cho 1 upstream, dựa trên cửa sổ N lời gọi gần nhất.
+
+    - CLOSED: gọi bình thường. Mở mạch khi (sau tối thiểu `min_calls` lời gọi)
+      tỉ lệ lỗi >= error_rate HOẶC tỉ lệ gọi chậm (> slow_call_seconds) >= slow_call_rate.
+    - OPEN: từ chối ngay (503 + Retry-After) trong `open_seconds`.
+    - HALF_OPEN: cho tối đa `half_open_calls` lời gọi thử; tất cả thành công -> CLOSED,
+      1 lời gọi thất bại -> OPEN lại.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, window_size=20, min_calls=10, error_rate=0.5,
+                 slow_call_seconds=3.0, slow_call_rate=0.8, open_seconds=15, half_open_calls=3):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window_size)  # (failed, slow)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        CIRCUIT_STATE.labels(upstream=name).set(0)
+
+    @classmethod
+    def from_config(cls, name, config):
+        return cls(
+            name,
+            window_size=config.get('CIRCUIT_WINDOW_SIZE', 20),
+            min_calls=config.get('CIRCUIT_MIN_CALLS', 10),
+            error_rate=config.get('CIRCUIT_ERROR_RATE', 0.5),
+            slow_call_seconds=config.get('CIRCUIT_SLOW_CALL_SECONDS', 3.0),
+            slow_call_rate=config.get('CIRCUIT_SLOW_CALL_RATE', 0.8),
+            open_seconds=config.get('CIRCUIT_OPEN_SECONDS', 15),
+            half_open_calls=config.get('CIRCUIT_HALF_OPEN_CALLS', 3),
+        )
+
+    def _transition(self, state):
+        self._state = state
+        CIRCUIT_STATE.labels(upstream=self.name).set(self._STATE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(upstream=self.name, state=state).inc()
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        elif state == self.HALF_OPEN:
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+        else:
+            self._outcomes.clear()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._transition(self.HALF_OPEN)
+            return self._state
+
+    def before_call(self):
+        """Xin phép gọi upstream; ném CircuitOpenError nếu phải fail-fast."""
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    CIRCUIT_REJECTED.labels(upstream=self.name).inc()
+                    raise CircuitOpenError(self.name, math.ceil(remaining))
+                self._transition(self.HALF_OPEN)
+
+            if self._state == self.HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_calls:
+                    CIRCUIT_REJECTED.labels(upstream=self.name).inc()
+                    raise CircuitOpenError(self.name, 1)
+                self._half_open_in_flight += 1
+
+    def record(self, failed, duration):
+        slow = duration > self.slow_call_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+                if failed or slow:
+                    self._transition(self.OPEN)
+                else:
+                    self._half_open_successes += 1
+                    if self._half_open_successes >= self.half_open_calls:
+                        self._transition(self.CLOSED)
+                return
+
+            if self._state != self.CLOSED:
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._outcomes if f)
+            slow_calls = sum(1 for _, s in self._outcomes if s)
+            if failures / calls >= self.error_rate or slow_calls / calls >= self.slow_call_rate:
+                self._transition(self.OPEN)
+
+    def abandon(self):
+        """Lời gọi bị Gateway tự huỷ (thua hedge) hoặc lỗi phía Gateway: trả lượt thử HALF_OPEN, không tính kết quả."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = sum(1 for f, _ in self._outcomes if f)
+            return {
+                "state": state,
+                "window_calls": calls,
+                "error_rate": round(failures / calls, 3) if calls else 0.0,
+            }
@@ -0,0 +1,79 @@
+import threading
+
+from ..metrics import COALESCED_REQUESTS, COALESCE_INFLIGHT
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Gộp các GET giống hệt nhau đang chạy đồng thời thành 1 lời gọi upstream.
+
+    Thread đầu tiên (leader) gọi upstream; các thread đến sau với cùng key (follower)
+    chờ và dùng chung kết quả (hoặc exception) của leader.
+    Kết quả phải là dữ liệu bất biến đã đọc xong (không phải response đang stream).
+    """
+
+    def __init__(self, wait_timeout=30):
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(wait_timeout=config.get('COALESCE_WAIT_TIMEOUT', 30))
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                COALESCE_INFLIGHT.inc()
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            COALESCED_REQUESTS.labels(role='follower').inc()
+            if not call.done.wait(self.wait_timeout):
+                # Leader treo quá lâu -> tự gọi upstream thay vì chờ tiếp
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        COALESCED_REQUESTS.labels(role='leader').inc()
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            COALESCE_INFLIGHT.dec()
+            call.done.set()
+
+
+class BufferedUpstreamResponse:
+    """
+    Response upstream đã đọc hết body (và trả connection về pool).
+    Bất biến -> nhiều request dùng chung được (single-flight).
+    """
+
+    def __init__(self, resp):
+        self.status_code = resp.status_code
+        self.headers = resp.headers
+        self.header_items = list(resp.raw.headers.items())
+        self.content = resp.content
+
+    def close(self):
+        pass
@@ -0,0 +1,169 @@
+import gzip
+import time
+
+from ..metrics import COMPRESSION_BYTES, COMPRESSION_CPU_SECONDS, COMPRESSION_EVENTS, COMPRESSION_RATIO
+
+# Brotli là tuỳ chọn: không cài thì chỉ dùng gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml', 'application/hal+json')
+
+
+def parse_accept_encoding(value):
+    """'br;q=1.0, gzip;q=0.8, *;q=0' -> {'br': 1.0, 'gzip': 0.8, '*': 0.0}"""
+    weights = {}
+    for part in (value or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    return weights
+
+
+def accepts_encoding(accept_encoding, encoding):
+    """Client có chấp nhận `encoding` không (theo q-value, kể cả '*')."""
+    weights = parse_accept_encoding(accept_encoding)
+    return weights.get(encoding.lower(), weights.get('*', 0.0)) > 0
+
+
+def encoded_etag(etag, encoding):
+    """
+    ETag của bản nén: '"abc"' + gzip -> '"abc-gzip"' (W/"abc" -> W/"abc-gzip").
+    Bytes khác nhau thì validator mạnh phải khác nhau (range request, cache trung gian).
+    """
+    if not etag or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def strip_etag_encoding(if_none_match):
+    """
+    If-None-Match của client -> ETag gốc của upstream (bỏ hậu tố -gzip/-br do Gateway thêm),
+    để cả 2 dạng đều khớp khi so với upstream hoặc cache của Gateway.
+    """
+    if not if_none_match:
+        return if_none_match
+    tags = []
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        for encoding in ('br', 'gzip'):
+            suffix = f'-{encoding}"'
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+                break
+        tags.append(tag)
+    return ', '.join(tags)
+
+
+class ResponseCompressor:
+    """
+    Nén response của Gateway theo Accept-Encoding của client (br ưu tiên hơn gzip).
+
+    - Chỉ nén body đã buffer, có kiểu text/JSON và >= min_bytes.
+    - Response đã có Content-Encoding (upstream nén sẵn, đi thẳng qua Gateway) giữ nguyên.
+    - Response stream (body lớn, direct_passthrough) không nén để giữ TTFB.
+    """
+
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=4):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            min_bytes=config.get('COMPRESSION_MIN_BYTES', 1024),
+            gzip_level=config.get('COMPRESSION_GZIP_LEVEL', 6),
+            brotli_quality=config.get('COMPRESSION_BROTLI_QUALITY', 4),
+        )
+
+    def negotiate(self, accept_encoding):
+        """Chọn encoding tốt nhất mà client chấp nhận (None = gửi nguyên bản)."""
+        weights = parse_accept_encoding(accept_encoding)
+        best, best_q = None, 0.0
+        for encoding in self.encodings:
+            q = weights.get(encoding, weights.get('*', 0.0))
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def compress(self, body, encoding):
+        start = time.thread_time()
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=self.gzip_level)
+        COMPRESSION_CPU_SECONDS.labels(encoding=encoding).observe(time.thread_time() - start)
+        COMPRESSION_RATIO.labels(encoding=encoding).observe(len(compressed) / len(body))
+        COMPRESSION_BYTES.labels(encoding=encoding, stage='original').inc(len(body))
+        COMPRESSION_BYTES.labels(encoding=encoding, stage='compressed').inc(len(compressed))
+        return compressed
+
+    def after_request(self, response):
+        """Hook after_request của Flask."""
+        from flask import request
+
+        if response.status_code == 304:
+            self._restore_encoded_etag(response, request.headers.get('If-None-Match'))
+            return response
+        encoded = response.headers.get('Content-Encoding')
+        if encoded:
+            # Body nén sẵn từ upstream: ETag cũng phải riêng cho bản nén
+            self._set_encoded_etag(response, encoded)
+            COMPRESSION_EVENTS.labels(event='passthrough', encoding=encoded).inc()
+            return response
+        if (
+            response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        # Body có thể nén -> cache trung gian phải phân biệt theo Accept-Encoding
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        if len(body) < self.min_bytes:
+            COMPRESSION_EVENTS.labels(event='too_small', encoding='identity').inc()
+            return response
+        encoding = self.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            COMPRESSION_EVENTS.labels(event='not_accepted', encoding='identity').inc()
+            return response
+
+        response.set_data(self.compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        self._set_encoded_etag(response, encoding)
+        COMPRESSION_EVENTS.labels(event='compressed', encoding=encoding).inc()
+        return response
+
+    @staticmethod
+    def _set_encoded_etag(response, encoding):
+        etag = response.headers.get('ETag')
+        if etag:
+            response.headers['ETag'] = encoded_etag(etag, encoding)
+
+    @staticmethod
+    def _restore_encoded_etag(response, if_none_match):
+        """304: trả lại đúng ETag (bản nén) mà client đang giữ thay vì ETag gốc của upstream."""
+        etag = response.headers.get('ETag')
+        if not etag or not if_none_match:
+            return
+        client_tags = {tag.strip() for tag in if_none_match.split(',')}
+        for encoding in ('br', 'gzip'):
+            variant = encoded_etag(etag, encoding)
+            if variant in client_tags:
+                response.headers['ETag'] = variant
+                return
+
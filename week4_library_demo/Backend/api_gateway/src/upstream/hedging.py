@@ -0,0 +1,202 @@
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ..metrics import HEDGE_REQUESTS, HEDGE_WINS
+from ..timing import collect_phases, record_phase
+
+
+_local = threading.local()
+
+
+def current_attempt():
+    """Attempt của lần gửi đang chạy trong thread hiện tại (None nếu không qua Hedger)."""
+    return getattr(_local, 'attempt', None)
+
+
+class Attempt:
+    """
+    Handle huỷ 1 lần gửi (request chính hoặc hedge). UpstreamPool gắn connection đang dùng
+    vào đây; cancel() shutdown socket đó để lần gửi đang chờ header kết thúc ngay thay vì
+    giữ connection + thread tới read timeout.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.phases = {}   # upstream_connect / upstream_ttfb của riêng lần gửi này
+        self._finished = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        with self._lock:
+            self._conn = conn
+            abort = self.cancelled and not self._finished
+        if abort:
+            self._abort(conn)
+
+    def finish(self):
+        # Đã có header -> connection thuộc về response; chỉ đóng qua response.close()
+        with self._lock:
+            self._finished = True
+            self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conn = None if self._finished else self._conn
+        if conn is not None:
+            self._abort(conn)
+
+    @staticmethod
+    def _abort(conn):
+        sock = getattr(conn, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _close_response(future):
+    """Request thua cuộc đã có header: đóng response (huỷ connection) ngay khi nó về."""
+    if future.exception() is None:
+        future.result().close()
+
+
+class Hedger:
+    """
+    Hedged request cho các GET idempotent (danh sách sách, chi tiết sách).
+
+    - Gửi request chính; nếu quá `percentile` (vd p95) độ trễ gần đây mà chưa có header,
+      gửi thêm 1 request dự phòng (load balancer thường chọn replica khác vì replica đầu
+      đang có thêm 1 request outstanding).
+    - Dùng response về trước; request thua bị huỷ ngay (shutdown socket nếu chưa có header,
+      đóng response nếu đã có).
+    - Hedge phải lấy slot bulkhead riêng (không chờ): bulkhead hết chỗ thì không hedge.
+    - Budget kiểu token bucket: mỗi request chính nạp `budget_ratio` token, mỗi hedge tiêu
+      1 token -> tải phát sinh không vượt quá ~budget_ratio lưu lượng.
+    """
+
+    def __init__(self, percentile=0.95, min_delay=0.01, initial_delay=0.1, window=200,
+                 min_samples=20, budget_ratio=0.05, max_tokens=10, max_workers=32):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.max_tokens = max_tokens
+
+        self._latencies = {}
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gateway-hedge")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            percentile=config.get('HEDGE_PERCENTILE', 0.95),
+            min_delay=config.get('HEDGE_MIN_DELAY', 0.01),
+            initial_delay=config.get('HEDGE_INITIAL_DELAY', 0.1),
+            budget_ratio=config.get('HEDGE_BUDGET_RATIO', 0.05),
+            max_workers=config.get('HEDGE_MAX_WORKERS', 32),
+        )
+
+    def delay(self, route):
+        """Ngưỡng hedge = percentile độ trễ (tới header) của các request chính gần đây."""
+        with self._lock:
+            samples = sorted(self._latencies.get(route, ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        return max(samples[min(int(len(samples) * self.percentile), len(samples) - 1)], self.min_delay)
+
+    def _observe(self, route, seconds):
+        with self._lock:
+            self._latencies.setdefault(route, deque(maxlen=self.window)).append(seconds)
+
+    def _spend_token(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.budget_ratio, self.max_tokens)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def _earn_token(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.budget_ratio, self.max_tokens)
+
+    @staticmethod
+    def _attempt(send, attempt):
+        _local.attempt = attempt
+        try:
+            with collect_phases(attempt.phases):
+                return send()
+        finally:
+            attempt.finish()
+            _local.attempt = None
+
+    @staticmethod
+    def _result(future, attempt):
+        """Kết quả của lần gửi được dùng; pha của nó được ghi vào request hiện tại
+        -> Server-Timing cùng nghĩa với route không hedge."""
+        try:
+            return future.result()
+        finally:
+            for name, seconds in attempt.phases.items():
+                record_phase(name, seconds)
+
+    def run(self, route, send, bulkhead=None):
+        """
+        `send()` gửi request (stream=True) và trả về response đã có header.
+        Chạy trong thread pool riêng -> `send` không được dùng request context của Flask.
+        `bulkhead`: bulkhead của upstream; request chính đã giữ 1 slot, hedge cần slot thứ 2.
+        """
+        start = time.perf_counter()
+
+        def observe_primary(future):
+            # Ghi cả khi request chính thua hedge -> phân phối độ trễ không bị lệch
+            if future.exception() is None:
+                self._observe(route, time.perf_counter() - start)
+
+        primary_attempt = Attempt()
+        primary = self._executor.submit(self._attempt, send, primary_attempt)
+        primary.add_done_callback(observe_primary)
+
+        done, _ = wait([primary], timeout=self.delay(route))
+        if done:
+            self._earn_token()
+            HEDGE_REQUESTS.labels(route=route, outcome='not_needed').inc()
+            return self._result(primary, primary_attempt)
+        if bulkhead is not None and not bulkhead.try_acquire():
+            HEDGE_REQUESTS.labels(route=route, outcome='bulkhead_full').inc()
+            return self._result(primary, primary_attempt)
+        if not self._spend_token():
+            if bulkhead is not None:
+                bulkhead.release()
+            HEDGE_REQUESTS.labels(route=route, outcome='budget_exhausted').inc()
+            return self._result(primary, primary_attempt)
+
+        HEDGE_REQUESTS.labels(route=route, outcome='hedged').inc()
+        hedge_attempt = Attempt()
+        hedge = self._executor.submit(self._attempt, send, hedge_attempt)
+        attempts = {primary: primary_attempt, hedge: hedge_attempt}
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner = primary if primary in done else hedge
+        loser = hedge if winner is primary else primary
+        if winner.exception() is not None:
+            # Request về trước bị lỗi -> vẫn còn cơ hội với request kia
+            winner, loser = loser, winner
+            wait([winner])
+
+        if winner.exception() is None:
+            attempts[loser].cancel()
+            loser.add_done_callback(_close_response)
+        if bulkhead is not None:
+            # Slot thứ 2 được trả khi lần gửi thua kết thúc (chỉ còn 1 request tới upstream)
+            loser.add_done_callback(lambda _: bulkhead.release())
+        HEDGE_WINS.labels(route=route, winner='primary' if winner is primary else 'hedge').inc()
+        return self._result(winner, attempts[winner])
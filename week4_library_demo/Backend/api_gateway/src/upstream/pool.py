@@ -0,0 +1,233 @@
+import socket
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+
+from ..metrics import UPSTREAM_CONNECTIONS_OPENED, UPSTREAM_POOL_REQUESTS, UPSTREAM_POOL_WAIT
+from ..timing import phase_total, record_phase
+from .balancer import HealthProber, ReplicaSet, parse_replicas
+from .circuit_breaker import CircuitBreaker
+from .hedging import current_attempt
+
+
+def _instrument_pool_class(base, upstream_name, pool_timeout):
+    """
+    Tạo subclass của urllib3 ConnectionPool có đo:
+    - thời gian chờ lấy connection rảnh (pool wait),
+    - số connection TCP mới được mở (để tính tỉ lệ tái sử dụng).
+    Thời gian chờ pool + bắt tay TCP được cộng vào pha 'upstream_connect' của request.
+    Connection đang dùng được gắn vào Attempt của Hedger (nếu có) để huỷ được lần gửi thua.
+    """
+    def _get_conn(self, timeout=None):
+        start = time.perf_counter()
+        try:
+            # requests không truyền pool_timeout -> tự đặt để không chờ vô hạn
+            conn = base._get_conn(self, timeout=timeout if timeout is not None else pool_timeout)
+            attempt = current_attempt()
+            if attempt is not None:
+                attempt.attach(conn)
+            return conn
+        finally:
+            waited = time.perf_counter() - start
+            UPSTREAM_POOL_WAIT.labels(upstream=upstream_name).observe(waited)
+            UPSTREAM_POOL_REQUESTS.labels(upstream=upstream_name).inc()
+            record_phase('upstream_connect', waited)
+
+    def _new_conn(self):
+        UPSTREAM_CONNECTIONS_OPENED.labels(upstream=upstream_name).inc()
+        return base._new_conn(self)
+
+    def connect(conn):
+        start = time.perf_counter()
+        try:
+            return base.ConnectionCls.connect(conn)
+        finally:
+            record_phase('upstream_connect', time.perf_counter() - start)
+            # Bị huỷ trong lúc đang bắt tay -> attach lại để đóng socket vừa mở
+            attempt = current_attempt()
+            if attempt is not None:
+                attempt.attach(conn)
+
+    connection_cls = type(f"Timed{base.ConnectionCls.__name__}", (base.ConnectionCls,), {'connect': connect})
+    return type(f"Instrumented{base.__name__}", (base,), {
+        '_get_conn': _get_conn, '_new_conn': _new_conn, 'ConnectionCls': connection_cls,
+    })
+
+
+class _PooledAdapter(HTTPAdapter):
+    def __init__(self, upstream_name, pool_timeout, socket_options, **kwargs):
+        self.upstream_name = upstream_name
+        self.pool_timeout = pool_timeout
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.socket_options is not None:
+            pool_kwargs['socket_options'] = self.socket_options
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _instrument_pool_class(HTTPConnectionPool, self.upstream_name, self.pool_timeout),
+            'https': _instrument_pool_class(HTTPSConnectionPool, self.upstream_name, self.pool_timeout),
+        }
+
+
+class UpstreamPool:
+    """
+    Một connection pool keep-alive (requests.Session) cho MỖI upstream service.
+    Mọi request tới cùng service dùng lại các kết nối TCP đã mở thay vì bắt tay lại.
+
+    Caller chỉ truyền path (vd: 'books/5'); pool ghép với replica được ReplicaSet chọn
+    (base_url có thể là danh sách replica ngăn cách bởi dấu phẩy).
+    """
+
+    def __init__(self, name, base_url, pool_size=20, pool_timeout=5,
+                 connect_timeout=3, read_timeout=10, keepalive=True, keepalive_idle=60,
+                 breaker=None, replicas=None):
+        self.name = name
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive = keepalive
+        self.breaker = breaker
+        urls = parse_replicas(base_url)
+        self.replicas = replicas if replicas is not None or not urls else ReplicaSet(name, urls)
+
+        socket_options = None
+        if keepalive:
+            socket_options = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, keepalive_idle))
+
+        adapter = _PooledAdapter(
+            name, pool_timeout, socket_options,
+            # Mỗi replica (host) một pool con, tránh bị PoolManager đẩy ra khi xoay vòng replica
+            pool_connections=max(len(self.replicas.replicas) if self.replicas else 1, 1),
+            pool_maxsize=pool_size, pool_block=True,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def request(self, method, path, **kwargs):
+        """Gửi `method` tới <replica>/<path> của upstream này."""
+        if self.replicas is None:
+            raise requests.exceptions.InvalidURL(f"No URL configured for upstream '{self.name}'")
+        kwargs.setdefault('timeout', self.timeout)
+        if not self.keepalive:
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers['Connection'] = 'close'
+            kwargs['headers'] = headers
+
+        # Circuit breaker: fail-fast khi mạch mở, ghi nhận lỗi (5xx/timeout/...) và độ trễ
+        if self.breaker is not None:
+            self.breaker.before_call()
+
+        # Cân bằng tải: chọn replica cho lần gửi này
+        replica = self.replicas.pick()
+        url = f"{replica.url}/{path.lstrip('/')}"
+
+        connect_before = phase_total('upstream_connect')
+        start = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except (requests.exceptions.RequestException, EmptyPoolError):
+            elapsed = time.perf_counter() - start
+            # Lần gửi thua hedge bị Gateway chủ động huỷ: không phải lỗi của upstream
+            attempt = current_attempt()
+            failed = attempt is None or not attempt.cancelled
+            if self.breaker is not None and failed:
+                self.breaker.record(True, elapsed)
+            elif self.breaker is not None:
+                self.breaker.abandon()
+            self.replicas.release(replica, failed, elapsed)
+            raise
+        except BaseException:
+            # Lỗi phía Gateway (kwarg sai, KeyboardInterrupt...): không tính cho upstream
+            # nhưng vẫn trả slot half-open và outstanding của replica
+            if self.breaker is not None:
+                self.breaker.abandon()
+            self.replicas.release(replica, False, time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        if self.breaker is not None:
+            self.breaker.record(resp.status_code >= 500, elapsed)
+        self.replicas.release(replica, resp.status_code >= 500, elapsed)
+        # stream=True: request() trả về ngay khi có header -> TTFB = tổng - thời gian connect
+        record_phase('upstream_ttfb', elapsed - (phase_total('upstream_connect') - connect_before))
+        return resp
+
+    def close(self):
+        self.session.close()
+
+
+class UpstreamRegistry:
+    """Quản lý các UpstreamPool theo tên service (auth/book/transaction)."""
+
+    SERVICES = {
+        'auth': 'AUTH_SERVICE',
+        'book': 'BOOK_SERVICE',
+        'transaction': 'TRANSACTION_SERVICE',
+    }
+
+    def __init__(self, pools, prober=None):
+        self._pools = pools
+        self.prober = prober
+
+    @classmethod
+    def from_config(cls, config):
+        pools = {}
+        for name, prefix in cls.SERVICES.items():
+            base_url = config.get(f'{prefix}_URL')
+            urls = parse_replicas(base_url)
+            replicas = ReplicaSet(
+                name, urls,
+                strategy=config.get('UPSTREAM_LB_STRATEGY', 'p2c'),
+                eject_after=config.get('UPSTREAM_EJECT_AFTER', 3),
+                eject_seconds=config.get('UPSTREAM_EJECT_SECONDS', 30),
+            ) if urls else None
+            pools[name] = UpstreamPool(
+                name,
+                base_url,
+                pool_size=config.get(f'{prefix}_POOL_SIZE') or config.get('UPSTREAM_POOL_SIZE', 20),
+                pool_timeout=config.get('UPSTREAM_POOL_TIMEOUT', 5),
+                connect_timeout=config.get('UPSTREAM_CONNECT_TIMEOUT', 3),
+                read_timeout=config.get(f'{prefix}_TIMEOUT') or config.get('UPSTREAM_READ_TIMEOUT', 10),
+                keepalive=config.get('UPSTREAM_KEEPALIVE', True),
+                keepalive_idle=config.get('UPSTREAM_KEEPALIVE_IDLE', 60),
+                breaker=CircuitBreaker.from_config(name, config) if config.get('CIRCUIT_BREAKER_ENABLED', True) else None,
+                replicas=replicas,
+            )
+
+        # Chỉ cần probe khi upstream có từ 2 replica trở lên (1 replica thì không có gì để loại)
+        replica_sets = [pool.replicas for pool in pools.values() if pool.replicas and len(pool.replicas.replicas) > 1]
+        prober = None
+        if replica_sets and config.get('UPSTREAM_HEALTH_INTERVAL', 5) > 0:
+            prober = HealthProber(
+                replica_sets,
+                interval=config.get('UPSTREAM_HEALTH_INTERVAL', 5),
+                timeout=config.get('UPSTREAM_HEALTH_TIMEOUT', 1),
+            )
+            prober.start()
+        return cls(pools, prober)
+
+    def get(self, name):
+        return self._pools[name]
+
+    def __iter__(self):
+        return iter(self._pools.values())
+
+    def replica_states(self):
+        return {pool.name: pool.replicas.states() for pool in self if pool.replicas is not None}
+
+    def breaker_states(self):
+        return {pool.name: pool.breaker.snapshot() for pool in self if pool.breaker is not None}
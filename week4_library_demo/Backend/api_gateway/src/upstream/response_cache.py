@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response
+
+from ..metrics import RESPONSE_CACHE_BYTES, RESPONSE_CACHE_EVENTS
+
+
+def parse_cache_control(value):
+    """'public, max-age=60' -> {'public': True, 'max-age': '60'}"""
+    directives = {}
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition('=')
+        directives[name.strip().lower()] = arg.strip().strip('"') or True
+    return directives
+
+
+class CachedResponse:
+    def __init__(self, status, headers, body, etag, max_age):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.max_age = max_age
+        self.stored_at = time.time()
+
+    @property
+    def size(self):
+        return len(self.body)
+
+    @property
+    def age(self):
+        return time.time() - self.stored_at
+
+    def is_fresh(self):
+        return self.age < self.max_age
+
+
+class ResponseCache:
+    """
+    HTTP cache phía Gateway cho các response 'public, max-age=N' có ETag (book_service).
+
+    - Còn trong max-age: trả thẳng từ RAM, không gọi upstream.
+    - Hết max-age: revalidate bằng If-None-Match; upstream trả 304 -> làm mới entry, trả local.
+    - Key gồm URL upstream + query (kể cả ?v=) + header Accept (version negotiation).
+    - Giới hạn tổng số byte, LRU eviction.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entry_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_bytes=config.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+            max_entry_bytes=config.get('RESPONSE_CACHE_MAX_ENTRY_BYTES', 1024 * 1024),
+        )
+
+    @staticmethod
+    def key(resource, args, accept):
+        """resource: '<upstream>/<path>' (vd: 'book/books/5'), không phụ thuộc replica."""
+        query = '&'.join(f"{k}={v}" for k, v in sorted(args.items(multi=True)))
+        return f"{resource}?{query}|{accept or ''}"
+
+    @staticmethod
+    def cacheable_max_age(resp):
+        """Trả về max-age nếu response được phép cache ở Gateway, ngược lại None."""
+        if resp.status_code != 200 or not resp.headers.get('ETag'):
+            return None
+        directives = parse_cache_control(resp.headers.get('Cache-Control'))
+        if 'public' not in directives or 'no-store' in directives or 'private' in directives:
+            return None
+        try:
+            max_age = int(directives.get('max-age', 0))
+        except ValueError:
+            return None
+        return max_age if max_age > 0 else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            RESPONSE_CACHE_EVENTS.labels(event='miss').inc()
+        return entry
+
+    def put(self, key, entry):
+        if entry.size > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                RESPONSE_CACHE_EVENTS.labels(event='eviction').inc()
+            RESPONSE_CACHE_BYTES.set(self._bytes)
+        RESPONSE_CACHE_EVENTS.labels(event='store').inc()
+
+    def refresh(self, entry, resp):
+        """Upstream trả 304 -> entry cũ vẫn đúng, tính lại max-age từ header mới (nếu có)."""
+        directives = parse_cache_control(resp.headers.get('Cache-Control'))
+        try:
+            entry.max_age = int(directives.get('max-age', entry.max_age))
+        except ValueError:
+            pass
+        entry.stored_at = time.time()
+        RESPONSE_CACHE_EVENTS.labels(event='revalidated').inc()
+
+    def purge(self, prefix=None):
+        """Xoá toàn bộ (hoặc theo prefix của URL upstream). Trả về số entry đã xoá."""
+        with self._lock:
+            keys = [k for k in self._entries if prefix is None or k.startswith(prefix)]
+            for k in keys:
+                self._bytes -= self._entries.pop(k).size
+            RESPONSE_CACHE_BYTES.set(self._bytes)
+        RESPONSE_CACHE_EVENTS.labels(event='purge').inc(len(keys))
+        return len(keys)
+
+    def serve(self, entry, if_none_match=None):
+        """Tạo Flask Response từ entry (304 nếu ETag của client còn khớp)."""
+        RESPONSE_CACHE_EVENTS.labels(event='hit').inc()
+        client_tags = {tag.strip() for tag in (if_none_match or '').split(',')}
+        if entry.etag in client_tags or '*' in client_tags:
+            return Response(status=304, headers=[('ETag', entry.etag), ('X-Cache', 'HIT')])
+        headers = entry.headers + [('Age', str(int(entry.age))), ('X-Cache', 'HIT')]
+        return Response(entry.body, entry.status, headers)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
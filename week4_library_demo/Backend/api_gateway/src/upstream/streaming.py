@@ -0,0 +1,54 @@
+import logging
+
+import requests
+from urllib3.exceptions import HTTPError
+
+logger = logging.getLogger("GatewayStreaming")
+
+
+class RequestBodyStream:
+    """
+    Đọc body của client theo từng chunk (bộ đệm giới hạn) để chuyển thẳng lên upstream,
+    thay vì request.get_data() nạp toàn bộ body vào RAM.
+
+    Có __len__ khi client gửi Content-Length -> requests giữ nguyên Content-Length;
+    nếu không (client gửi chunked) requests sẽ tự chuyển tiếp dạng chunked.
+    """
+
+    def __init__(self, stream, content_length, chunk_size):
+        self._stream = stream
+        self._content_length = content_length
+        self._chunk_size = chunk_size
+
+    def __len__(self):
+        return self._content_length
+
+    def __iter__(self):
+        while True:
+            chunk = self._stream.read(self._chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def chunked_request_body(stream, chunk_size):
+    """Dùng khi không biết trước độ dài body (client gửi Transfer-Encoding: chunked)."""
+    return iter(RequestBodyStream(stream, 0, chunk_size))
+
+
+def iter_upstream_body(resp, chunk_size, decode=True):
+    """
+    Chuyển tiếp body của upstream tới client ngay khi có dữ liệu
+    -> time-to-first-byte bám theo upstream, không phụ thuộc kích thước body.
+    decode=False: giữ nguyên bytes đã nén (Content-Encoding) của upstream.
+    """
+    chunks = resp.iter_content(chunk_size=chunk_size) if decode else resp.raw.stream(chunk_size, decode_content=False)
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+    except (requests.exceptions.RequestException, HTTPError) as e:
+        # Header đã gửi đi rồi, không thể đổi status -> chỉ log và cắt kết nối
+        logger.error(f"Upstream stream interrupted: {e}")
+    finally:
+        resp.close()
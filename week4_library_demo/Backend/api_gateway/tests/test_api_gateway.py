@@ -0,0 +1,810 @@
+import pytest
+import threading
+import time
+from functools import partial
+import jwt
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from jwt.algorithms import OKPAlgorithm
+
+# Import các lớp cần test
+from src.auth.jwt_verifier import (
+    LocalTokenVerifier, JwksKeySource, EXPIRED_TOKEN_MESSAGE, INVALID_TOKEN_MESSAGE
+)
+from src.auth.token_cache import TokenValidationCache
+from library_common.rate_limit_storage import MmapStorage
+from src.upstream.compression import ResponseCompressor, accepts_encoding, strip_etag_encoding
+from src.upstream.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.upstream.response_cache import CachedResponse, ResponseCache
+from src.upstream.coalescing import SingleFlight
+from src.upstream.bulkhead import Bulkhead, BulkheadFullError, BulkheadRegistry
+from src.upstream.hedging import Hedger
+from src.upstream.pool import UpstreamPool, UpstreamRegistry
+from src.upstream.balancer import ReplicaSet, parse_replicas
+
+SECRET = 'test-gateway-shared-secret-0123456789'
+
+# ====================================================================
+# PHẦN SETUP (FIXTURES)
+# ====================================================================
+
+def make_token(key=SECRET, algorithm='HS256', kid=None, minutes=15, **claims):
+    payload = {
+        'sub': 'user-uuid-123',
+        'role': 'user',
+        'exp': datetime.utcnow() + timedelta(minutes=minutes),
+    }
+    payload.update(claims)
+    headers = {'kid': kid} if kid else None
+    return jwt.encode(payload, key, algorithm=algorithm, headers=headers)
+
+@pytest.fixture
+def verifier():
+    """Verifier HS256 dùng chung secret với Auth Service"""
+    return LocalTokenVerifier(hs_secret=SECRET, allowed_roles=['user', 'admin'])
+
+@pytest.fixture
+def eddsa_key():
+    return ed25519.Ed25519PrivateKey.generate()
+
+def jwks_response(mocker, status_code=200, keys=(), etag='"v1"', max_age=300):
+    resp = mocker.Mock()
+    resp.status_code = status_code
+    resp.headers = {'ETag': etag, 'Cache-Control': f'public, max-age={max_age}'}
+    resp.json.return_value = {'keys': list(keys)}
+    return resp
+
+def to_jwk(private_key, kid):
+    jwk = OKPAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk.update({'kid': kid, 'alg': 'EdDSA', 'use': 'sig'})
+    return jwk
+
+# ====================================================================
+# TEST: Xác thực token tại Gateway (LocalTokenVerifier)
+# ====================================================================
+
+def test_verifier_accepts_valid_hs256_token(verifier):
+    """Test Happy Path: Token hợp lệ -> Gateway tự kết luận, trả về user"""
+    decided, user_data, error = verifier.verify(make_token(role='admin'))
+
+    assert decided is True
+    assert error is None
+    assert user_data == {'user_id': 'user-uuid-123', 'role': 'admin'}
+
+def test_verifier_rejects_expired_token(verifier):
+    """Test Sad Path: Token hết hạn -> lỗi giống hệt Auth Service"""
+    decided, user_data, error = verifier.verify(make_token(minutes=-1))
+
+    assert (decided, user_data, error) == (True, None, EXPIRED_TOKEN_MESSAGE)
+
+def test_verifier_rejects_bad_signature_and_garbage(verifier):
+    """Test Sad Path: Sai chữ ký / không phải JWT -> không hợp lệ"""
+    assert verifier.verify(make_token(key='another-gateway-secret-0123456789abc')) == (True, None, INVALID_TOKEN_MESSAGE)
+    assert verifier.verify('not-a-jwt') == (True, None, INVALID_TOKEN_MESSAGE)
+
+def test_verifier_rejects_token_without_role(verifier):
+    """Test Sad Path: Thiếu role -> không hợp lệ"""
+    token = jwt.encode(
+        {'sub': 'user-uuid-123', 'exp': datetime.utcnow() + timedelta(minutes=5)}, SECRET, algorithm='HS256'
+    )
+
+    assert verifier.verify(token) == (True, None, INVALID_TOKEN_MESSAGE)
+
+def test_verifier_defers_unknown_role_and_unknown_key(verifier, eddsa_key):
+    """Role lạ hoặc không có key cho alg/kid -> chưa kết luận, để Auth Service quyết định"""
+    assert verifier.verify(make_token(role='librarian')) == (False, None, None)
+    assert verifier.verify(make_token(eddsa_key, 'EdDSA', kid='k1')) == (False, None, None)
+
+def test_verifier_uses_jwks_and_refetches_on_unknown_kid(mocker, eddsa_key):
+    """JWKS tải lười; kid mới (xoay key) -> tải lại ngay, nhưng tối đa 1 lần / min_refresh_interval"""
+    new_key = ed25519.Ed25519PrivateKey.generate()
+    mock_get = mocker.patch('src.auth.jwt_verifier.requests.get', side_effect=[
+        jwks_response(mocker, keys=[to_jwk(eddsa_key, 'k1')]),
+        jwks_response(mocker, keys=[to_jwk(eddsa_key, 'k1'), to_jwk(new_key, 'k2')], etag='"v2"'),
+    ])
+    jwks = JwksKeySource('http://auth/auth/.well-known/jwks.json', min_refresh_interval=0)
+    verifier = LocalTokenVerifier(jwks=jwks)
+
+    decided, user_data, error = verifier.verify(make_token(eddsa_key, 'EdDSA', kid='k1'))
+    assert (decided, error) == (True, None)
+    assert mock_get.call_count == 1
+
+    decided, user_data, error = verifier.verify(make_token(new_key, 'EdDSA', kid='k2'))
+    assert (decided, user_data['user_id']) == (True, 'user-uuid-123')
+    assert mock_get.call_count == 2
+    # Lần tải lại gửi ETag cũ để nhận 304 khi key không đổi
+    assert mock_get.call_args.kwargs['headers'] == {'If-None-Match': '"v1"'}
+
+def test_verifier_rejects_token_signed_by_other_key_with_known_kid(mocker, eddsa_key):
+    """Test Sad Path: kid có trong JWKS nhưng chữ ký bằng key khác -> không hợp lệ"""
+    mocker.patch('src.auth.jwt_verifier.requests.get',
+                 return_value=jwks_response(mocker, keys=[to_jwk(eddsa_key, 'k1')]))
+    verifier = LocalTokenVerifier(jwks=JwksKeySource('http://auth/jwks'))
+    forged = make_token(ed25519.Ed25519PrivateKey.generate(), 'EdDSA', kid='k1')
+
+    assert verifier.verify(forged) == (True, None, INVALID_TOKEN_MESSAGE)
+
+def test_jwks_keeps_old_keys_when_fetch_fails(mocker, eddsa_key):
+    """Lỗi mạng khi tải lại JWKS -> giữ nguyên bộ key cũ"""
+    import requests
+    mocker.patch('src.auth.jwt_verifier.requests.get', side_effect=[
+        jwks_response(mocker, keys=[to_jwk(eddsa_key, 'k1')], max_age=0),
+        requests.exceptions.ConnectionError("auth down"),
+    ])
+    jwks = JwksKeySource('http://auth/jwks', min_refresh_interval=0)
+
+    assert jwks.get('k1') is not None
+    time.sleep(0.01)
+    assert jwks.get('k1') is not None
+
+# ====================================================================
+# TEST: Cache kết quả xác thực remote (TokenValidationCache)
+# ====================================================================
+
+def test_token_cache_hit_and_negative_hit():
+    cache = TokenValidationCache(max_entries=10, ttl=60, negative_ttl=5)
+    token = make_token()
+
+    assert cache.get(token) == (False, None, None)
+    cache.put(token, {'user_id': 'user-uuid-123', 'role': 'user'}, None)
+    assert cache.get(token) == (True, {'user_id': 'user-uuid-123', 'role': 'user'}, None)
+
+    cache.put('bad-token', None, INVALID_TOKEN_MESSAGE)
+    assert cache.get('bad-token') == (True, None, INVALID_TOKEN_MESSAGE)
+
+def test_token_cache_never_outlives_token_exp(mocker):
+    """Entry hợp lệ không sống quá 'exp' của token dù ttl còn dài"""
+    cache = TokenValidationCache(ttl=3600)
+    token = jwt.encode({'sub': 'u', 'role': 'user', 'exp': int(time.time()) + 30}, SECRET, algorithm='HS256')
+    cache.put(token, {'user_id': 'u', 'role': 'user'}, None)
+
+    mocker.patch('src.auth.token_cache.time.time', return_value=time.time() + 31)
+    assert cache.get(token) == (False, None, None)
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenValidationCache(max_entries=2)
+    a, b, c = (make_token(sub=name) for name in 'abc')
+    cache.put(a, {'user_id': 'a'}, None)
+    cache.put(b, {'user_id': 'b'}, None)
+    cache.get(a)  # a vừa dùng -> b là LRU
+    cache.put(c, {'user_id': 'c'}, None)
+
+    assert cache.get(a)[0] is True
+    assert cache.get(b)[0] is False
+    assert cache.get(c)[0] is True
+
+# ====================================================================
+# TEST: Bulkhead + load shedding
+# ====================================================================
+
+def test_bulkhead_queues_then_sheds_on_queue_timeout():
+    """Hết slot -> chờ trong hàng đợi; chờ quá queue_target -> shed"""
+    bulkhead = Bulkhead('books', max_concurrent=1, max_queue=5, queue_target=0.05)
+    bulkhead.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(BulkheadFullError) as exc:
+        bulkhead.acquire()
+    assert exc.value.reason == 'queue_timeout'
+    assert time.monotonic() - start >= 0.05
+
+    # Slot được trả -> request đang chờ chạy được
+    import threading
+    threading.Timer(0.01, bulkhead.release).start()
+    bulkhead.queue_target = 1
+    bulkhead.acquire()
+    assert bulkhead.snapshot() == {'in_flight': 1, 'queued': 0, 'max_concurrent': 1}
+
+def test_bulkhead_sheds_when_queue_full():
+    """max_queue=0: không xếp hàng, shed ngay khi hết slot"""
+    bulkhead = Bulkhead('auth', max_concurrent=1, max_queue=0, queue_target=5)
+    with bulkhead.slot():
+        with pytest.raises(BulkheadFullError) as exc:
+            bulkhead.acquire()
+        assert exc.value.reason == 'queue_full'
+    assert bulkhead.snapshot()['in_flight'] == 0
+
+def test_bulkhead_registry_keeps_explicit_zero_queue():
+    """BULKHEAD_BOOKS_MAX_QUEUE=0 không bị thay bằng giá trị mặc định"""
+    registry = BulkheadRegistry.from_config({
+        'BULKHEAD_MAX_QUEUE': 20,
+        'BULKHEAD_BOOKS_MAX_QUEUE': 0,
+        'BULKHEAD_AUTH_MAX_CONCURRENT': None,
+    })
+
+    assert registry.get('book').max_queue == 0
+    assert registry.get('auth').max_queue == 20
+    assert registry.get('auth').max_concurrent == 20
+
+# ====================================================================
+# TEST: Circuit breaker
+# ====================================================================
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker('book', window_size=4, min_calls=4, error_rate=0.5,
+                          slow_call_seconds=1.0, slow_call_rate=1.0, open_seconds=10, half_open_calls=2)
+
+def test_breaker_opens_on_error_rate_and_fails_fast(breaker):
+    """CLOSED -> OPEN khi tỉ lệ lỗi >= error_rate (sau min_calls); OPEN -> từ chối ngay"""
+    for failed in (False, True, False):
+        breaker.before_call()
+        breaker.record(failed, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED   # chưa đủ min_calls
+
+    breaker.before_call()
+    breaker.record(True, 0.01)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.before_call()
+    assert 0 < exc.value.retry_after <= 10
+
+def test_breaker_opens_on_slow_calls(breaker):
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record(False, 2.0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_breaker_half_open_closes_after_successful_probes(breaker, mocker):
+    """Hết open_seconds -> HALF_OPEN, tối đa half_open_calls lời gọi thử; tất cả OK -> CLOSED"""
+    for _ in range(4):
+        breaker.record(True, 0.01)
+    mocker.patch('src.upstream.circuit_breaker.time.monotonic', return_value=time.monotonic() + 11)
+
+    breaker.before_call()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()   # vượt half_open_calls
+
+    breaker.record(False, 0.01)
+    breaker.record(False, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()['window_calls'] == 0
+
+def test_breaker_half_open_reopens_on_failure(breaker, mocker):
+    for _ in range(4):
+        breaker.record(True, 0.01)
+    mocker.patch('src.upstream.circuit_breaker.time.monotonic', return_value=time.monotonic() + 11)
+
+    breaker.before_call()
+    breaker.record(True, 0.01)
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_pool_releases_half_open_slot_and_replica_on_gateway_error(breaker, mocker):
+    """Lỗi không phải RequestException (vd: kwarg sai) vẫn trả lượt thử HALF_OPEN + outstanding"""
+    for _ in range(4):
+        breaker.record(True, 0.01)
+    mocker.patch('src.upstream.circuit_breaker.time.monotonic', return_value=time.monotonic() + 11)
+    pool = UpstreamPool('book', 'http://book-1:5000', breaker=breaker)
+    mocker.patch.object(pool.session, 'request', side_effect=TypeError("unexpected keyword argument"))
+
+    for _ in range(3):   # > half_open_calls: lượt thử không bị giữ lại sau mỗi lỗi
+        with pytest.raises(TypeError):
+            pool.request('GET', 'books', bogus=1)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert pool.replicas.states()[0]['outstanding'] == 0
+
+# ====================================================================
+# TEST: Storage rate limit mmap (dùng chung giữa các worker)
+# ====================================================================
+
+def _hit_counter(storage, times):
+    for _ in range(times):
+        storage.incr('LIMITER/127.0.0.1/api', 3600)
+
+def test_mmap_storage_counter_shared_across_processes(tmp_path):
+    """Worker fork sau khi tạo storage vẫn đếm chung 1 bộ đếm, không mất lượt nào"""
+    import multiprocessing
+    uri = f"mmap://{tmp_path}/ratelimit.mmap?slots=1024"
+    storage = MmapStorage(uri)
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=_hit_counter, args=(storage, 200)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+        assert worker.exitcode == 0
+
+    assert storage.get('LIMITER/127.0.0.1/api') == 800
+    # Process khác mở cùng file (vd: gunicorn restart worker) thấy cùng giá trị
+    assert MmapStorage(uri).get('LIMITER/127.0.0.1/api') == 800
+
+def test_mmap_storage_expiry_and_clear(tmp_path, mocker):
+    storage = MmapStorage(f"mmap://{tmp_path}/ratelimit.mmap?slots=64")
+    storage.incr('k', 60)
+    storage.incr('k', 60)
+    assert storage.get('k') == 2
+
+    mocker.patch('library_common.rate_limit_storage.time.time', return_value=time.time() + 61)
+    assert storage.get('k') == 0
+    storage.incr('k', 60)
+    storage.clear('k')
+    assert storage.get('k') == 0
+
+# ====================================================================
+# TEST: Nén response + ETag theo từng encoding
+# ====================================================================
+
+@pytest.fixture
+def compressed_app():
+    """App Flask tối giản chỉ gắn hook nén của Gateway"""
+    from flask import Flask, Response, request
+    app = Flask(__name__)
+    app.after_request(ResponseCompressor(min_bytes=10).after_request)
+
+    @app.route('/books')
+    def books():
+        if request.headers.get('If-None-Match') == '"e1"':
+            return Response(status=304, headers={'ETag': '"e1"'})
+        return Response('{"books": "' + 'x' * 200 + '"}', mimetype='application/json', headers={'ETag': '"e1"'})
+
+    return app.test_client()
+
+def test_compressed_body_gets_its_own_etag(compressed_app):
+    """Bản gzip và bản gốc khác bytes -> ETag mạnh khác nhau"""
+    gzipped = compressed_app.get('/books', headers={'Accept-Encoding': 'gzip'})
+    plain = compressed_app.get('/books', headers={'Accept-Encoding': 'identity'})
+
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['ETag'] == '"e1-gzip"'
+    assert plain.headers.get('Content-Encoding') is None
+    assert plain.headers['ETag'] == '"e1"'
+
+def test_304_echoes_encoded_etag_held_by_client(compressed_app):
+    """Upstream so ETag gốc; client đang giữ bản gzip -> 304 trả lại đúng ETag bản gzip"""
+    # Gateway đổi If-None-Match về ETag gốc trước khi chuyển tiếp upstream
+    assert strip_etag_encoding('"e1-gzip", W/"e2-br", "e3"') == '"e1", W/"e2", "e3"'
+
+    resp = compressed_app.get('/books', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"e1"'})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == '"e1"'
+
+    from flask import Flask
+    app = Flask(__name__)
+    with app.test_request_context(headers={'If-None-Match': '"e1-gzip"'}):
+        response = app.make_response(('', 304, {'ETag': '"e1"'}))
+        response = ResponseCompressor().after_request(response)
+    assert response.headers['ETag'] == '"e1-gzip"'
+
+def test_accepts_encoding_respects_q_values():
+    assert accepts_encoding('gzip, br;q=0', 'gzip') is True
+    assert accepts_encoding('gzip, br;q=0', 'br') is False
+    assert accepts_encoding(None, 'gzip') is False
+    assert accepts_encoding('*', 'deflate') is True
+
+# ====================================================================
+# TEST: HTTP cache của Gateway (ETag / Cache-Control / 304)
+# ====================================================================
+
+def upstream_response(status=200, etag='"e1"', cache_control='public, max-age=60'):
+    resp = MagicMock()
+    resp.status_code = status
+    resp.headers = {'ETag': etag, 'Cache-Control': cache_control}
+    return resp
+
+def test_response_cache_only_stores_public_responses_with_etag():
+    assert ResponseCache.cacheable_max_age(upstream_response()) == 60
+    assert ResponseCache.cacheable_max_age(upstream_response(cache_control='private, max-age=60')) is None
+    assert ResponseCache.cacheable_max_age(upstream_response(cache_control='public, no-store')) is None
+    assert ResponseCache.cacheable_max_age(upstream_response(etag=None)) is None
+    assert ResponseCache.cacheable_max_age(upstream_response(status=404)) is None
+
+def test_response_cache_serves_hit_and_304(mocker):
+    """Còn max-age -> trả từ RAM; If-None-Match khớp -> 304; hết max-age -> cần revalidate"""
+    cache = ResponseCache()
+    entry = CachedResponse(200, [('Content-Type', 'application/json'), ('ETag', '"e1"')], b'{"books": []}', '"e1"', 60)
+    cache.put('books|', entry)
+
+    from flask import Flask
+    with Flask(__name__).app_context():
+        hit = cache.serve(cache.get('books|'))
+        assert (hit.status_code, hit.get_data(), hit.headers['X-Cache']) == (200, b'{"books": []}', 'HIT')
+        assert cache.serve(entry, '"old", "e1"').status_code == 304
+
+    mocker.patch('src.upstream.response_cache.time.time', return_value=time.time() + 61)
+    assert entry.is_fresh() is False
+    cache.refresh(entry, upstream_response(status=304, cache_control='public, max-age=120'))
+    assert entry.is_fresh() is True and entry.max_age == 120
+
+def test_response_cache_bounded_by_bytes_and_purge():
+    cache = ResponseCache(max_bytes=10, max_entry_bytes=8)
+    cache.put('http://book/books|', CachedResponse(200, [], b'123456', '"a"', 60))
+    cache.put('http://book/books/1|', CachedResponse(200, [], b'123456', '"b"', 60))
+    cache.put('http://book/big|', CachedResponse(200, [], b'123456789', '"c"', 60))   # quá max_entry_bytes
+
+    assert cache.get('http://book/books|') is None        # bị evict (LRU) để giữ <= max_bytes
+    assert cache.get('http://book/big|') is None
+    assert cache.stats()['bytes'] == 6
+    assert cache.purge(prefix='http://book/books') == 1
+
+# ====================================================================
+# TEST: Single-flight (gộp GET giống hệt nhau)
+# ====================================================================
+
+def test_single_flight_shares_one_upstream_call():
+    """N request đồng thời cùng key -> chỉ 1 lời gọi upstream, tất cả nhận cùng kết quả"""
+    import threading
+    flights = SingleFlight(wait_timeout=5)
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return 'books-page-1'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('books', fetch))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert results == ['books-page-1'] * 5
+    # Xong rồi -> lần gọi sau đi upstream lại
+    assert flights.do('books', lambda: 'fresh') == 'fresh'
+
+def test_single_flight_propagates_leader_error():
+    import threading
+    flights = SingleFlight(wait_timeout=5)
+    started = threading.Event()
+    errors = []
+
+    def failing_fetch():
+        started.set()
+        time.sleep(0.2)   # đủ lâu để follower kịp vào hàng chờ
+        raise ConnectionError("upstream down")
+
+    def follower():
+        started.wait(5)
+        try:
+            flights.do('books', lambda: 'unused')
+        except ConnectionError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=follower)
+    t.start()
+    with pytest.raises(ConnectionError):
+        flights.do('books', failing_fetch)
+    t.join(5)
+
+    assert len(errors) == 1
+
+
+# ====================================================================
+# TEST: Cân bằng tải giữa các replica
+# ====================================================================
+
+def test_parse_replicas():
+    assert parse_replicas('http://book-1:5000, http://book-2:5000/,') == ['http://book-1:5000', 'http://book-2:5000']
+    assert parse_replicas(None) == []
+
+def test_replica_set_p2c_prefers_less_loaded_replica(mocker):
+    replicas = ReplicaSet('book', ['http://b1', 'http://b2'])
+    busy = replicas.pick()
+    mocker.patch('src.upstream.balancer.random.sample', return_value=list(replicas.replicas))
+
+    # Cả 2 ứng viên đều được so: luôn chọn replica không có request đang chạy
+    for _ in range(5):
+        other = replicas.pick()
+        assert other is not busy
+        replicas.release(other, False, 0.01)
+
+def test_replica_set_ejects_failing_replica_then_fails_open():
+    replicas = ReplicaSet('book', ['http://b1', 'http://b2'], eject_after=2, eject_seconds=30)
+    bad, good = replicas.replicas
+    for _ in range(2):
+        bad.outstanding += 1
+        replicas.release(bad, True, 0.01)
+
+    assert {replicas.pick().url for _ in range(10)} == {'http://b2'}
+    # Mọi replica đều bị loại -> vẫn thử (fail-open) thay vì không có đích
+    replicas.mark_health(good, False)
+    assert replicas.pick() is bad
+
+def test_registry_routes_by_upstream_name(mocker):
+    registry = UpstreamRegistry.from_config({
+        'BOOK_SERVICE_URL': 'http://book-1:5000,http://book-2:5000', 'UPSTREAM_HEALTH_INTERVAL': 0,
+    })
+    pool = registry.get('book')
+    send = mocker.patch.object(pool.session, 'request', return_value=MagicMock(status_code=200))
+
+    for _ in range(20):
+        pool.request('GET', 'books/5')
+
+    urls = {call.args[1] for call in send.call_args_list}
+    assert urls == {'http://book-1:5000/books/5', 'http://book-2:5000/books/5'}
+    assert all(r['outstanding'] == 0 for r in registry.replica_states()['book'])
+
+# ====================================================================
+# TEST: Connection pool keep-alive tới upstream
+# ====================================================================
+
+@pytest.fixture
+def stalling_upstream():
+    """HTTP server thật: request đầu tiên treo 2s (chưa gửi header), các request sau trả ngay"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'   # giữ kết nối keep-alive như upstream thật
+
+        def do_GET(self):
+            calls.append((self.path, self.client_address[1]))
+            if len(calls) == 1:
+                time.sleep(2)
+            try:
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+            except OSError:
+                pass   # Gateway đã huỷ request này
+
+        do_POST = do_GET
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}', calls
+    server.shutdown()
+
+def test_pool_reuses_keepalive_connection(stalling_upstream):
+    base_url, calls = stalling_upstream
+    pool = UpstreamPool('book', base_url, read_timeout=5)
+    threading.Thread(target=pool.request, args=('GET', 'warmup'), daemon=True).start()   # request treo 2s
+    time.sleep(0.1)
+
+    for _ in range(3):
+        assert pool.request('GET', 'books').content == b'ok'
+
+    # 3 request tuần tự đi chung 1 kết nối TCP (cùng port phía client)
+    ports = {port for path, port in calls if path == '/books'}
+    assert len(ports) == 1
+
+def test_pool_exhausted_fails_fast_and_auth_reports_unavailable(stalling_upstream, gateway_app, mocker):
+    from urllib3.exceptions import EmptyPoolError
+    from src.auth.decorators import _validate_token_remote
+    base_url, calls = stalling_upstream
+    pool = UpstreamPool('auth', base_url, pool_size=1, pool_timeout=0.1, read_timeout=5)
+    holder = threading.Thread(target=pool.request, args=('POST', 'auth/validate'))
+    holder.start()   # chiếm connection duy nhất trong 2s
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    with pytest.raises(EmptyPoolError):
+        pool.request('POST', 'auth/validate')
+    assert time.monotonic() - started < 1
+
+    # token_required: pool cạn -> "service unavailable" (không cache), không phải 500
+    mocker.patch.dict(gateway_app.extensions, {'upstreams': MagicMock(get=lambda name: pool)})
+    with gateway_app.app_context():
+        assert _validate_token_remote('Bearer x') == (None, "Authentication service is unavailable", False)
+    holder.join()
+
+# ====================================================================
+# TEST: Hedged request
+# ====================================================================
+
+def test_hedge_cancels_loser_and_releases_its_bulkhead_slot(stalling_upstream):
+    base_url, calls = stalling_upstream
+    breaker = CircuitBreaker('book', min_calls=1)
+    pool = UpstreamPool('book', base_url, read_timeout=5, breaker=breaker)
+    bulkhead = Bulkhead('books', max_concurrent=2, max_queue=0)
+    hedger = Hedger(initial_delay=0.05)
+
+    bulkhead.acquire()   # slot của request chính (_proxy_request giữ)
+    started = time.monotonic()
+    resp = hedger.run('/api/books', partial(pool.request, 'GET', 'books', stream=True),
+                      bulkhead=bulkhead)
+    assert resp.content == b'ok'
+    resp.close()
+    assert time.monotonic() - started < 1
+    assert len(calls) == 2
+
+    # Request chính (thua) bị huỷ ngay -> slot thứ 2 được trả sớm, không đợi 2s upstream treo
+    deadline = time.monotonic() + 0.5
+    while bulkhead.snapshot()['in_flight'] != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert bulkhead.snapshot()['in_flight'] == 1
+    # Lần gửi bị huỷ không bị tính là lỗi của upstream
+    assert breaker.snapshot() == {"state": "closed", "window_calls": 1, "error_rate": 0.0}
+
+def test_hedge_records_winning_attempt_phases(stalling_upstream, gateway_app):
+    """Pha của lần gửi thắng (chạy trong thread của Hedger) vẫn vào Server-Timing của request"""
+    from flask import g
+    from src import timing
+    base_url, calls = stalling_upstream
+    pool = UpstreamPool('book', base_url, read_timeout=5)
+    hedger = Hedger(initial_delay=0.05)
+
+    with gateway_app.test_request_context('/api/books'):
+        timing._start_request()
+        resp = hedger.run('/api/books', partial(pool.request, 'GET', 'books', stream=True))
+        resp.close()
+        phases = dict(g._phases)
+
+    assert set(phases) == {'upstream_connect', 'upstream_ttfb'}
+    # TTFB của request dự phòng (thắng), không phải của request chính đang treo 2s
+    assert phases['upstream_ttfb'] < 0.5
+
+def test_hedge_skipped_when_bulkhead_has_no_free_slot():
+    bulkhead = Bulkhead('books', max_concurrent=1, max_queue=0)
+    hedger = Hedger(initial_delay=0.01)
+    send = MagicMock(side_effect=lambda: time.sleep(0.1) or 'primary')
+
+    bulkhead.acquire()
+    assert hedger.run('/api/books', send, bulkhead=bulkhead) == 'primary'
+
+    send.assert_called_once()
+    assert bulkhead.snapshot()['in_flight'] == 1
+
+# ====================================================================
+# TEST: POST /api/batch - sub-request vẫn bị rate limit
+# ====================================================================
+
+@pytest.fixture(scope='module')
+def gateway_app():
+    """App Gateway đầy đủ (create_app chỉ gọi được 1 lần / process vì metrics Prometheus)"""
+    from unittest.mock import patch
+    from src.auth.decorators import token_required
+    from src import create_app
+    from src.config import Config
+    with patch.multiple(
+        Config, GATEWAY_RATE_LIMITS=['3 per minute'], RATELIMIT_STORAGE_URI='memory://',
+        JWT_SECRET_KEY=SECRET, JWT_JWKS_ENABLED=False,
+    ):
+        app = create_app()
+
+    @app.route('/api/ping')
+    def ping():
+        return {"pong": True}
+
+    @app.route('/api/me/ping')
+    @token_required
+    def me_ping():
+        return {"pong": True}
+
+    return app
+
+def test_batch_subrequests_count_toward_rate_limit(gateway_app):
+    client = gateway_app.test_client()
+    headers = {'Authorization': f'Bearer {make_token()}'}
+    resp = client.post('/api/batch', headers=headers,
+                       json={"requests": [{"id": str(i), "path": "/api/ping"} for i in range(5)]})
+
+    assert resp.status_code == 200
+    statuses = sorted(r['status'] for r in resp.get_json()['responses'])
+    assert statuses == [200, 200, 200, 429, 429]
+    # Hạn mức của /api/ping đã bị batch dùng hết -> gọi thẳng cũng bị chặn
+    assert client.get('/api/ping', headers=headers).status_code == 429
+
+# ====================================================================
+# TEST: GET /api/me/dashboard - 1 hạn chót chung cho mọi phần
+# ====================================================================
+
+def test_dashboard_book_stage_only_gets_remaining_time(gateway_app, mocker):
+    def fake_fetch(send, path, headers, timeout, **kwargs):
+        if path.startswith('books/'):
+            time.sleep(1.0)          # book_service chậm
+            return {"id": 1}
+        time.sleep(0.3)              # transaction_service dùng gần hết ngân sách
+        return [{"book_id": 1}]
+
+    fetch = mocker.patch('src.routes.transaction_routes._fetch_json', side_effect=fake_fetch)
+    mocker.patch.dict(gateway_app.config, {'DASHBOARD_TIMEOUT': 0.5})
+
+    started = time.monotonic()
+    resp = gateway_app.test_client().get('/api/me/dashboard',
+                                         headers={'Authorization': f'Bearer {make_token()}'})
+    elapsed = time.monotonic() - started
+
+    body = resp.get_json()
+    assert body['borrowed_books']['status'] == 'ok'
+    assert body['books'] == {"status": "partial", "data": {}}
+    assert body['degraded'] is True
+    # ~0.5s (1x hạn chót), không phải 0.3s + 0.5s; timeout của request sách cũng bị cắt theo
+    assert elapsed < 0.7
+    book_timeout = [c.args[3] for c in fetch.call_args_list if c.args[1].startswith('books/')][0]
+    assert book_timeout[1] <= 0.25
+
+def test_dashboard_fetch_goes_through_bulkhead_and_response_cache():
+    from concurrent.futures import ThreadPoolExecutor
+    from src.routes.transaction_routes import _fetch_json, _section
+    bulkhead = Bulkhead('books', max_concurrent=1, max_queue=0)
+    cache = ResponseCache()
+    headers = {'ETag': '"v1"', 'Cache-Control': 'public, max-age=60'}
+
+    def send(method, path, **kwargs):
+        assert bulkhead.snapshot()['in_flight'] == 1   # gọi upstream khi đang giữ slot
+        return MagicMock(status_code=200, headers=headers, content=b'{"id": 5}',
+                         raw=MagicMock(headers=MagicMock(items=lambda: list(headers.items()))))
+    send = MagicMock(side_effect=send)
+    fetch = partial(_fetch_json, send, 'books/5', {'Accept': 'application/json'}, (1, 1),
+                    bulkhead=bulkhead, cache=cache, cache_key='book/books/5?|application/json')
+
+    assert fetch() == {"id": 5}
+    assert fetch() == {"id": 5}          # lần 2: cache hit, không gọi upstream
+    assert send.call_count == 1
+    assert bulkhead.snapshot()['in_flight'] == 0
+
+    # Bulkhead đầy -> phần đó báo lỗi, không làm hỏng cả dashboard
+    bulkhead.acquire()
+    cache.purge()
+    with ThreadPoolExecutor(1) as executor:
+        section = _section(executor.submit(fetch), 1)
+    assert section['status'] == 'error'
+    assert send.call_count == 1
+
+# ====================================================================
+# TEST: Server-Timing
+# ====================================================================
+
+def test_server_timing_header_lists_phases(gateway_app, mocker):
+    mocker.patch.dict(gateway_app.config, {'SERVER_TIMING_ENABLED': True})
+    resp = gateway_app.test_client().get('/api/me/ping', headers={'Authorization': f'Bearer {make_token()}'})
+
+    names = [metric.split(';')[0] for metric in resp.headers['Server-Timing'].split(', ')]
+    assert names == ['limiter', 'validate_token', 'total']
+
+# ====================================================================
+# TEST: Streaming body 2 chiều qua Gateway
+# ====================================================================
+
+@pytest.fixture
+def echo_upstream():
+    """HTTP server thật: ghi lại body nhận được, trả về body 256KB (có Content-Length)"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    received = []
+    payload = bytes(range(256)) * 1024
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers['Content-Length'])
+            received.append((length, self.rfile.read(length)))
+            self.send_response(201)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}', received, payload
+    server.shutdown()
+
+def test_proxy_streams_large_bodies_both_ways(gateway_app, echo_upstream, mocker):
+    base_url, received, payload = echo_upstream
+    registry = UpstreamRegistry.from_config({
+        'AUTH_SERVICE_URL': base_url, 'UPSTREAM_HEALTH_INTERVAL': 0, 'CIRCUIT_BREAKER_ENABLED': False,
+    })
+    mocker.patch.dict(gateway_app.extensions, {'upstreams': registry})
+    mocker.patch.dict(gateway_app.config, {'PROXY_STREAM_THRESHOLD': 1024, 'PROXY_STREAM_CHUNK_SIZE': 4096})
+    get_data = mocker.spy(gateway_app.request_class, 'get_data')
+    upload = b'x' * 100_000
+
+    resp = gateway_app.test_client().post('/api/users', data=upload,
+                                          headers={'Content-Type': 'application/octet-stream'})
+
+    # Upload lớn: đi thẳng lên upstream theo chunk, giữ Content-Length, không nạp qua get_data()
+    assert received == [(len(upload), upload)]
+    get_data.assert_not_called()
+    # Response lớn: stream về client, body nguyên vẹn
+    assert resp.status_code == 201
+    assert resp.is_streamed
+    assert resp.get_data() == payload
+
@@ -0,0 +1,42 @@
+# benchmark_bcrypt.py
+
+"""
+Đo chi phí bcrypt trên máy hiện tại cho từng cost (log rounds) và gợi ý cost
+lớn nhất vừa với BCRYPT_TARGET_MS. Chạy 1 lần trên máy deploy rồi cố định kết quả
+vào BCRYPT_LOG_ROUNDS (Auth Service không tự đo lúc khởi động).
+
+Ví dụ:
+    python benchmark_bcrypt.py --min-rounds 10 --max-rounds 14 --target-ms 250
+
+In bảng: cost, thời gian băm (ms, trung vị), số lượt login/giây trên 1 core
+(login = 1 lần check_password_hash ~ 1 lần băm) và ước lượng cho toàn bộ CPU.
+"""
+
+import argparse
+import os
+
+from src.services.password_hasher import calibrate_rounds, measure_hash_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-rounds', type=int, default=10)
+    parser.add_argument('--max-rounds', type=int, default=14)
+    parser.add_argument('--samples', type=int, default=3, help='số lần đo mỗi cost (lấy trung vị)')
+    parser.add_argument('--target-ms', type=float, default=float(os.environ.get('BCRYPT_TARGET_MS', 250)))
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"cpu_count={cores} target={args.target_ms}ms")
+    print(f"{'cost':>6}{'ms/hash':>12}{'logins/s/core':>16}{'logins/s (all)':>16}")
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        seconds = measure_hash_seconds(rounds, samples=args.samples)
+        print(f"{rounds:>6}{seconds * 1000:>12.1f}{1 / seconds:>16.1f}{cores / seconds:>16.1f}")
+
+    chosen = calibrate_rounds(args.target_ms / 1000, min_rounds=args.min_rounds, max_rounds=args.max_rounds)
+    print(f"calibrated cost for {args.target_ms}ms target: {chosen}")
+    print(f"-> set BCRYPT_LOG_ROUNDS={chosen} for every auth_service instance")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# import_users.py
+
+"""
+Import hàng loạt user từ file CSV (header: email,username,password[,full_name])
+hoặc NDJSON (mỗi dòng 1 JSON object cùng các khoá) vào DB của Auth Service.
+
+Ví dụ:
+    python import_users.py users.csv
+    python import_users.py users.ndjson --chunk-size 1000 --workers 8
+
+Mật khẩu được băm song song (process pool), mỗi lô 1 INSERT + 1 commit.
+In báo cáo JSON: số dòng tạo mới / trùng / lỗi, lỗi từng dòng và throughput.
+"""
+
+import argparse
+import json
+
+from src import create_app
+from src.services.user_import import IMPORT_FORMATS, UserImporter, iter_import_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=IMPORT_FORMATS, help='mặc định đoán theo đuôi file')
+    parser.add_argument('--chunk-size', type=int, help='mặc định USER_IMPORT_CHUNK_SIZE')
+    parser.add_argument('--workers', type=int, help='số process băm mật khẩu')
+    args = parser.parse_args()
+
+    fmt = args.format or ('ndjson' if args.path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    app = create_app()
+    with app.app_context(), open(args.path, 'rb') as f:
+        importer = UserImporter.from_config(app.config, chunk_size=args.chunk_size, workers=args.workers)
+        report = importer.run(iter_import_rows(f, fmt))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,12 +7,20 @@ from .config import Config
 from .database import db
 from .controllers.auth_controller import auth_bp
 from .services.oauth_service import init_oauth
+from .services.password_hasher import password_hasher
+from .services.refresh_token_sweeper import RefreshTokenSweeper
+from .services.signing_keys import signing_keys
+from .repositories.user_repository import UserRepository
+from .repositories.user_profile_cache import user_profile_cache
+import ipaddress
 import os
 
 # [LESSON 10] Import
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from prometheus_flask_exporter import PrometheusMetrics
+import library_common.rate_limit_storage  # noqa: F401  (đăng ký scheme mmap:// cho limits)
+from .session_store import SQLiteSessionCache
 from flask import request
 
 
@@ -30,8 +38,14 @@ def create_app():
     is_production = os.environ.get('FLASK_ENV') == 'production'
 
     app.config.update({
-        "SESSION_TYPE": "filesystem",
-        "SESSION_FILE_DIR": SESSION_DIR,
+        # Store 1 file SQLite (WAL) có TTL + dọn theo lô, cắm vào Flask-Session qua interface cachelib
+        "SESSION_TYPE": "cachelib",
+        "SESSION_CACHELIB": SQLiteSessionCache(
+            app.config.get('SESSION_SQLITE_PATH') or os.path.join(SESSION_DIR, "sessions.sqlite3"),
+            max_timeout=app.config.get('SESSION_STORE_MAX_TTL', 86400),
+            cleanup_every=app.config.get('SESSION_CLEANUP_EVERY', 100),
+            cleanup_batch=app.config.get('SESSION_CLEANUP_BATCH', 500),
+        ),
         "SESSION_PERMANENT": False,
         "SESSION_USE_SIGNER": True,
         "SESSION_REFRESH_EACH_REQUEST": True,
@@ -48,15 +62,29 @@ def create_app():
     # [LESSON 10] AUTH SECURITY
     # ====================================================================
     # Rate Limit cho Auth Service (Quan trọng để chống dò mật khẩu)
+    internal_networks = [ipaddress.ip_network(n) for n in app.config['INTERNAL_NETWORKS']]
+
+    def is_internal_caller():
+        try:
+            addr = ipaddress.ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(addr in network for network in internal_networks)
+
     def should_exempt():
-        return request.path == "/metrics"
+        if request.path in ("/metrics", "/health", "/auth/.well-known/jwks.json"):
+            return True
+        # Gateway / batch job gọi từ mạng nội bộ: 1 request = nhiều token, không giới hạn theo IP
+        return request.path == "/auth/validate/batch" and is_internal_caller()
     
     # 1. Rate Limiter (Gateway chặn tổng thể: 1000 req/giờ mỗi IP)
     limiter = Limiter(
         key_func=get_remote_address,
         app=app,
         default_limits=["2000 per day", "500 per hour"],
-        storage_uri="memory://",
+        # Bộ đếm dùng chung giữa các worker gunicorn (mmap://) thay vì riêng từng worker
+        storage_uri=app.config['RATELIMIT_STORAGE_URI'],
+        strategy=app.config['RATELIMIT_STRATEGY'],
     )
     limiter.request_filter(should_exempt)
     app.extensions['limiter'] = limiter
@@ -67,12 +95,22 @@ def create_app():
     # ====================================================================
 
     db.init_app(app)
+    password_hasher.init_app(app)   # chốt BCRYPT_LOG_ROUNDS trước khi Flask-Bcrypt đọc
     bcrypt.init_app(app)
     init_oauth(app)
+    signing_keys.init_app(app)   # nạp / sinh key ký JWT (RS256/EdDSA) + xoay vòng
 
     with app.app_context():
         db.create_all()
 
+    user_profile_cache.init_app(app)
+
+    # Thread dọn refresh token hết hạn/bị thu hồi (mỗi worker 1 thread)
+    if app.config.get('REFRESH_TOKEN_SWEEP_ENABLED', True):
+        sweeper = RefreshTokenSweeper.from_app(app, UserRepository())
+        sweeper.start()
+        app.extensions['refresh_token_sweeper'] = sweeper
+
     app.register_blueprint(auth_bp, url_prefix="/auth")
 
     @app.route("/health")
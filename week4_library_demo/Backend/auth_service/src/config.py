@@ -56,8 +56,23 @@ class Config:
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "jwt_secret_mac_dinh")
     JWT_REFRESH_SECRET_KEY = os.environ.get("JWT_REFRESH_SECRET_KEY", "jwt_refresh_secret_mac_dinh")
 
-    # Session Settings
-    SESSION_TYPE = "filesystem"
+    # Ký access token bằng key bất đối xứng (RS256 / EdDSA) có 'kid'; service khác tự xác thực
+    # bằng public key lấy từ /auth/.well-known/jwks.json. "HS256" = dùng JWT_SECRET_KEY như cũ.
+    JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "RS256")
+    # Private key (PEM) dùng chung giữa các worker; production nên mount volume riêng
+    JWT_KEYS_DIR = os.environ.get("JWT_KEYS_DIR", "/tmp/auth_service_jwt_keys")
+    JWT_KEY_ROTATION_DAYS = float(os.environ.get("JWT_KEY_ROTATION_DAYS", 30))
+    # Key cũ còn trong JWKS bao lâu sau khi key mới bắt đầu ký (>= thời hạn access token)
+    JWT_KEY_OVERLAP_HOURS = float(os.environ.get("JWT_KEY_OVERLAP_HOURS", 24))
+    # Cache-Control max-age của JWKS; key mới được công bố trước ít nhất chừng này mới dùng để ký
+    JWKS_MAX_AGE = int(os.environ.get("JWKS_MAX_AGE", 3600))
+
+    # Session Settings (store SQLite WAL, xem src/session_store.py)
+    SESSION_TYPE = "cachelib"
+    SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH")          # mặc định: flask_sessions/sessions.sqlite3
+    SESSION_STORE_MAX_TTL = int(os.environ.get("SESSION_STORE_MAX_TTL", 86400))   # giây
+    SESSION_CLEANUP_EVERY = int(os.environ.get("SESSION_CLEANUP_EVERY", 100))     # dọn sau mỗi N lần ghi
+    SESSION_CLEANUP_BATCH = int(os.environ.get("SESSION_CLEANUP_BATCH", 500))     # số session hết hạn xoá mỗi lần
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
     
@@ -74,4 +89,66 @@ class Config:
     
     # URL Gateway Public để Google redirect về đúng chỗ
     GATEWAY_PUBLIC_URL = os.environ.get("GATEWAY_PUBLIC_URL", "http://localhost:8080")
-    GOOGLE_REDIRECT_URI = f"{GATEWAY_PUBLIC_URL}/api/auth/google/callback"
\ No newline at end of file
+    GOOGLE_REDIRECT_URI = f"{GATEWAY_PUBLIC_URL}/api/auth/google/callback"
+
+    # ==========================================================
+    # RATE LIMIT STORAGE (dùng chung giữa các worker gunicorn)
+    # ==========================================================
+    # "memory://" = bộ đếm riêng từng worker -> giới hạn thực tế lỏng gấp N lần
+    RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI", "mmap:///tmp/auth_service_ratelimit.mmap")
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "sliding-window-counter")
+    # Mạng nội bộ (Gateway, batch job): không tính rate limit theo IP cho endpoint nội bộ
+    INTERNAL_NETWORKS = [
+        n.strip() for n in os.environ.get(
+            "INTERNAL_NETWORKS", "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
+        ).split(",") if n.strip()
+    ]
+
+    # ==========================================================
+    # XÁC THỰC TOKEN HÀNG LOẠT (/auth/validate/batch)
+    # ==========================================================
+    VALIDATE_BATCH_MAX_TOKENS = int(os.environ.get("VALIDATE_BATCH_MAX_TOKENS", 1000))
+
+    # ==========================================================
+    # PASSWORD HASHING (bcrypt chạy trong process pool riêng)
+    # ==========================================================
+    PASSWORD_HASH_POOL_ENABLED = os.environ.get("PASSWORD_HASH_POOL_ENABLED", "true").lower() == "true"
+    # Mặc định = số CPU; nên cân nhắc với số worker gunicorn (mỗi worker có pool riêng)
+    PASSWORD_HASH_WORKERS = int(os.environ["PASSWORD_HASH_WORKERS"]) if os.environ.get("PASSWORD_HASH_WORKERS") else None
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", 32))   # tác vụ chờ thêm ngoài số đang chạy
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))     # giây chờ kết quả tối đa
+
+    # Cost bcrypt cố định, giống nhau ở MỌI worker/instance (không tự đo lúc khởi động:
+    # mỗi worker đo ra 1 cost khác nhau -> hash bị băm lại qua lại giữa các cost).
+    # Chọn giá trị bằng `python benchmark_bcrypt.py` trên máy deploy rồi đặt vào đây/biến môi trường.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+
+    # ==========================================================
+    # REFRESH TOKEN: dọn bảng refresh_tokens (kiểm tra thu hồi luôn đọc DB, không cache)
+    # ==========================================================
+    REFRESH_TOKEN_SWEEP_ENABLED = os.environ.get("REFRESH_TOKEN_SWEEP_ENABLED", "true").lower() == "true"
+    REFRESH_TOKEN_SWEEP_INTERVAL = float(os.environ.get("REFRESH_TOKEN_SWEEP_INTERVAL", 300))   # giây giữa 2 lần dọn
+    REFRESH_TOKEN_SWEEP_BATCH = int(os.environ.get("REFRESH_TOKEN_SWEEP_BATCH", 500))          # số dòng xoá mỗi lô
+    REFRESH_TOKEN_SWEEP_PAUSE = float(os.environ.get("REFRESH_TOKEN_SWEEP_PAUSE", 0.05))       # nghỉ giữa các lô
+
+    # ==========================================================
+    # USER PROFILE CACHE (login / OAuth tra email/username -> user qua cache TTL)
+    # ==========================================================
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+    # Mỗi worker có cache riêng; role/is_active luôn đọc lại từ DB trước khi phát token nên không phụ thuộc TTL
+    USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 60))
+
+    # ==========================================================
+    # IMPORT USER HÀNG LOẠT (CSV / NDJSON)
+    # ==========================================================
+    USER_IMPORT_CHUNK_SIZE = int(os.environ.get("USER_IMPORT_CHUNK_SIZE", 500))   # dòng / lô (1 INSERT + 1 commit)
+    # Process pool băm mật khẩu riêng cho import; bỏ trống -> bằng PASSWORD_HASH_WORKERS
+    USER_IMPORT_HASH_WORKERS = int(os.environ["USER_IMPORT_HASH_WORKERS"]) if os.environ.get("USER_IMPORT_HASH_WORKERS") else None
+    USER_IMPORT_MAX_REPORTED_ERRORS = int(os.environ.get("USER_IMPORT_MAX_REPORTED_ERRORS", 1000))
+
+    # ==========================================================
+    # DANH SÁCH USER (keyset pagination / stream NDJSON)
+    # ==========================================================
+    USER_LIST_DEFAULT_LIMIT = int(os.environ.get("USER_LIST_DEFAULT_LIMIT", 50))
+    USER_LIST_MAX_LIMIT = int(os.environ.get("USER_LIST_MAX_LIMIT", 500))
+    USER_LIST_STREAM_BATCH = int(os.environ.get("USER_LIST_STREAM_BATCH", 1000))   # yield_per khi stream
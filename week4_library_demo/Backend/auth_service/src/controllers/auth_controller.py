@@ -4,15 +4,19 @@ import time
 import logging
 import json
 import traceback
+from functools import wraps
 from urllib.parse import quote
-from flask import Blueprint, request, jsonify, current_app, make_response, redirect, session
+from flask import Blueprint, request, jsonify, current_app, make_response, redirect, session, Response, stream_with_context
 from ..services.auth_service import AuthService
 from ..services.oauth_service import oauth, OAuthService
+from ..services.signing_keys import signing_keys
+from ..services.user_import import IMPORT_FORMATS, UserImporter, iter_import_rows
 
 # Import các exception
 from ..exceptions import (
     AuthError, InvalidLoginError, UserInactiveError, 
-    UserAlreadyExistsError, InvalidTokenError, MissingDataError
+    UserAlreadyExistsError, InvalidTokenError, MissingDataError, HashingOverloadedError,
+    PermissionDeniedError
 )
 
 auth_bp = Blueprint('auth_bp', __name__)
@@ -73,6 +77,19 @@ def log_access_request(response):
             
     return response
 
+# 3. Helper: chỉ cho admin gọi (không tin vào việc Gateway đã kiểm tra: port của service có thể bị gọi thẳng)
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.headers.get('Authorization')
+        if not token or not token.startswith('Bearer '):
+            raise InvalidTokenError("Missing or invalid token")
+        user_data = AuthService().validate_access_token(token.split(" ", 1)[1])
+        if user_data.get('role') != 'ADMIN':
+            raise PermissionDeniedError("Chỉ admin được phép thực hiện thao tác này")
+        return f(*args, **kwargs)
+    return decorated_function
+
 # ====================================================================
 # ERROR HANDLERS
 # ====================================================================
@@ -85,6 +102,11 @@ def handle_unauthorized(error):
     logger.warning(f"[SECURITY] Auth Failed: {str(error)} | IP: {request.remote_addr}")
     return jsonify({"error": str(error)}), 401
 
+@auth_bp.errorhandler(PermissionDeniedError)
+def handle_forbidden(error):
+    logger.warning(f"[SECURITY] Forbidden: {str(error)} | IP: {request.remote_addr}")
+    return jsonify({"error": str(error)}), 403
+
 @auth_bp.errorhandler(UserAlreadyExistsError)
 def handle_conflict(error):
     return jsonify({"error": str(error)}), 409
@@ -93,6 +115,14 @@ def handle_conflict(error):
 def handle_bad_request(error):
     return jsonify({"error": str(error)}), 400
 
+@auth_bp.errorhandler(HashingOverloadedError)
+def handle_overloaded(error):
+    # Hàng đợi bcrypt đầy -> fail-fast, client thử lại sau
+    logger.warning(f"[CAPACITY] Password hashing queue full | IP: {request.remote_addr}")
+    response = jsonify({"error": str(error)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.errorhandler(AuthError)
 @auth_bp.errorhandler(Exception)
 def handle_generic_error(error):
@@ -258,6 +288,81 @@ def validate_token():
     
     return jsonify({"valid": True, "user": user_data}), 200
 
+@auth_bp.route('/users', methods=['GET'])
+@admin_required
+def list_users():
+    """
+    Chỉ admin (kiểm tra lại token ngay tại service, không chỉ dựa vào Gateway).
+    - Mặc định: 1 trang JSON, phân trang keyset (?limit=&cursor=<next_cursor trang trước>).
+    - ?format=ndjson: stream toàn bộ user, 1 JSON / dòng.
+    """
+    service = AuthService()
+    config = current_app.config
+    if request.args.get('format') == 'ndjson':
+        rows = service.stream_users_ndjson(config.get('USER_LIST_STREAM_BATCH', 1000))
+        return Response(stream_with_context(rows), mimetype='application/x-ndjson')
+
+    limit = request.args.get('limit', config.get('USER_LIST_DEFAULT_LIMIT', 50), type=int)
+    limit = max(1, min(limit, config.get('USER_LIST_MAX_LIMIT', 500)))
+    return jsonify(service.list_users(limit, request.args.get('cursor'))), 200
+
+@auth_bp.route('/users/import', methods=['POST'])
+@admin_required
+def import_users():
+    """
+    Chỉ admin (kiểm tra token trước khi đọc body / băm mật khẩu).
+    Body là file CSV hoặc NDJSON, đọc dạng stream (không nạp cả file vào RAM).
+    """
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'ndjson' if 'json' in (request.mimetype or '') else 'csv'
+    if fmt not in IMPORT_FORMATS:
+        raise MissingDataError("format phải là csv hoặc ndjson")
+
+    importer = UserImporter.from_config(
+        current_app.config, chunk_size=request.args.get('chunk_size', type=int),
+    )
+    report = importer.run(iter_import_rows(request.stream, fmt))
+
+    # [AUDIT LOG] Ghi nhận import hàng loạt
+    log_audit("IMPORT_USERS", "bulk", {k: v for k, v in report.items() if k != 'errors'})
+    return jsonify(report), 200
+
+@auth_bp.route('/validate/batch', methods=['POST'])
+def validate_tokens_batch():
+    """
+    Endpoint NỘI BỘ: xác thực nhiều access token trong 1 request.
+    Body: {"tokens": ["<jwt>", ...]} -> {"results": [{"valid": ..., "user" | "error": ...}, ...]}
+    (cùng thứ tự). Caller trong mạng nội bộ không bị tính vào rate limit theo IP.
+    """
+    data = request.get_json(silent=True) or {}
+    tokens = data.get('tokens')
+    if not isinstance(tokens, list) or not tokens:
+        raise MissingDataError("tokens phải là danh sách không rỗng")
+    max_tokens = current_app.config.get('VALIDATE_BATCH_MAX_TOKENS', 1000)
+    if len(tokens) > max_tokens:
+        raise MissingDataError(f"Tối đa {max_tokens} token mỗi request")
+
+    service = AuthService()
+    return jsonify({"results": service.validate_access_tokens(tokens)}), 200
+
+@auth_bp.route('/.well-known/jwks.json', methods=['GET'])
+def jwks():
+    """
+    Public key (JWKS) để Gateway / service khác tự xác thực access token theo 'kid'
+    mà không cần gọi /auth/validate. Cache dài + ETag: client chỉ tải lại khi key đổi.
+    """
+    body, etag = signing_keys.jwks()
+    max_age = current_app.config.get('JWKS_MAX_AGE', 3600)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(body, 200)
+        response.mimetype = 'application/json'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={max_age}, stale-while-revalidate={max_age}"
+    return response
+
 # --- OAuth Endpoints (Giữ nguyên logic redirect) ---
 
 @auth_bp.route("/google/login")
@@ -304,4 +409,11 @@ def debug_users_nplus1():
 def debug_users_eager():
     service = AuthService()
     result = service.get_users_with_eager_loading()
-    return jsonify(result), 200
\ No newline at end of file
+    return jsonify(result), 200
+
+@auth_bp.route('/users/batch', methods=['GET'])
+def debug_users_batch():
+    service = AuthService()
+    result = service.get_users_with_batch_loading()
+    return jsonify(result), 200
+
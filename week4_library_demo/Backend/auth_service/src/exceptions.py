@@ -22,4 +22,12 @@ class InvalidTokenError(AuthError):
 
 class MissingDataError(AuthError):
     """Ném ra khi thiếu dữ liệu đầu vào (ví dụ: thiếu 'login')."""
-    pass
\ No newline at end of file
+    pass
+
+class PermissionDeniedError(AuthError):
+    """Ném ra khi token hợp lệ nhưng không đủ quyền (ví dụ: endpoint chỉ dành cho admin)."""
+    pass
+
+class HashingOverloadedError(AuthError):
+    """Ném ra khi hàng đợi băm mật khẩu (bcrypt) đã đầy -> trả 503 thay vì chờ lâu."""
+    pass
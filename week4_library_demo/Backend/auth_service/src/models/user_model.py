@@ -20,6 +20,10 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     oauth_identities = db.relationship('OAuthIdentity', backref='user', lazy=True, cascade="all, delete-orphan")
+    __table_args__ = (
+        # Keyset pagination danh sách user: ORDER BY created_at, id
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+    )
 
 
 class OAuthIdentity(db.Model):
@@ -41,5 +45,5 @@ class RefreshToken(db.Model):
     user_id = db.Column(db.String(36), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True) # Thêm index
     jti = db.Column(db.String(255), unique=True, nullable=False)
     is_revoked = db.Column(db.Boolean, nullable=False, default=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True) # Sweeper xoá token hết hạn theo cột này
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
\ No newline at end of file
@@ -0,0 +1,105 @@
+# auth_service/src/repositories/user_profile_cache.py
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import event
+
+# Bản sao tách khỏi session (không lazy-load được quan hệ), đủ cho login / refresh / OAuth.
+# Không chứa hashed_password: hash luôn đọc từ DB lúc kiểm tra mật khẩu (đổi mật khẩu có hiệu lực ngay).
+UserProfile = namedtuple('UserProfile', [
+    'id', 'email', 'username', 'role', 'is_active', 'full_name', 'avatar_url',
+])
+
+
+def to_profile(user):
+    return UserProfile(
+        user.id, user.email, user.username, user.role, user.is_active,
+        user.full_name, user.avatar_url,
+    )
+
+
+class UserProfileCache:
+    """
+    Cache TTL (LRU, giới hạn số entry) các dòng users hay đọc: id -> UserProfile,
+    kèm chỉ mục email -> id và username -> id.
+
+    - Xoá entry khi User được update/delete qua ORM (event mapper) hoặc gọi invalidate().
+    - Mỗi worker gunicorn có cache riêng -> thay đổi ở worker khác thấy chậm tối đa `ttl` giây.
+      Vì vậy hashed_password / role / is_active KHÔNG lấy từ cache khi đăng nhập / phát token:
+      AuthService đọc lại các cột này từ DB theo khoá chính; cache chỉ tiết kiệm bước tra
+      email/username -> id.
+    - Không cache kết quả "không tìm thấy" (user vừa đăng ký phải đăng nhập được ngay).
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._profiles = OrderedDict()   # id -> (UserProfile, cached_at)
+        self._index = {}                 # ('email'|'username', value) -> id
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('USER_CACHE_SIZE', 10000)
+        self.ttl = app.config.get('USER_CACHE_TTL', 60)
+        app.extensions['user_profile_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, field, value):
+        """field: 'id' | 'email' | 'username'."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            user_id = value if field == 'id' else self._index.get((field, value))
+            entry = self._profiles.get(user_id)
+            if entry is None:
+                return None
+            profile, cached_at = entry
+            if time.monotonic() - cached_at > self.ttl:
+                self._remove(user_id)
+                return None
+            self._profiles.move_to_end(user_id)
+            return profile
+
+    def put(self, profile):
+        if not self.enabled:
+            return profile
+        with self._lock:
+            self._remove(profile.id)
+            self._profiles[profile.id] = (profile, time.monotonic())
+            self._index[('email', profile.email)] = profile.id
+            if profile.username:
+                self._index[('username', profile.username)] = profile.id
+            while len(self._profiles) > self.max_entries:
+                self._remove(next(iter(self._profiles)))
+        return profile
+
+    def _remove(self, user_id):
+        entry = self._profiles.pop(user_id, None)
+        if entry is not None:
+            profile = entry[0]
+            self._index.pop(('email', profile.email), None)
+            self._index.pop(('username', profile.username), None)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+            self._index.clear()
+
+
+user_profile_cache = UserProfileCache()
+
+
+def invalidate_on_change(model):
+    @event.listens_for(model, 'after_update')
+    @event.listens_for(model, 'after_delete')
+    def _invalidate(mapper, connection, target):
+        user_profile_cache.invalidate(target.id)
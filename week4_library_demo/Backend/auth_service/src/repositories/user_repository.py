@@ -1,7 +1,12 @@
 from ..database import db
 from ..models.user_model import User, OAuthIdentity, RefreshToken
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import or_
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.orm import selectinload
+from .user_profile_cache import invalidate_on_change, to_profile, user_profile_cache
+
+# Đổi role / hash / is_active... qua ORM -> xoá profile khỏi cache
+invalidate_on_change(User)
 
 class UserRepository:
     def add_user(self, user):
@@ -16,17 +21,102 @@ class UserRepository:
             db.session.rollback()
             return None, str(e)
 
+    def find_existing_logins(self, emails, usernames):
+        """(set email, set username) đã có trong DB — 2 query IN thay vì 1 query / dòng."""
+        existing_emails = {e for (e,) in db.session.query(User.email).filter(User.email.in_(emails))}
+        existing_usernames = {u for (u,) in db.session.query(User.username).filter(User.username.in_(usernames))}
+        db.session.commit()   # kết thúc transaction đọc, không giữ snapshot giữa các lô
+        return existing_emails, existing_usernames
+
+    def bulk_add_users(self, mappings):
+        """INSERT nhiều dòng trong 1 statement + 1 commit. False nếu vướng unique constraint."""
+        try:
+            db.session.execute(insert(User), mappings)
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
     def get_user_by_login(self, login_identifier):
-        # Tìm bằng email hoặc username
-        return User.query.filter(
-            or_(User.email == login_identifier, User.username == login_identifier)
-        ).first()
+        """
+        Tìm bằng email hoặc username, mỗi lần tra đúng 1 unique index
+        (OR 2 cột trên MySQL thường thành index merge / full scan).
+        Có '@' -> thử email trước; username cũng có thể chứa '@' nên vẫn thử username sau.
+        """
+        if '@' in login_identifier:
+            user = self.get_user_by_email(login_identifier)
+            if user:
+                return user
+        return self.get_user_by_username(login_identifier)
+
+    def update_password_hash(self, user, hashed_password):
+        """Ghi hash mới (rehash khi đổi cost). Lỗi DB không làm hỏng luồng đăng nhập."""
+        try:
+            # user có thể là UserProfile từ cache (không gắn session) -> update theo id
+            User.query.filter_by(id=user.id).update({'hashed_password': hashed_password})
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            return False
+        finally:
+            # Query.update() không phát event mapper -> tự xoá cache
+            user_profile_cache.invalidate(user.id)
+
+    def _get_cached(self, field, value, query):
+        """UserProfile (bản sao chỉ đọc) từ cache, hoặc query DB rồi cache lại."""
+        profile = user_profile_cache.get(field, value)
+        if profile is not None:
+            return profile
+        user = query.first()
+        return user_profile_cache.put(to_profile(user)) if user else None
+
+    def get_user_credentials(self, user_id):
+        """(hashed_password, role, is_active) đọc thẳng DB theo khoá chính, không qua cache profile."""
+        return db.session.query(User.hashed_password, User.role, User.is_active).filter(User.id == user_id).first()
+
+    def get_user_status(self, user_id):
+        """(role, is_active) đọc thẳng DB theo khoá chính, không qua cache profile."""
+        return db.session.query(User.role, User.is_active).filter(User.id == user_id).first()
 
     def get_user_by_id(self, user_id):
-        return User.query.get(user_id)
+        return self._get_cached('id', user_id, User.query.filter_by(id=user_id))
+
+    def get_user_by_username(self, username):
+        return self._get_cached('username', username, User.query.filter_by(username=username))
+
     def get_user_by_email(self, email):
         """Tìm user bằng email."""
-        return User.query.filter_by(email=email.lower()).first()
+        email = email.lower()
+        return self._get_cached('email', email, User.query.filter_by(email=email))
+
+    def list_users_page(self, limit, after=None):
+        """
+        1 trang user theo keyset (created_at, id) > after: dùng index ix_users_created_at_id,
+        chi phí không tăng theo độ sâu trang như OFFSET. OAuth identity nạp bằng 1 query IN / trang.
+        """
+        query = User.query.options(selectinload(User.oauth_identities))
+        if after is not None:
+            created_at, user_id = after
+            query = query.filter(or_(
+                User.created_at > created_at,
+                and_(User.created_at == created_at, User.id > user_id),
+            ))
+        return query.order_by(User.created_at, User.id).limit(limit).all()
+
+    def iter_users(self, batch_size):
+        """
+        Duyệt toàn bộ user theo (created_at, id) bằng server-side cursor (yield_per):
+        mỗi lần chỉ giữ `batch_size` user + identity của chúng trong bộ nhớ.
+        """
+        stmt = (
+            select(User)
+            .options(selectinload(User.oauth_identities))
+            .order_by(User.created_at, User.id)
+            .execution_options(yield_per=batch_size)
+        )
+        yield from db.session.execute(stmt).scalars()
 
     def add_oauth_identity(self, user_id, provider, provider_user_id):
         """Thêm một liên kết OAuth mới."""
@@ -58,10 +148,35 @@ class UserRepository:
     def get_refresh_token(self, jti):
         return RefreshToken.query.filter_by(jti=jti, is_revoked=False).first()
 
+    def get_refresh_token_owner(self, jti):
+        """
+        Refresh token chưa bị thu hồi + user sở hữu trong 1 query (JOIN theo unique index jti):
+        (expires_at, user) hoặc None. Đọc thẳng DB, không qua cache.
+        """
+        return db.session.query(RefreshToken.expires_at, User).join(
+            User, User.id == RefreshToken.user_id,
+        ).filter(RefreshToken.jti == jti, RefreshToken.is_revoked.is_(False)).first()
+
     def revoke_refresh_token(self, jti):
         token = self.get_refresh_token(jti)
         if token and not token.is_revoked:
             token.is_revoked = True
             db.session.commit()
             return True
-        return False
\ No newline at end of file
+        return False
+
+    def delete_stale_refresh_tokens(self, now, batch_size):
+        """Xoá tối đa batch_size token hết hạn/bị thu hồi trong 1 transaction ngắn."""
+        try:
+            ids = [row.id for row in db.session.query(RefreshToken.id).filter(
+                or_(RefreshToken.expires_at < now, RefreshToken.is_revoked.is_(True))
+            ).limit(batch_size).all()]
+            if not ids:
+                db.session.commit()
+                return 0
+            deleted = RefreshToken.query.filter(RefreshToken.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            return deleted
+        except Exception:
+            db.session.rollback()
+            raise
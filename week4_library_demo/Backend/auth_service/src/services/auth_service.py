@@ -1,21 +1,26 @@
 # auth_service/src/services/auth_service.py
 
+import base64
+import json
 import jwt
 import uuid
 from datetime import datetime, timedelta
 from flask import current_app
-from flask_bcrypt import Bcrypt
 from ..models.user_model import User, RefreshToken
 from ..repositories.user_repository import UserRepository
+from ..repositories.user_profile_cache import to_profile, user_profile_cache
+from .password_hasher import password_hasher
+from .signing_keys import signing_keys
 from sqlalchemy.orm import joinedload, selectinload
 
 # ✅ BƯỚC 1: Import các exception (Giả sử bạn đã tạo file exceptions.py)
 from ..exceptions import (
     AuthError, InvalidLoginError, UserInactiveError, 
-    UserAlreadyExistsError, InvalidTokenError
+    UserAlreadyExistsError, InvalidTokenError, HashingOverloadedError, MissingDataError
 )
 
-bcrypt = Bcrypt()
+# bcrypt chạy trong process pool riêng (cùng interface generate/check_password_hash với flask_bcrypt)
+bcrypt = password_hasher
 
 class AuthService:
     def __init__(self):
@@ -54,14 +59,20 @@ class AuthService:
         Trả về (user, access_token, refresh_token_data) nếu thành công.
         """
         user = self.repo.get_user_by_login(login_identifier.lower())
+        # Hash + trạng thái đọc thẳng DB (profile trong cache có thể cũ: đổi mật khẩu ở worker khác)
+        credentials = self.repo.get_user_credentials(user.id) if user else None
+        hashed_password = credentials[0] if credentials else None
         
         # ✅ BƯỚC 2: Ném lỗi cụ thể thay vì return tuple
-        if not user or not user.hashed_password or not bcrypt.check_password_hash(user.hashed_password, password):
+        if not hashed_password or not bcrypt.check_password_hash(hashed_password, password):
             raise InvalidLoginError("Email/Username hoặc mật khẩu không chính xác")
         
-        if not user.is_active:
-            raise UserInactiveError("Tài khoản đã bị khóa")
+        user = self.with_current_status(user, credentials[1:])
             
+        # Hash cũ khác cost hiện tại -> băm lại bằng mật khẩu vừa xác thực (không ảnh hưởng login)
+        if bcrypt.needs_rehash(hashed_password):
+            self._rehash_password(user, password)
+
         # 3. Thành công
         access_token = self._generate_access_token(user)
         refresh_token_data = self._generate_refresh_token(user)
@@ -80,14 +91,17 @@ class AuthService:
             jti = payload['jti']
             user_id = payload['sub']
 
+            # Luôn hỏi DB (1 query theo unique index jti, JOIN users): token bị thu hồi
+            # ở worker/instance nào cũng bị từ chối ngay, không chờ cache hết hạn
             # ✅ BƯỚC 2: Ném lỗi cụ thể
-            db_token = self.repo.get_refresh_token(jti)
-            if not db_token or db_token.expires_at < datetime.utcnow():
+            expires_at, user = self.repo.get_refresh_token_owner(jti) or (None, None)
+            if not expires_at or expires_at < datetime.utcnow():
                 raise InvalidTokenError("Refresh token không hợp lệ hoặc đã hết hạn")
             
-            user = self.repo.get_user_by_id(user_id)
-            if not user:
+            if user.id != user_id:
                 raise InvalidTokenError("Không tìm thấy người dùng của token")
+            if not user.is_active:
+                raise UserInactiveError("Tài khoản đã bị khóa")
             
             # Chỉ trả về access token khi thành công
             return self._generate_access_token(user)
@@ -115,14 +129,14 @@ class AuthService:
         except jwt.InvalidTokenError:
             raise InvalidTokenError("Token không hợp lệ")
 
-    def validate_access_token(self, access_token):
-        """Ném ra InvalidTokenError nếu thất bại."""
+    def validate_access_token(self, access_token, keys=None):
+        """
+        Ném ra InvalidTokenError nếu thất bại.
+        keys: dict dùng chung trong 1 batch để mỗi 'kid' chỉ tra key 1 lần.
+        """
         try:
-            payload = jwt.decode(
-                access_token,
-                current_app.config['JWT_SECRET_KEY'],
-                algorithms=['HS256']
-            )
+            key, algorithm = self._verification_key(access_token, {} if keys is None else keys)
+            payload = jwt.decode(access_token, key, algorithms=[algorithm])
             # Trả về thông tin user khi thành công
             return {'user_id': payload['sub'], 'role': payload['role']}
         except jwt.ExpiredSignatureError:
@@ -130,10 +144,64 @@ class AuthService:
         except jwt.InvalidTokenError:
             raise InvalidTokenError("Token không hợp lệ")
 
+    def _verification_key(self, access_token, keys):
+        if not signing_keys.asymmetric:
+            if 'HS256' not in keys:
+                keys['HS256'] = (current_app.config['JWT_SECRET_KEY'], 'HS256')
+            return keys['HS256']
+        # Chọn public key theo 'kid' trong header (key cũ vẫn hợp lệ trong thời gian chồng lấn)
+        kid = jwt.get_unverified_header(access_token).get('kid')
+        if kid not in keys:
+            keys[kid] = signing_keys.verification_key(access_token)
+        return keys[kid]
+
+    def validate_access_tokens(self, access_tokens):
+        """
+        Xác thực nhiều token trong 1 lần gọi, kết quả theo đúng thứ tự đầu vào.
+        Token lỗi không làm hỏng cả batch: {"valid": False, "error": ...}.
+        """
+        keys = {}
+        results = []
+        for access_token in access_tokens:
+            if not isinstance(access_token, str) or not access_token:
+                results.append({"valid": False, "error": "Token không hợp lệ"})
+                continue
+            try:
+                results.append({"valid": True, "user": self.validate_access_token(access_token, keys)})
+            except InvalidTokenError as e:
+                results.append({"valid": False, "error": str(e)})
+        return results
+
     # ==========================================================
     # CÁC HÀM HELPER VÀ DEBUG (Giữ nguyên, không cần sửa)
     # ==========================================================
 
+    def with_current_status(self, user, status=None):
+        """
+        Đọc lại role / is_active từ DB (1 query theo khoá chính) ngay trước khi phát token:
+        profile trong cache của worker này có thể đã cũ (user bị khoá / đổi role ở worker khác).
+        status: (role, is_active) nếu caller vừa đọc từ DB (login), khỏi query lần nữa.
+        Ném UserInactiveError nếu tài khoản bị khoá; trả về user với role hiện tại.
+        """
+        if status is None:
+            status = self.repo.get_user_status(user.id)
+        if status is None:
+            raise InvalidLoginError("Email/Username hoặc mật khẩu không chính xác")
+        role, is_active = status
+        if (role, is_active) != (user.role, user.is_active):
+            user_profile_cache.invalidate(user.id)   # cache lệch với DB -> bỏ entry cũ
+            user = to_profile(user)._replace(role=role, is_active=is_active)
+        if not is_active:
+            raise UserInactiveError("Tài khoản đã bị khóa")
+        return user
+
+    def _rehash_password(self, user, password):
+        try:
+            new_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        except HashingOverloadedError:
+            return  # Pool đang bận -> để lần đăng nhập sau
+        self.repo.update_password_hash(user, new_hash)
+
     def _generate_access_token(self, user):
         payload = {
             'iat': datetime.utcnow(),
@@ -142,6 +210,8 @@ class AuthService:
             'role': user.role,
             'username': user.username
         }
+        if signing_keys.asymmetric:
+            return signing_keys.sign(payload)
         return jwt.encode(payload, current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
 
     def _generate_refresh_token(self, user):
@@ -192,4 +262,55 @@ class AuthService:
             "id": user.id,
             "username": user.username,
             "providers": [i.provider for i in user.oauth_identities]
-        } for user in users]
\ No newline at end of file
+        } for user in users]
+
+    # ------------------------------------------------------------------
+    # Danh sách user cho admin (keyset pagination / stream NDJSON)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _user_summary(user):
+        return {
+            "id": user.id,
+            "email": user.email,
+            "username": user.username,
+            "role": user.role,
+            "is_active": user.is_active,
+            "created_at": user.created_at.isoformat(),
+            "providers": [i.provider for i in user.oauth_identities],
+        }
+
+    @staticmethod
+    def _encode_cursor(user):
+        raw = json.dumps([user.created_at.isoformat(), user.id]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            created_at, user_id = json.loads(raw)
+            return datetime.fromisoformat(created_at), str(user_id)
+        except (ValueError, TypeError):
+            raise MissingDataError("cursor không hợp lệ")
+
+    def list_users(self, limit, cursor=None):
+        """
+        1 trang user + next_cursor (None khi hết). Cursor là (created_at, id) của dòng cuối,
+        mã hoá base64 -> client chỉ việc gửi lại nguyên giá trị.
+        """
+        after = self._decode_cursor(cursor) if cursor else None
+        # Lấy dư 1 dòng để biết còn trang sau hay không
+        users = self.repo.list_users_page(limit + 1, after)
+        page = users[:limit]
+        next_cursor = self._encode_cursor(page[-1]) if len(users) > limit else None
+        return {
+            "items": [self._user_summary(u) for u in page],
+            "next_cursor": next_cursor,
+        }
+
+    def stream_users_ndjson(self, batch_size):
+        """Generator NDJSON (1 user / dòng), bộ nhớ không đổi theo số user."""
+        for user in self.repo.iter_users(batch_size):
+            yield json.dumps(self._user_summary(user), ensure_ascii=False) + "\n"
+
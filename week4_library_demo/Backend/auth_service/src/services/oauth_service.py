@@ -79,7 +79,8 @@ class OAuthService:
                 provider_user_id=provider_user_id
             )
 
-        # Tạo tokens
+        # Tạo tokens (role / is_active đọc lại từ DB, không tin profile trong cache)
+        user = self.auth_service.with_current_status(user)
         access_token = self.auth_service._generate_access_token(user)
         refresh_token_data = self.auth_service._generate_refresh_token(user)
 
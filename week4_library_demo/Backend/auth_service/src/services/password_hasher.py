@@ -0,0 +1,206 @@
+# auth_service/src/services/password_hasher.py
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import flask_bcrypt
+from prometheus_client import Counter, Histogram
+
+from ..exceptions import HashingOverloadedError
+
+logger = logging.getLogger("AuthPasswordHasher")
+
+DEFAULT_ROUNDS = 12   # mặc định của Flask-Bcrypt
+
+HASH_SECONDS = Histogram(
+    'auth_password_hash_seconds', 'Thời gian chạy bcrypt trong worker process',
+    ['operation'], buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2, 5),
+)
+HASH_QUEUE_WAIT = Histogram(
+    'auth_password_hash_queue_wait_seconds', 'Thời gian chờ trong hàng đợi trước khi worker bắt đầu băm',
+    ['operation'], buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+HASH_REJECTED = Counter(
+    'auth_password_hash_rejected_total', 'Số lần băm/kiểm tra mật khẩu bị từ chối do hàng đợi đầy',
+    ['operation'],
+)
+
+
+# --- Chạy trong worker process (phải là hàm module-level để pickle được) ---
+
+def _generate(password, rounds, submitted_at):
+    started_at = time.time()
+    hashed = flask_bcrypt.generate_password_hash(password, rounds)
+    return hashed, started_at - submitted_at, time.time() - started_at
+
+
+def _check(pw_hash, password, submitted_at):
+    started_at = time.time()
+    matched = flask_bcrypt.check_password_hash(pw_hash, password)
+    return matched, started_at - submitted_at, time.time() - started_at
+
+
+def hash_password(password, rounds):
+    """Băm 1 mật khẩu -> str (dùng cho import hàng loạt qua executor.map)."""
+    return flask_bcrypt.generate_password_hash(password, rounds).decode('utf-8')
+
+
+def hash_pool(workers):
+    """Process pool riêng cho tác vụ hàng loạt, không chiếm hàng đợi của login."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def measure_hash_seconds(rounds, samples=3):
+    """Thời gian (giây, trung vị) băm 1 mật khẩu với cost `rounds` trên máy hiện tại."""
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        flask_bcrypt.generate_password_hash('calibration-password', rounds)
+        durations.append(time.perf_counter() - start)
+    return sorted(durations)[len(durations) // 2]
+
+
+def calibrate_rounds(target_seconds, min_rounds=10, max_rounds=16):
+    """
+    Chọn cost bcrypt lớn nhất mà thời gian băm vẫn <= target_seconds (dùng trong
+    benchmark_bcrypt.py để chọn BCRYPT_LOG_ROUNDS, không chạy lúc khởi động service).
+    Mỗi cost +1 thì thời gian x2 -> đo từ min_rounds, dừng ở cost đầu tiên vượt target.
+    Không bao giờ trả về thấp hơn min_rounds (sàn bảo mật).
+    """
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        seconds = measure_hash_seconds(rounds, samples=3 if rounds == min_rounds else 1)
+        if seconds > target_seconds:
+            break
+        chosen = rounds
+    return chosen
+
+
+def hash_rounds(pw_hash):
+    """'$2b$12$...' -> 12 (None nếu không phải hash bcrypt)."""
+    if isinstance(pw_hash, bytes):
+        pw_hash = pw_hash.decode('utf-8', errors='replace')
+    parts = (pw_hash or '').split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """
+    Băm / kiểm tra mật khẩu bcrypt trong process pool riêng (cùng interface với flask_bcrypt).
+
+    - bcrypt là CPU-bound và giữ GIL -> chạy inline sẽ chặn cả worker thread của Flask.
+    - Hàng đợi có giới hạn: tối đa `workers + max_queue` tác vụ đang chờ/chạy; vượt quá
+      thì ném HashingOverloadedError ngay (controller trả 503) thay vì để độ trễ tăng vô hạn.
+    - workers=0 hoặc tắt PASSWORD_HASH_POOL_ENABLED -> chạy inline như cũ.
+    - Cost (`rounds`) lấy từ BCRYPT_LOG_ROUNDS (cố định, chọn bằng benchmark_bcrypt.py);
+      hash cũ có cost thấp hơn được băm lại khi đăng nhập (xem needs_rehash).
+    """
+
+    def __init__(self, workers=None, max_queue=32, timeout=10, rounds=DEFAULT_ROUNDS):
+        self.configure(workers, max_queue, timeout, rounds)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, workers=None, max_queue=32, timeout=10, rounds=DEFAULT_ROUNDS):
+        self.rounds = rounds
+        self.workers = (os.cpu_count() or 2) if workers is None else workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + max_queue)
+
+    def init_app(self, app):
+        enabled = app.config.get('PASSWORD_HASH_POOL_ENABLED', True)
+        rounds = app.config.get('BCRYPT_LOG_ROUNDS') or DEFAULT_ROUNDS
+        # Flask-Bcrypt (bcrypt.init_app) dùng cùng key -> giữ 2 nơi đồng bộ
+        app.config['BCRYPT_LOG_ROUNDS'] = rounds
+        self.configure(
+            workers=app.config.get('PASSWORD_HASH_WORKERS') if enabled else 0,
+            max_queue=app.config.get('PASSWORD_HASH_MAX_QUEUE', 32),
+            timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10),
+            rounds=rounds,
+        )
+        app.extensions['password_hasher'] = self
+
+    def _get_executor(self):
+        # Tạo lười trong từng worker gunicorn (sau fork); 'spawn' tránh fork process đang có thread
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = hash_pool(self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """Worker process chết (OOM-kill / crash) -> pool hỏng vĩnh viễn, lần gọi sau tạo pool mới."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.error("Password hashing process pool is broken, recreating it")
+
+    def _submit(self, fn, *args):
+        """Gửi tác vụ vào pool -> (executor, future); slot hàng đợi được trả khi tác vụ xong."""
+        executor = None
+        try:
+            executor = self._get_executor()
+            future = executor.submit(fn, *args, time.time())
+        except BaseException as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard_executor(executor)
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return executor, future
+
+    def _run(self, operation, fn, *args):
+        if self.workers <= 0:
+            result, queue_wait, duration = fn(*args, time.time())
+        else:
+            if not self._slots.acquire(blocking=False):
+                HASH_REJECTED.labels(operation=operation).inc()
+                raise HashingOverloadedError("Hệ thống đang quá tải, vui lòng thử lại sau")
+            try:
+                executor, future = self._submit(fn, *args)
+                try:
+                    result, queue_wait, duration = future.result(timeout=self.timeout)
+                except BrokenProcessPool:
+                    self._discard_executor(executor)
+                    raise
+            except (FutureTimeoutError, BrokenProcessPool):
+                HASH_REJECTED.labels(operation=operation).inc()
+                raise HashingOverloadedError("Hệ thống đang quá tải, vui lòng thử lại sau")
+
+        HASH_QUEUE_WAIT.labels(operation=operation).observe(max(queue_wait, 0.0))
+        HASH_SECONDS.labels(operation=operation).observe(duration)
+        return result
+
+    def generate_password_hash(self, password):
+        return self._run('generate', _generate, password, self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run('check', _check, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """
+        Hash có cost THẤP hơn cost cấu hình -> nên băm lại (khi có mật khẩu gốc).
+        Không hạ cost của hash mạnh hơn: tránh băm đi băm lại khi các instance lệch cấu hình.
+        """
+        rounds = hash_rounds(pw_hash)
+        return rounds is not None and rounds < self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
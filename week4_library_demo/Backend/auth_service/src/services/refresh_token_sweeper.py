@@ -0,0 +1,63 @@
+# auth_service/src/services/refresh_token_sweeper.py
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger("AuthRefreshTokens")
+
+class RefreshTokenSweeper:
+    """
+    Thread nền xoá refresh token đã hết hạn hoặc bị thu hồi theo từng lô nhỏ
+    (mỗi lô 1 transaction ngắn, nghỉ giữa các lô) để không giữ lock lâu trên bảng.
+    """
+
+    def __init__(self, app, repo, interval=300, batch_size=500, pause=0.05):
+        self.app = app
+        self.repo = repo
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_app(cls, app, repo):
+        return cls(
+            app, repo,
+            interval=app.config.get('REFRESH_TOKEN_SWEEP_INTERVAL', 300),
+            batch_size=app.config.get('REFRESH_TOKEN_SWEEP_BATCH', 500),
+            pause=app.config.get('REFRESH_TOKEN_SWEEP_PAUSE', 0.05),
+        )
+
+    def sweep_once(self):
+        """Xoá hết các dòng cần xoá tại thời điểm gọi; trả về tổng số dòng đã xoá."""
+        total = 0
+        now = datetime.utcnow()
+        with self.app.app_context():
+            while not self._stop.is_set():
+                deleted = self.repo.delete_stale_refresh_tokens(now, self.batch_size)
+                total += deleted
+                if deleted < self.batch_size:
+                    break
+                self._stop.wait(self.pause)
+        if total:
+            logger.info(f"Deleted {total} expired/revoked refresh tokens")
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep_once()
+            except Exception:
+                logger.exception("Refresh token sweep failed")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="refresh-token-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
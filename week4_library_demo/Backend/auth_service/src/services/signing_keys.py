@@ -0,0 +1,205 @@
+# auth_service/src/services/signing_keys.py
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+logger = logging.getLogger("AuthSigningKeys")
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'EdDSA')
+
+
+def _generate_private_key(algorithm):
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class SigningKey:
+    def __init__(self, kid, algorithm, private_key, created_at):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.created_at = created_at
+
+    def jwk(self):
+        converter = OKPAlgorithm if self.algorithm == 'EdDSA' else RSAAlgorithm
+        jwk = converter.to_jwk(self.public_key, as_dict=True)
+        jwk.update({'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'})
+        return jwk
+
+
+class SigningKeyRing:
+    """
+    Bộ key ký access token (RS256 / EdDSA) có 'kid', xoay vòng theo thời gian.
+
+    - Private key lưu dạng PEM trong `keys_dir` (<created_ts>-<random>.pem); các worker gunicorn
+      (và replica nếu mount chung volume) cùng đọc 1 thư mục -> cùng key, cùng JWKS.
+    - Xoay key: key đang ký quá `rotation_seconds` -> sinh key mới. Key mới được công bố
+      trong JWKS `prepublish_seconds` (>= max-age JWKS) trước khi dùng để ký, để verifier
+      đang cache JWKS cũ không gặp kid lạ.
+    - Key cũ vẫn nằm trong JWKS thêm `overlap_seconds` (>= thời hạn access token) sau khi
+      key kế nhiệm bắt đầu ký, rồi mới bị xoá.
+    - algorithm='HS256': giữ cách cũ (JWT_SECRET_KEY dùng chung), JWKS rỗng.
+    """
+
+    def __init__(self, algorithm='HS256', keys_dir=None, rotation_seconds=30 * 86400,
+                 overlap_seconds=86400, prepublish_seconds=3600, reload_seconds=60):
+        self.algorithm = algorithm
+        self.keys_dir = keys_dir
+        self.rotation_seconds = rotation_seconds
+        self.overlap_seconds = overlap_seconds
+        self.prepublish_seconds = prepublish_seconds
+        self.reload_seconds = reload_seconds
+
+        self._keys = []          # sắp theo created_at tăng dần
+        self._loaded_at = 0.0
+        self._jwks_body = None
+        self._jwks_etag = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.algorithm = config.get('JWT_ALGORITHM', 'HS256')
+        self.keys_dir = config.get('JWT_KEYS_DIR')
+        self.rotation_seconds = config.get('JWT_KEY_ROTATION_DAYS', 30) * 86400
+        self.overlap_seconds = config.get('JWT_KEY_OVERLAP_HOURS', 24) * 3600
+        self.prepublish_seconds = config.get('JWKS_MAX_AGE', 3600)
+        if self.asymmetric:
+            if self.algorithm not in ASYMMETRIC_ALGORITHMS:
+                raise ValueError(f"Unsupported JWT_ALGORITHM: {self.algorithm}")
+            os.makedirs(self.keys_dir, exist_ok=True)
+            self.rotate_if_due()
+        app.extensions['signing_keys'] = self
+
+    @property
+    def asymmetric(self):
+        return self.algorithm != 'HS256'
+
+    # ------------------------------------------------------------------
+    # Đọc / sinh key trên đĩa
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        keys = []
+        for name in sorted(os.listdir(self.keys_dir)):
+            if not name.endswith('.pem'):
+                continue
+            kid = name[:-4]
+            try:
+                created_at = int(kid.split('-', 1)[0])
+                with open(os.path.join(self.keys_dir, name), 'rb') as f:
+                    private_key = serialization.load_pem_private_key(f.read(), password=None)
+            except (ValueError, OSError):
+                logger.warning(f"Skipping unreadable signing key {name}")
+                continue
+            algorithm = 'EdDSA' if isinstance(private_key, ed25519.Ed25519PrivateKey) else 'RS256'
+            keys.append(SigningKey(kid, algorithm, private_key, created_at))
+        keys.sort(key=lambda k: k.created_at)
+
+        body = json.dumps({'keys': [k.jwk() for k in keys]}, sort_keys=True, separators=(',', ':'))
+        with self._lock:
+            self._keys = keys
+            self._jwks_body = body
+            self._jwks_etag = hashlib.sha256(body.encode()).hexdigest()[:32]
+            self._loaded_at = time.monotonic()
+
+    def _maybe_reload(self, force=False):
+        # force (kid lạ) vẫn giới hạn 1 lần/giây để token giả kid không làm đọc đĩa liên tục
+        age = time.monotonic() - self._loaded_at
+        if age > self.reload_seconds or (force and age > 1):
+            self._load()
+
+    def _write_key(self, now):
+        kid = f"{now}-{secrets.token_hex(4)}"
+        pem = _generate_private_key(self.algorithm).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        )
+        path = os.path.join(self.keys_dir, f"{kid}.pem")
+        fd = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+        os.replace(path + '.tmp', path)   # worker khác không bao giờ đọc file ghi dở
+        logger.info(f"Generated {self.algorithm} signing key {kid}")
+
+    def rotate_if_due(self):
+        """Sinh key mới khi cần và xoá key đã hết thời gian chồng lấn (an toàn khi nhiều worker gọi)."""
+        with open(os.path.join(self.keys_dir, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._load()
+                now = int(time.time())
+                keys = [k for k in self._keys if k.algorithm == self.algorithm]
+                if not keys or now - keys[-1].created_at >= self.rotation_seconds:
+                    self._write_key(now)
+
+                self._load()
+                # Key bị thay thế khi key kế nhiệm đã ký đủ lâu (prepublish + overlap)
+                for older, newer in zip(self._keys, self._keys[1:]):
+                    if now - newer.created_at >= self.prepublish_seconds + self.overlap_seconds:
+                        os.remove(os.path.join(self.keys_dir, f"{older.kid}.pem"))
+                        logger.info(f"Retired signing key {older.kid}")
+                self._load()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------
+    # Ký / xác thực / JWKS
+    # ------------------------------------------------------------------
+
+    def _signing_key(self):
+        """Key mới nhất đã được công bố đủ lâu; nếu chưa có thì dùng key cũ hơn."""
+        now = time.time()
+        with self._lock:
+            keys = [k for k in self._keys if k.algorithm == self.algorithm]
+        if not keys:
+            raise RuntimeError("No signing key available")
+        published = [k for k in keys if now - k.created_at >= self.prepublish_seconds]
+        # Lần khởi động đầu tiên (chỉ có 1 key) -> ký ngay
+        return published[-1] if published else keys[0]
+
+    def sign(self, payload):
+        self._maybe_reload()
+        if self._keys and time.time() - self._keys[-1].created_at >= self.rotation_seconds:
+            self.rotate_if_due()
+        key = self._signing_key()
+        return jwt.encode(payload, key.private_key, algorithm=key.algorithm, headers={'kid': key.kid})
+
+    def verification_key(self, token):
+        """(public_key, algorithm) theo 'kid' của token; kid lạ -> đọc lại thư mục key 1 lần."""
+        header = jwt.get_unverified_header(token)
+        kid = header.get('kid')
+        self._maybe_reload()
+        key = self._find(kid)
+        if key is None:
+            self._maybe_reload(force=True)
+            key = self._find(kid)
+        if key is None or header.get('alg') != key.algorithm:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return key.public_key, key.algorithm
+
+    def _find(self, kid):
+        with self._lock:
+            return next((k for k in self._keys if k.kid == kid), None)
+
+    def jwks(self):
+        """(body JSON, ETag chưa có dấu nháy) của JWKS hiện tại."""
+        if not self.asymmetric:
+            return '{"keys":[]}', 'empty'
+        self._maybe_reload()
+        with self._lock:
+            return self._jwks_body, self._jwks_etag
+
+
+signing_keys = SigningKeyRing()
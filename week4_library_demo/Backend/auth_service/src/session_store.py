@@ -0,0 +1,137 @@
+# auth_service/src/session_store.py
+
+"""
+Session store 1 file SQLite (WAL) thay cho SESSION_TYPE=filesystem (mỗi session 1 file,
+không bao giờ được dọn -> thư mục flask_sessions/ phình mãi).
+
+Cài đặt theo interface của cachelib nên cắm thẳng vào Flask-Session qua
+SESSION_TYPE="cachelib" + SESSION_CACHELIB=SQLiteSessionCache(...): Session(app) và
+các controller OAuth (session[...] của authlib) không phải đổi gì.
+
+- Tra cứu theo khoá chính (WITHOUT ROWID) -> 1 lần tìm B-tree, không stat/mở file.
+- Mỗi dòng có expires_at: get() bỏ qua dòng hết hạn; cứ `cleanup_every` lần ghi thì xoá
+  tối đa `cleanup_batch` dòng hết hạn (transaction ngắn, không khoá lâu).
+- WAL: nhiều worker gunicorn đọc song song, ghi không chặn đọc.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from cachelib.base import BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at);
+"""
+
+NEVER = float('inf')
+
+
+class SQLiteSessionCache(BaseCache):
+
+    def __init__(self, path, default_timeout=300, max_timeout=86400, cleanup_every=100,
+                 cleanup_batch=500, busy_timeout=5):
+        super().__init__(default_timeout)
+        self.path = path
+        # Flask-Session truyền PERMANENT_SESSION_LIFETIME (mặc định 31 ngày) làm TTL;
+        # session ở đây chỉ giữ state OAuth -> chặn trên để dữ liệu rác hết hạn sớm
+        self.max_timeout = max_timeout
+        self.cleanup_every = cleanup_every
+        self.cleanup_batch = cleanup_batch
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # 1 connection / thread / process (connection SQLite không dùng chung qua fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")   # WAL + NORMAL: không fsync mỗi commit
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expires_at(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        if self.max_timeout:
+            timeout = min(timeout, self.max_timeout) if timeout else self.max_timeout
+        return NEVER if timeout == 0 else time.time() + timeout
+
+    # ------------------------------------------------------------------
+    # Interface cachelib (Flask-Session dùng get / set / delete)
+    # ------------------------------------------------------------------
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM sessions WHERE key = ? AND expires_at > ?", (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except (pickle.PickleError, EOFError, AttributeError, ImportError):
+            return None
+
+    def set(self, key, value, timeout=None):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires_at(timeout)),
+        )
+        self._after_write()
+        return True
+
+    def add(self, key, value, timeout=None):
+        now = time.time()
+        conn = self._connect()
+        # Dòng đã hết hạn coi như không tồn tại
+        conn.execute("DELETE FROM sessions WHERE key = ? AND expires_at <= ?", (key, now))
+        added = conn.execute(
+            "INSERT OR IGNORE INTO sessions (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires_at(timeout)),
+        ).rowcount == 1
+        self._after_write()
+        return added
+
+    def delete(self, key):
+        return self._connect().execute("DELETE FROM sessions WHERE key = ?", (key,)).rowcount == 1
+
+    def has(self, key):
+        return self._connect().execute(
+            "SELECT 1 FROM sessions WHERE key = ? AND expires_at > ?", (key, time.time()),
+        ).fetchone() is not None
+
+    def clear(self):
+        self._connect().execute("DELETE FROM sessions")
+        return True
+
+    # ------------------------------------------------------------------
+    # Dọn session hết hạn theo lô
+    # ------------------------------------------------------------------
+
+    def _after_write(self):
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.cleanup_every == 0
+        if due:
+            self.cleanup()
+
+    def cleanup(self):
+        """Xoá tối đa cleanup_batch session hết hạn; trả về số dòng đã xoá."""
+        return self._connect().execute(
+            "DELETE FROM sessions WHERE key IN "
+            "(SELECT key FROM sessions WHERE expires_at <= ? LIMIT ?)",
+            (time.time(), self.cleanup_batch),
+        ).rowcount
@@ -1,14 +1,21 @@
 import pytest
+import time
 import jwt # Cần import để mock các lỗi của nó
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, call
 
 # Import các lớp cần test và mock
 from src.services.auth_service import AuthService
 from src.repositories.user_repository import UserRepository
 from src.models.user_model import User
+from src.services.password_hasher import PasswordHasher, hash_rounds
+from src.services.signing_keys import SigningKeyRing
+from src.repositories.user_profile_cache import UserProfile, UserProfileCache
+from src.session_store import SQLiteSessionCache
+from src.services.user_import import UserImporter, iter_import_rows
 from src.exceptions import (
     AuthError, InvalidLoginError, UserInactiveError, 
-    UserAlreadyExistsError, InvalidTokenError
+    UserAlreadyExistsError, InvalidTokenError, HashingOverloadedError
 )
 
 # ====================================================================
@@ -18,7 +25,11 @@ from src.exceptions import (
 @pytest.fixture
 def mock_repo(mocker):
     """Giả mạo (mock) UserRepository"""
-    return mocker.Mock(spec=UserRepository)
+    repo = mocker.Mock(spec=UserRepository)
+    # (hashed_password, role, is_active) / (role, is_active) đọc lại từ DB: mặc định khớp với mock_user
+    repo.get_user_credentials.return_value = ('real_hashed_password', 'user', True)
+    repo.get_user_status.return_value = ('user', True)
+    return repo
 
 @pytest.fixture
 def mock_bcrypt(mocker):
@@ -28,6 +39,8 @@ def mock_bcrypt(mocker):
     bcrypt.generate_password_hash.return_value.decode.return_value = 'hashed_password_string'
     # Mặc định là check pass thành công
     bcrypt.check_password_hash.return_value = True
+    # Mặc định hash đã đúng cost, không cần băm lại
+    bcrypt.needs_rehash.return_value = False
     return bcrypt
 
 @pytest.fixture
@@ -59,6 +72,17 @@ def mock_user():
     user.hashed_password = 'real_hashed_password' # Giả sử đây là hash thật
     return user
 
+@pytest.fixture
+def app_context():
+    """App context tối giản (MagicMock(spec=User) chạm tới User.query -> cần app context)"""
+    from flask import Flask
+    from src.database import db
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        yield app
+
 @pytest.fixture
 def auth_service(mocker, mock_repo, mock_bcrypt, mock_current_app):
     """
@@ -164,9 +188,10 @@ def test_login_user_wrong_password(auth_service, mock_repo, mock_bcrypt, mock_us
 
 def test_login_user_inactive(auth_service, mock_repo, mock_user):
     """Test Sad Path: User bị khóa"""
-    # Setup: User bị inactive
+    # Setup: User bị inactive (trạng thái đọc từ DB)
     mock_user.is_active = False
     mock_repo.get_user_by_login.return_value = mock_user
+    mock_repo.get_user_credentials.return_value = ('real_hashed_password', 'user', False)
     
     with pytest.raises(UserInactiveError, match="Tài khoản đã bị khóa"):
         auth_service.login_user("test@example.com", "123")
@@ -176,6 +201,7 @@ def test_login_user_oauth_account(auth_service, mock_repo, mock_user):
     # Setup: User không có password hash (lỗi 'Invalid salt' của bạn)
     mock_user.hashed_password = None
     mock_repo.get_user_by_login.return_value = mock_user
+    mock_repo.get_user_credentials.return_value = (None, 'user', True)
     
     with pytest.raises(InvalidLoginError):
         auth_service.login_user("test@example.com", "123")
@@ -183,6 +209,91 @@ def test_login_user_oauth_account(auth_service, mock_repo, mock_user):
     # Quan trọng: Đảm bảo KHÔNG GỌI check_password_hash
     assert auth_service.repo.check_password_hash.called is False
 
+def test_login_user_rehash_on_cost_change(app_context, auth_service, mock_repo, mock_bcrypt, mock_user):
+    """Test: Hash cũ có cost thấp hơn cấu hình -> băm lại và lưu khi đăng nhập thành công"""
+    mock_repo.get_user_by_login.return_value = mock_user
+    mock_bcrypt.needs_rehash.return_value = True
+    
+    auth_service.login_user("test@example.com", "123")
+    
+    mock_bcrypt.generate_password_hash.assert_called_with("123")
+    mock_repo.update_password_hash.assert_called_once_with(mock_user, 'hashed_password_string')
+
+def test_login_user_rejects_stale_cached_profile(auth_service, mock_repo, mocker):
+    """Test: Profile trong cache còn active nhưng DB đã khoá (ở worker khác) -> từ chối, bỏ cache"""
+    profile = UserProfile('u1', 'test@example.com', 'testuser', 'user', True, None, None)
+    mock_repo.get_user_by_login.return_value = profile
+    mock_repo.get_user_credentials.return_value = ('hash', 'user', False)
+    invalidate = mocker.patch('src.services.auth_service.user_profile_cache.invalidate')
+    
+    with pytest.raises(UserInactiveError):
+        auth_service.login_user("test@example.com", "123")
+    
+    mock_repo.get_user_credentials.assert_called_once_with('u1')
+    invalidate.assert_called_once_with('u1')
+
+def test_login_user_checks_password_against_db_hash(auth_service, mock_repo, mock_bcrypt):
+    """Test: Mật khẩu vừa đổi ở worker khác -> so với hash trong DB, không phải bản trong cache"""
+    profile = UserProfile('u1', 'test@example.com', 'testuser', 'user', True, None, None)
+    mock_repo.get_user_by_login.return_value = profile
+    mock_repo.get_user_credentials.return_value = ('new_hash', 'user', True)
+    mock_bcrypt.check_password_hash.return_value = False
+    
+    with pytest.raises(InvalidLoginError):
+        auth_service.login_user("test@example.com", "old_password")
+    
+    mock_bcrypt.check_password_hash.assert_called_once_with('new_hash', 'old_password')
+
+def test_login_user_token_uses_current_role(auth_service, mock_repo, mocker):
+    """Test: Role bị đổi ở worker khác -> token mang role đọc từ DB, không phải role trong cache"""
+    profile = UserProfile('u1', 'test@example.com', 'testuser', 'user', True, None, None)
+    mock_repo.get_user_by_login.return_value = profile
+    mock_repo.get_user_credentials.return_value = ('hash', 'admin', True)
+    mocker.patch('src.services.auth_service.user_profile_cache.invalidate')
+    mocker.patch('src.services.auth_service.RefreshToken')
+    
+    user, access_token, _ = auth_service.login_user("test@example.com", "123")
+    
+    assert user.role == 'admin'
+    assert jwt.decode(access_token, 'test_secret_key', algorithms=['HS256'])['role'] == 'admin'
+
+# ====================================================================
+# TEST HÀM: refresh_access_token / logout_user
+# ====================================================================
+
+def test_refresh_access_token_checks_db_every_time(auth_service, mock_repo, mock_jwt):
+    """Test: Mỗi lần refresh đều hỏi DB (1 query token + user), không phụ thuộc cache của worker"""
+    mock_jwt.return_value = {'jti': 'jti-1', 'sub': 'user-uuid-123'}
+    user = MagicMock(id='user-uuid-123', role='user', username='testuser')
+    mock_repo.get_refresh_token_owner.return_value = (datetime.utcnow() + timedelta(days=1), user)
+    
+    assert auth_service.refresh_access_token("refresh_token") is not None
+    assert auth_service.refresh_access_token("refresh_token") is not None
+    
+    assert mock_repo.get_refresh_token_owner.call_count == 2
+    mock_repo.get_user_by_id.assert_not_called()
+
+def test_refresh_rejects_inactive_user(auth_service, mock_repo, mock_jwt):
+    """Test: User bị khoá sau khi đăng nhập -> không cấp access token mới"""
+    mock_jwt.return_value = {'jti': 'jti-1', 'sub': 'user-uuid-123'}
+    user = MagicMock(id='user-uuid-123', role='user', username='testuser', is_active=False)
+    mock_repo.get_refresh_token_owner.return_value = (datetime.utcnow() + timedelta(days=1), user)
+    
+    with pytest.raises(UserInactiveError):
+        auth_service.refresh_access_token("refresh_token")
+
+def test_refresh_after_logout_rejected(auth_service, mock_repo, mock_jwt):
+    """Test: Token đã thu hồi (ở bất kỳ worker nào) -> DB không trả về -> refresh bị từ chối"""
+    mock_jwt.return_value = {'jti': 'jti-1', 'sub': 'user-uuid-123'}
+    mock_repo.revoke_refresh_token.return_value = True
+    
+    auth_service.logout_user("refresh_token")
+    
+    mock_repo.revoke_refresh_token.assert_called_once_with('jti-1')
+    mock_repo.get_refresh_token_owner.return_value = None
+    with pytest.raises(InvalidTokenError):
+        auth_service.refresh_access_token("refresh_token")
+
 # ====================================================================
 # TEST HÀM: validate_access_token
 # ====================================================================
@@ -219,4 +330,237 @@ def test_validate_access_token_invalid(auth_service, mock_jwt):
     mock_jwt.side_effect = jwt.InvalidTokenError
     
     with pytest.raises(InvalidTokenError, match="Token không hợp lệ"):
-        auth_service.validate_access_token("invalid_token")
\ No newline at end of file
+        auth_service.validate_access_token("invalid_token")
+
+# ====================================================================
+# TEST: PasswordHasher (bcrypt trong process pool)
+# ====================================================================
+
+def test_password_hasher_inline_roundtrip():
+    """workers=0: băm/kiểm tra inline, kết quả giống flask_bcrypt"""
+    hasher = PasswordHasher(workers=0)
+    
+    hashed = hasher.generate_password_hash("123456")
+    
+    assert hashed.startswith(b"$2b$")
+    assert hasher.check_password_hash(hashed.decode('utf-8'), "123456") is True
+    assert hasher.check_password_hash(hashed.decode('utf-8'), "wrong") is False
+
+def test_password_hasher_queue_full(mocker):
+    """Test Sad Path: Hàng đợi đầy -> ném HashingOverloadedError ngay, không gửi vào pool"""
+    hasher = PasswordHasher(workers=1, max_queue=0)
+    get_executor = mocker.patch.object(hasher, '_get_executor')
+    # Chiếm hết slot (1 worker + 0 hàng đợi)
+    hasher._slots.acquire()
+    
+    with pytest.raises(HashingOverloadedError):
+        hasher.check_password_hash("hash", "123")
+    
+    get_executor.assert_not_called()
+
+def test_password_hasher_recreates_broken_pool(mocker):
+    """Worker process chết -> lần gọi đó trả 503 (HashingOverloadedError), lần sau dùng pool mới"""
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+    hasher = PasswordHasher(workers=1, max_queue=0)
+    broken = mocker.Mock()
+    failed = Future()
+    failed.set_exception(BrokenProcessPool("worker died"))
+    broken.submit.return_value = failed
+    healthy = mocker.Mock()
+    done = Future()
+    done.set_result((True, 0.0, 0.01))
+    healthy.submit.return_value = done
+    mocker.patch('src.services.password_hasher.hash_pool', side_effect=[broken, healthy])
+    
+    with pytest.raises(HashingOverloadedError):
+        hasher.check_password_hash("hash", "123")
+    broken.shutdown.assert_called_once()
+    
+    # Slot hàng đợi đã được trả, pool mới được tạo
+    assert hasher.check_password_hash("hash", "123") is True
+
+def test_password_hasher_needs_rehash():
+    """Chỉ hash có cost thấp hơn cost cấu hình mới cần băm lại"""
+    hasher = PasswordHasher(workers=0, rounds=12)
+    
+    assert hash_rounds("$2b$10$abcdefghijklmnopqrstuv") == 10
+    assert hasher.needs_rehash("$2b$10$abcdefghijklmnopqrstuv") is True
+    assert hasher.needs_rehash("$2b$12$abcdefghijklmnopqrstuv") is False
+    # Hash mạnh hơn (instance khác cấu hình cost cao hơn) -> giữ nguyên, không hạ cost
+    assert hasher.needs_rehash("$2b$13$abcdefghijklmnopqrstuv") is False
+    # Không phải hash bcrypt (vd user OAuth) -> bỏ qua
+    assert hasher.needs_rehash(None) is False
+
+def test_user_profile_cache_lookup_and_invalidate():
+    """Cache profile tra được theo id / email / username; invalidate xoá mọi chỉ mục"""
+    cache = UserProfileCache(max_entries=10, ttl=60)
+    profile = UserProfile('u1', 'test@example.com', 'testuser', 'user', True, None, None)
+    cache.put(profile)
+    
+    assert cache.get('id', 'u1') == profile
+    assert cache.get('email', 'test@example.com') == profile
+    assert cache.get('username', 'testuser') == profile
+    
+    cache.invalidate('u1')
+    
+    assert cache.get('email', 'test@example.com') is None
+    assert cache.get('username', 'testuser') is None
+
+# ====================================================================
+# TEST: Ký access token bất đối xứng (kid + JWKS)
+# ====================================================================
+
+@pytest.fixture
+def eddsa_keys(mocker, tmp_path):
+    """Key ring EdDSA trong thư mục tạm, thay cho singleton của service"""
+    ring = SigningKeyRing('EdDSA', str(tmp_path), prepublish_seconds=0)
+    ring.rotate_if_due()
+    mocker.patch('src.services.auth_service.signing_keys', ring)
+    return ring
+
+def test_asymmetric_access_token_roundtrip(auth_service, eddsa_keys):
+    """Token ký bằng key có 'kid', xác thực lại được và kid có trong JWKS"""
+    user = MagicMock(id='user-uuid-123', role='user', username='testuser')
+    
+    token = auth_service._generate_access_token(user)
+    
+    kid = jwt.get_unverified_header(token)['kid']
+    body, etag = eddsa_keys.jwks()
+    assert kid in body
+    assert auth_service.validate_access_token(token) == {'user_id': 'user-uuid-123', 'role': 'user'}
+
+def test_asymmetric_access_token_unknown_kid(auth_service, eddsa_keys, tmp_path):
+    """Test Sad Path: Token ký bằng key không có trong key ring -> không hợp lệ"""
+    other = SigningKeyRing('EdDSA', str(tmp_path / 'other'), prepublish_seconds=0)
+    (tmp_path / 'other').mkdir()
+    other.rotate_if_due()
+    token = other.sign({'sub': 'user-uuid-123', 'role': 'admin'})
+    
+    with pytest.raises(InvalidTokenError, match="Token không hợp lệ"):
+        auth_service.validate_access_token(token)
+
+def test_validate_access_tokens_batch(auth_service, eddsa_keys, mocker):
+    """Kết quả theo thứ tự đầu vào, token lỗi không làm hỏng batch, mỗi kid chỉ tra key 1 lần"""
+    user = MagicMock(id='user-uuid-123', role='user', username='testuser')
+    token = auth_service._generate_access_token(user)
+    lookup = mocker.spy(eddsa_keys, 'verification_key')
+    
+    results = auth_service.validate_access_tokens([token, 'garbage', None, token])
+    
+    assert results[0] == {'valid': True, 'user': {'user_id': 'user-uuid-123', 'role': 'user'}}
+    assert results[1] == {'valid': False, 'error': 'Token không hợp lệ'}
+    assert results[2] == {'valid': False, 'error': 'Token không hợp lệ'}
+    assert results[3] == results[0]
+    assert lookup.call_count == 1
+
+# ====================================================================
+# TEST: Session store SQLite (thay cho file-per-session)
+# ====================================================================
+
+def test_sqlite_session_store_ttl_and_cleanup(mocker, tmp_path):
+    """Session hết hạn không đọc được nữa và được dọn theo lô"""
+    store = SQLiteSessionCache(str(tmp_path / "sessions.sqlite3"), cleanup_every=1000, cleanup_batch=2)
+    store.set("session:a", {"state": "xyz"}, timeout=60)
+    store.set("session:b", {"state": "1"}, timeout=60)
+    store.set("session:c", {"state": "2"}, timeout=60)
+    
+    assert store.get("session:a") == {"state": "xyz"}
+    
+    # Giả lập 2 phút sau
+    mocker.patch('src.session_store.time.time', return_value=time.time() + 120)
+    assert store.get("session:a") is None
+    assert store.cleanup() == 2   # tối đa cleanup_batch dòng mỗi lần
+    assert store.cleanup() == 1
+
+# ====================================================================
+# TEST: Import user hàng loạt
+# ====================================================================
+
+def test_user_import_dedupes_and_reports_row_errors(mocker):
+    """Trùng trong file / trùng DB / dữ liệu thiếu được báo theo dòng; lô lỗi ràng buộc insert lại từng dòng"""
+    from concurrent.futures import ThreadPoolExecutor
+    mocker.patch('src.services.user_import.hash_pool', lambda workers: ThreadPoolExecutor(workers))
+    importer = UserImporter(chunk_size=10, workers=2, rounds=4)
+    importer.repo = mocker.Mock(spec=UserRepository)
+    importer.repo.find_existing_logins.return_value = ({'old@x.com'}, set())
+    # Cả lô vướng unique constraint -> thử lại từng dòng, dòng thứ 2 vẫn trùng
+    importer.repo.bulk_add_users.side_effect = [False, True, False]
+    csv_data = (
+        b"email,username,password\n"
+        b"A@x.com,alice,pw1\n"
+        b"b@x.com,bob,pw2\n"
+        b"a@x.com,alice2,pw3\n"
+        b"old@x.com,old,pw4\n"
+        b"c@x.com,,pw5\n"
+    )
+    
+    report = importer.run(iter_import_rows(iter(csv_data.splitlines(keepends=True)), 'csv'))
+    
+    assert report["total_rows"] == 5
+    assert report["created"] == 1
+    assert report["duplicates"] == 3
+    assert report["failed"] == 1
+    assert [e["row"] for e in report["errors"]] == [4, 6, 5, 3]
+    inserted = importer.repo.bulk_add_users.call_args_list[0].args[0]
+    assert [m['email'] for m in inserted] == ['a@x.com', 'b@x.com']
+    assert inserted[0]['hashed_password'].startswith('$2b$04$')
+
+# ====================================================================
+# TEST: Danh sách user (keyset pagination)
+# ====================================================================
+
+def test_list_users_keyset_cursor(auth_service, mock_repo):
+    """Lấy dư 1 dòng để biết còn trang; cursor trang sau là (created_at, id) của dòng cuối"""
+    created_at = datetime(2026, 1, 1, 8, 30)
+    users = [
+        MagicMock(id=f'id-{i}', email=f'u{i}@x.com', username=f'u{i}', role='user',
+                  is_active=True, created_at=created_at, oauth_identities=[])
+        for i in range(3)
+    ]
+    mock_repo.list_users_page.return_value = users
+    
+    page = auth_service.list_users(2)
+    
+    mock_repo.list_users_page.assert_called_once_with(3, None)
+    assert [u['id'] for u in page['items']] == ['id-0', 'id-1']
+    # Gửi lại cursor -> repo nhận đúng (created_at, id) của dòng cuối trang
+    mock_repo.list_users_page.return_value = users[2:]
+    next_page = auth_service.list_users(2, page['next_cursor'])
+    mock_repo.list_users_page.assert_called_with(3, (created_at, 'id-1'))
+    assert next_page['next_cursor'] is None
+    
+    with pytest.raises(AuthError, match="cursor không hợp lệ"):
+        auth_service.list_users(2, 'not-a-cursor')
+
+
+@pytest.fixture
+def controller_client(mocker):
+    """Flask app tối giản chỉ gồm auth_bp, AuthService.list_users được mock"""
+    from flask import Flask
+    from src.controllers.auth_controller import auth_bp
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test_secret_key'
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    mocker.patch.object(AuthService, 'list_users', return_value={'items': [], 'next_cursor': None})
+    return app.test_client()
+
+def bearer(role):
+    token = jwt.encode({'sub': 'user-uuid-123', 'role': role, 'exp': datetime.utcnow() + timedelta(minutes=5)},
+                       'test_secret_key', algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+def test_list_users_requires_admin_token(controller_client):
+    """Gọi thẳng vào service (bỏ qua Gateway): không token -> 401, user thường -> 403"""
+    assert controller_client.get('/auth/users').status_code == 401
+    assert controller_client.get('/auth/users', headers=bearer('user')).status_code == 403
+    assert controller_client.get('/auth/users', headers=bearer('ADMIN')).status_code == 200
+
+def test_import_users_requires_admin_token(controller_client, mocker):
+    """Không đủ quyền -> bị chặn trước khi đọc file / băm mật khẩu"""
+    run = mocker.patch.object(UserImporter, 'run', return_value={'created': 0})
+    body = b"email,username,password\na@x.com,alice,pw1\n"
+    
+    assert controller_client.post('/auth/users/import', data=body).status_code == 401
+    assert controller_client.post('/auth/users/import', data=body, headers=bearer('user')).status_code == 403
+    run.assert_not_called()
@@ -12,6 +12,7 @@ from flask import request
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from prometheus_flask_exporter import PrometheusMetrics
+import library_common.rate_limit_storage  # noqa: F401  (đăng ký scheme mmap:// cho limits)
 
 def create_app():
     """Hàm Factory để tạo và cấu hình ứng dụng Flask."""
@@ -28,14 +29,16 @@ def create_app():
     # - key_func: Định danh user dựa trên IP (get_remote_address)
     # - default_limits: Giới hạn mặc định cho toàn bộ API (nếu không set riêng)
     def should_exempt():
-        return request.path == "/metrics"
+        return request.path in ("/metrics", "/health")
     
     # 1. Rate Limiter (Gateway chặn tổng thể: 1000 req/giờ mỗi IP)
     limiter = Limiter(
         key_func=get_remote_address,
         app=app,
         default_limits=["2000 per day", "500 per hour"],
-        storage_uri="memory://",
+        # Bộ đếm dùng chung giữa các worker gunicorn (mmap://) thay vì riêng từng worker
+        storage_uri=app.config['RATELIMIT_STORAGE_URI'],
+        strategy=app.config['RATELIMIT_STRATEGY'],
     )
     limiter.request_filter(should_exempt)
     
@@ -58,5 +61,10 @@ def create_app():
     app.register_blueprint(book_bp)
     app.register_blueprint(book_internal_bp)
 
+    # Endpoint cho health probe của Gateway (cân bằng tải giữa các replica)
+    @app.route("/health")
+    def health():
+        return "Book Service OK"
+
     print("Book Service Application Created Successfully!")
     return app
\ No newline at end of file
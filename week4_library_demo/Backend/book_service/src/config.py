@@ -48,4 +48,11 @@ class Config:
     SQLALCHEMY_MAX_OVERFLOW = 10       # Số kết nối tạo thêm khi quá tải
     SQLALCHEMY_POOL_RECYCLE = 3600     # Tự động tái tạo kết nối sau 1 giờ (3600s)
     
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # ==========================================================
+    # RATE LIMIT STORAGE (dùng chung giữa các worker gunicorn)
+    # ==========================================================
+    # "memory://" = bộ đếm riêng từng worker -> giới hạn thực tế lỏng gấp N lần
+    RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI", "mmap:///tmp/book_service_ratelimit.mmap")
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "sliding-window-counter")
@@ -0,0 +1,3 @@
+# library_common/library_common/__init__.py
+
+"""Code dùng chung giữa các service (api_gateway, auth_service, book_service)."""
@@ -0,0 +1,210 @@
+# library_common/library_common/rate_limit_storage.py
+
+"""
+[LESSON 10] Storage cho Flask-Limiter dùng chung giữa các worker gunicorn trên cùng 1 máy.
+
+`memory://` giữ bộ đếm riêng trong từng worker -> với N worker, giới hạn thực tế lỏng gấp N lần
+và reset mỗi lần restart. `mmap://` đặt bộ đếm vào một bảng băm cố định trong file được
+memory-map (MAP_SHARED): mọi worker đọc/ghi cùng một bảng, khoá bằng flock,
+mỗi thao tác O(1) và không có round-trip mạng (không cần Redis).
+
+URI: mmap:///duong/dan/file?slots=65536
+Hỗ trợ strategy 'fixed-window' và 'sliding-window-counter'.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from math import floor
+from urllib.parse import parse_qs, urlparse
+
+from limits.storage import SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+
+# Mỗi slot: hash của key (u64, 0 = trống), bộ đếm (i64), thời điểm hết hạn (f64, epoch)
+_SLOT = struct.Struct('<Qqd')
+_HEADER = struct.Struct('<8sI')
+_MAGIC = b'RLMMAP01'
+_MAX_PROBES = 32
+
+
+class MmapStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """Bộ đếm rate limit trong file mmap, dùng chung giữa các process."""
+
+    STORAGE_SCHEME = ["mmap"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        parsed = urlparse(uri or "mmap:///tmp/ratelimit.mmap")
+        query = parse_qs(parsed.query)
+        self.path = parsed.path or "/tmp/ratelimit.mmap"
+        self.slots = int(options.get('slots') or query.get('slots', [65536])[0])
+        self._size = _HEADER.size + self.slots * _SLOT.size
+        # flock không chặn giữa các thread cùng process -> thêm lock thường
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._open()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != self._size:
+                # File mới (hoặc đổi số slot): khởi tạo lại bảng rỗng
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, self.slots), 0)
+            self._map = mmap.mmap(self._fd, self._size, mmap.MAP_SHARED)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._pid = os.getpid()
+
+    def _lock(self):
+        # Worker được fork sau khi tạo storage dùng chung file description với process cha
+        # -> flock không còn loại trừ lẫn nhau, phải mở lại file trong process con.
+        if self._pid != os.getpid():
+            self._open()
+        return _FileLock(self._thread_lock, self._fd)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+    def _offset(self, index):
+        return _HEADER.size + index * _SLOT.size
+
+    def _find(self, key, now, create):
+        """
+        Dò tuyến tính tối đa _MAX_PROBES slot (O(1)).
+        Trả về (offset, count, expiry) của key còn hạn, hoặc slot để ghi mới nếu create=True.
+        """
+        key_hash = self._hash(key)
+        start = key_hash % self.slots
+        free = None
+        oldest = None
+        for probe in range(_MAX_PROBES):
+            offset = self._offset((start + probe) % self.slots)
+            slot_hash, count, expiry = _SLOT.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                if expiry > now:
+                    return offset, count, expiry
+                return offset, 0, 0.0
+            if slot_hash == 0:
+                # Slot chưa từng dùng -> phía sau không còn key này
+                if free is None:
+                    free = offset
+                break
+            if free is None and expiry <= now:
+                free = offset
+            if oldest is None or expiry < oldest[1]:
+                oldest = (offset, expiry)
+        if not create:
+            return None, 0, 0.0
+        # Vùng dò đầy toàn key còn hạn: ghi đè key sắp hết hạn nhất
+        return (free if free is not None else oldest[0]), 0, 0.0
+
+    def _write(self, offset, key, count, expiry):
+        _SLOT.pack_into(self._map, offset, self._hash(key), count, expiry)
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        with self._lock():
+            offset, count, key_expiry = self._find(key, now, create=True)
+            if count == 0:
+                key_expiry = now + expiry
+            count += amount
+            self._write(offset, key, count, key_expiry)
+            return count
+
+    def get(self, key):
+        with self._lock():
+            return self._find(key, time.time(), create=False)[1]
+
+    def get_expiry(self, key):
+        now = time.time()
+        with self._lock():
+            _, count, expiry = self._find(key, now, create=False)
+            return expiry if count else now
+
+    def clear(self, key):
+        with self._lock():
+            offset, count, _ = self._find(key, time.time(), create=False)
+            if offset is not None:
+                # Giữ hash (không xoá về 0) để không cắt đứt chuỗi dò của key khác
+                self._write(offset, key, 0, 0.0)
+
+    def reset(self):
+        with self._lock():
+            used = sum(
+                1 for i in range(self.slots)
+                if _SLOT.unpack_from(self._map, self._offset(i))[0]
+            )
+            self._map[_HEADER.size:] = bytes(self._size - _HEADER.size)
+            return used
+
+    def check(self):
+        try:
+            with self._lock():
+                return _HEADER.unpack_from(self._map, 0)[0] == _MAGIC
+        except OSError:
+            return False
+
+    def _sliding_window_info(self, key, expiry, now):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._find(previous_key, now, create=False)[1]
+        current_count = self._find(current_key, now, create=False)[1]
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        with self._lock():
+            # Kiểm tra + tăng trong cùng 1 lần giữ khoá -> không có race giữa các worker
+            previous_count, previous_ttl, current_count, _ = self._sliding_window_info(key, expiry, now)
+            if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+                return False
+            _, current_key = self.sliding_window_keys(key, expiry, now)
+            offset, count, key_expiry = self._find(current_key, now, create=True)
+            if count == 0:
+                key_expiry = now + 2 * expiry
+            self._write(offset, current_key, count + amount, key_expiry)
+            return True
+
+    def get_sliding_window(self, key, expiry):
+        with self._lock():
+            return self._sliding_window_info(key, expiry, time.time())
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(previous_key)
+        self.clear(current_key)
+
+
+class _FileLock:
+    def __init__(self, thread_lock, fd):
+        self._thread_lock = thread_lock
+        self._fd = fd
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()